@@ -1,18 +1,25 @@
 # pip install -qU langchain "langchain[anthropic]"
 from langchain.agents import create_agent
-from langchain_openai import ChatOpenAI
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Load environment variables
+# Agregar el directorio src al path para imports absolutos
+src_path = Path(__file__).parent.parent
+if str(src_path) not in sys.path:
+    sys.path.insert(0, str(src_path))
+
+# Load environment variables (before the agents configuration is imported)
 load_dotenv()
 
+from agents.support.utils.backends import create_chat_model
+
 def get_weather(city: str) -> str:
     """Get weather for a given city."""
     return f"It's always sunny in {city}!"
 
 # Initialize the model
-model = ChatOpenAI(model="gpt-4o-mini")
+model = create_chat_model("openai:gpt-4o-mini")
 
 agent = create_agent(
     model=model,
@@ -0,0 +1,197 @@
+"""
+Offline stand-ins for the remote models used by the agents.
+
+With ``AGENT_OFFLINE=1`` the agents run without network access or API keys:
+
+- ``OfflineChatModel``: deterministic chat model with tool calling. It asks
+  for the first bound tool when it receives a short user question and
+  answers with an excerpt of the context otherwise.
+- ``OfflineEmbeddings``: hashed bag-of-words embeddings. They are lexical,
+  not semantic, but similar texts do get similar vectors, which is enough to
+  benchmark and evaluate retrieval.
+- ``build_offline_vectorstore()``: FAISS index of the bundled paper built with
+  ``OfflineEmbeddings``, in memory.
+
+``AGENT_OFFLINE_LATENCY_MS`` adds a fixed delay to every model call to
+emulate a network round trip in benchmarks.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import time
+import uuid
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+OFFLINE = os.getenv("AGENT_OFFLINE", "0").lower() in ("1", "true", "yes")
+OFFLINE_LATENCY_MS = float(os.getenv("AGENT_OFFLINE_LATENCY_MS", "0"))
+OFFLINE_EMBEDDING_SIZE = 384
+OFFLINE_PDF_PATH = os.path.join(os.path.dirname(__file__), "../../pdfs/Paper.pdf")
+
+# Los mensajes más largos que esto se tratan como contexto recuperado, no como pregunta
+QUESTION_MAX_CHARS = 300
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _approx_tokens(text: str) -> int:
+    """Aproximación barata de tokens (~4 caracteres por token)."""
+    return max(1, len(text) // 4)
+
+
+# ====================================================================================
+# Chat Model
+# ====================================================================================
+
+class OfflineChatModel(BaseChatModel):
+    """Modelo de chat determinista con soporte para tool calling."""
+
+    latency_ms: float = OFFLINE_LATENCY_MS
+    tool_schemas: List[dict] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "offline"
+
+    def bind_tools(self, tools, **kwargs):
+        """Devuelve una copia del modelo que conoce las tools."""
+        schemas = [convert_to_openai_tool(t)["function"] for t in tools]
+        return self.model_copy(update={"tool_schemas": schemas})
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        last = messages[-1]
+        text = last.content if isinstance(last.content, str) else str(last.content)
+        prompt_tokens = sum(_approx_tokens(str(m.content)) for m in messages)
+
+        already_used_tools = any(isinstance(m, ToolMessage) for m in messages)
+        is_question = isinstance(last, HumanMessage) and len(text) <= QUESTION_MAX_CHARS
+        if self.tool_schemas and is_question and not already_used_tools:
+            schema = self.tool_schemas[0]
+            params = schema.get("parameters", {})
+            required = params.get("required") or list(params.get("properties", {}))
+            args = {required[0]: text} if required else {}
+            message = AIMessage(
+                content="",
+                tool_calls=[{"name": schema["name"], "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}],
+            )
+        else:
+            excerpt = " ".join(text.split())[:280]
+            message = AIMessage(content=f"Respuesta (offline): {excerpt}")
+
+        completion_tokens = _approx_tokens(str(message.content)) + 8 * len(message.tool_calls)
+        message.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        return message
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+
+# ====================================================================================
+# Embeddings
+# ====================================================================================
+
+class OfflineEmbeddings(Embeddings):
+    """
+    Embeddings por feature hashing de palabras y bigramas.
+
+    Args:
+        size: Dimensión de los vectores
+        latency_ms: Retardo fijo por llamada (no por texto), como una API remota
+    """
+
+    def __init__(self, size: int = OFFLINE_EMBEDDING_SIZE, latency_ms: float = OFFLINE_LATENCY_MS):
+        self.size = size
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def _bucket(self, feature: str) -> int:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        tokens = _TOKEN_RE.findall(text.lower())
+        for token in tokens:
+            vector[self._bucket(token)] += 1.0
+        for left, right in zip(tokens, tokens[1:]):
+            vector[self._bucket(f"{left} {right}")] += 0.5
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# ====================================================================================
+# Vector Store
+# ====================================================================================
+
+_offline_vectorstore = None
+
+
+def build_offline_vectorstore(pdf_path: Optional[str] = None, embeddings: Optional[Embeddings] = None):
+    """
+    Construye (una vez) el índice FAISS del paper con embeddings offline.
+
+    Args:
+        pdf_path: PDF a indexar (opcional, por defecto pdfs/Paper.pdf)
+        embeddings: Embeddings a usar (opcional, por defecto OfflineEmbeddings)
+
+    Returns:
+        Vectorstore FAISS en memoria
+    """
+    global _offline_vectorstore
+    if _offline_vectorstore is not None and pdf_path is None and embeddings is None:
+        return _offline_vectorstore
+
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_community.vectorstores import FAISS
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    docs = PyPDFLoader(os.path.normpath(pdf_path or OFFLINE_PDF_PATH)).load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    chunks = splitter.split_documents(docs)
+
+    if embeddings is not None:
+        return FAISS.from_documents(chunks, embeddings)
+
+    # La latencia simulada solo aplica a las consultas, no a la construcción
+    default_embeddings = OfflineEmbeddings(latency_ms=0)
+    vectorstore = FAISS.from_documents(chunks, default_embeddings)
+    default_embeddings.latency_ms = OFFLINE_LATENCY_MS
+
+    if pdf_path is None:
+        _offline_vectorstore = vectorstore
+    return vectorstore
@@ -1,18 +1,46 @@
 # Libraries
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
-from langgraph.graph import MessagesState
-from langchain_core.messages import AIMessage, ToolMessage
-from langchain.chat_models import init_chat_model
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+from typing import Annotated
+from langchain_core.messages import AIMessage, AnyMessage, ToolMessage
 from langchain_core.tools import tool
+from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
 
-# Cargar variables de entorno
+# Agregar el directorio src al path para imports absolutos
+src_path = Path(__file__).parent.parent
+if str(src_path) not in sys.path:
+    sys.path.insert(0, str(src_path))
+
+# Cargar variables de entorno (antes de importar la configuración de agents)
 load_dotenv()
 
+from agents.offline import OFFLINE, build_offline_vectorstore
+from agents.support.utils.backends import LLM_BACKEND, create_chat_model
+from agents.support.utils.messages import messages_reducer
+from agents.support.utils.prompt_cache import (
+    PROMPT_CACHE_KEY,
+    build_prompt,
+    precompute_tool_schemas,
+    prompt_cache_stats,
+    static_system_message,
+)
+from agents.support.utils.memory import track_memory
+from agents.support.utils.profiling import instrument_agent
+from agents.support.utils.singleflight import (
+    coalesce_llm,
+    coalesce_retrieval,
+    llm_flight,
+    messages_key,
+    request_key,
+    retrieval_flight,
+)
+from retrieval.embeddings import create_embeddings
+from retrieval.stores import load_faiss
+
 # ====================================================================================
 # Setup Vector Store y Tool
 # ====================================================================================
@@ -20,6 +48,9 @@ load_dotenv()
 # Cargar vector store FAISS
 def load_vectorstore():
     """Carga la base de datos vectorial desde cache"""
+    if OFFLINE:
+        return build_offline_vectorstore()
+
     cache_path = os.path.join(os.path.dirname(__file__), "../../faiss_cache/transformer_paper")
     
     # Verificar si existe el directorio y el archivo index.faiss
@@ -30,11 +61,8 @@ def load_vectorstore():
             "Por favor, ejecuta primero el notebook 05-rag.ipynb para crear la base de datos."
         )
     
-    vectorstore = FAISS.load_local(
-        cache_path, 
-        OpenAIEmbeddings(), 
-        allow_dangerous_deserialization=True
-    )
+    # Rechaza el índice si se construyó con otro modelo de embeddings
+    vectorstore = load_faiss(cache_path, create_embeddings())
     
     return vectorstore
 
@@ -70,28 +98,47 @@ def search_transformer_paper(query: str) -> str:
         Contexto relevante del paper
     """
     retriever = get_retriever()  # Lazy loading
-    docs = retriever.invoke(query)
+    if coalesce_retrieval():
+        # Consultas idénticas en vuelo comparten una sola búsqueda
+        docs = retrieval_flight.do(request_key("rag", query), lambda: retriever.invoke(query))
+    else:
+        docs = retriever.invoke(query)
     context = "\n\n".join([doc.page_content for doc in docs])
     return context
 
 # Lista de tools disponibles
 tools = [search_transformer_paper]
 
+# Esquemas serializados una sola vez (prefijo estable del prompt)
+tool_schemas = precompute_tool_schemas(tools)
+
 # ====================================================================================
 # Setup LLM con Tools
 # ====================================================================================
 
 # LLM principal con las tools bindeadas
-llm = init_chat_model("openai:gpt-4o-mini", temperature=0)
-llm_with_tools = llm.bind_tools(tools)
+llm = create_chat_model("openai:gpt-4o-mini", temperature=0)
+bind_kwargs = {"prompt_cache_key": PROMPT_CACHE_KEY} if LLM_BACKEND == "openai" else {}
+llm_with_tools = llm.bind_tools(tool_schemas, **bind_kwargs)
 
 # ====================================================================================
 # State Definition
 # ====================================================================================
 
-class State(MessagesState):
-    """Estado del agente RAG"""
-    pass
+class State(TypedDict):
+    """Estado del agente RAG (historial compacto con COMPACT_MESSAGES=1, ver agents.support.utils.messages)"""
+    messages: Annotated[list[AnyMessage], messages_reducer()]
+
+# ====================================================================================
+# System Message
+# ====================================================================================
+
+# Se construye una vez: el prefijo del prompt es idéntico en cada llamada
+system_message = static_system_message(
+    "Eres un asistente experto en el paper 'Attention Is All You Need'. "
+    "Usa la herramienta search_transformer_paper para buscar información en el paper. "
+    "Siempre basa tus respuestas en la información encontrada en el paper."
+)
 
 # ====================================================================================
 # Nodes
@@ -103,18 +150,19 @@ def conversation(state: State):
     history = state["messages"]
     last_message = history[-1]
     
-    # System message
-    system_message = (
-        "Eres un asistente experto en el paper 'Attention Is All You Need'. "
-        "Usa la herramienta search_transformer_paper para buscar información en el paper. "
-        "Siempre basa tus respuestas en la información encontrada en el paper."
-    )
-    
-    # Invocar LLM con tools
-    ai_message = llm_with_tools.invoke([
-        ("system", system_message), 
-        ("user", last_message.content)
-    ])
+    # Invocar LLM con tools (prefijo estático primero)
+    prompt = build_prompt(system_message, last_message.content)
+
+    def call():
+        ai_message = llm_with_tools.invoke(prompt)
+        prompt_cache_stats.record("rag", ai_message)
+        return ai_message
+
+    if coalesce_llm():
+        # Prompts idénticos en vuelo comparten una llamada; cada conversación recibe su copia
+        ai_message = llm_flight.do(messages_key(prompt), call, share=lambda m: m.model_copy(deep=True))
+    else:
+        ai_message = call()
     
     new_state["messages"] = [ai_message]
     return new_state
@@ -154,6 +202,8 @@ builder.add_conditional_edges('node_1', should_continue, {'tools': 'tools', END:
 builder.add_edge('tools', 'node_1')
 
 # Compilar agente
-agent = builder.compile()
+# Con AGENT_PROFILING=1 se perfila una fracción de las llamadas
+# Con AGENT_MEMORY_DIAGNOSTICS=1 se reporta el crecimiento de memoria por nodo y tool
+agent = track_memory(instrument_agent(builder.compile(), "rag"), "rag")
 
 
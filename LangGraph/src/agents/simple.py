@@ -4,8 +4,15 @@
 
 # Basic libraries
 import random
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+# Agregar el directorio src al path para imports absolutos
+src_path = Path(__file__).parent.parent
+if str(src_path) not in sys.path:
+    sys.path.insert(0, str(src_path))
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -13,10 +20,10 @@ load_dotenv()
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph import MessagesState
 from langchain_core.messages import AIMessage
-from langchain.chat_models import init_chat_model
+from agents.support.utils.backends import create_chat_model
 
 # OpenAI models
-gtp_llm = init_chat_model(model="gpt-4o-mini", temperature=1)
+gtp_llm = create_chat_model("gpt-4o-mini", temperature=1)
 
 # ====================================================================================
 # Class 
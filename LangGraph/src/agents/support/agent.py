@@ -15,14 +15,16 @@ if str(src_path) not in sys.path:
 from langgraph.graph import StateGraph, START, END
 
 # Import absoluto desde agents.support.utils
-from agents.support.utils import State, conversation_node, create_tool_node, should_continue
+from agents.support.utils import State, conversation_node, create_tool_node, finalize_node, should_continue
+from agents.support.utils.memory import track_memory
+from agents.support.utils.profiling import instrument_agent
 
 
 # ====================================================================================
 # Graph Construction
 # ====================================================================================
 
-def create_graph():
+def create_graph(checkpointer=None):
     """
     Crea y compila el grafo del agente de soporte.
     
@@ -30,8 +32,13 @@ def create_graph():
     1. START -> conversation
     2. conversation -> should_continue()
        - Si hay tool_calls -> tools
+       - Si hay tool_calls pero se agotó el presupuesto del turno -> finalize
        - Si no -> END
     3. tools -> conversation (loop back)
+    4. finalize -> END
+    
+    Args:
+        checkpointer: Checkpointer de LangGraph (opcional, para sesiones con thread_id)
     
     Returns:
         Grafo compilado listo para ser ejecutado
@@ -45,6 +52,7 @@ def create_graph():
     # Agregar nodos
     builder.add_node("conversation", conversation_node)
     builder.add_node("tools", tool_node)
+    builder.add_node("finalize", finalize_node)
     
     # Definir flujo
     builder.add_edge(START, "conversation")
@@ -53,13 +61,15 @@ def create_graph():
         should_continue,
         {
             "tools": "tools",
+            "finalize": "finalize",
             END: END
         }
     )
     builder.add_edge("tools", "conversation")
+    builder.add_edge("finalize", END)
     
     # Compilar y retornar
-    return builder.compile()
+    return builder.compile(checkpointer=checkpointer)
 
 
 # ====================================================================================
@@ -67,5 +77,7 @@ def create_graph():
 # ====================================================================================
 
 # Crear el agente (grafo compilado)
-agent = create_graph()
+# Con AGENT_PROFILING=1 se perfila una fracción de las llamadas
+# Con AGENT_MEMORY_DIAGNOSTICS=1 se reporta el crecimiento de memoria por nodo y tool
+agent = track_memory(instrument_agent(create_graph(), "support"), "support")
 
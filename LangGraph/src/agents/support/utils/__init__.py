@@ -3,27 +3,41 @@ Utilities for the Support Agent.
 
 This package contains all utility modules for the agent:
 - state.py: State definition
+- messages.py: Compact message history and its reducer
 - tools.py: Tools/functions
 - nodes.py: Node definitions
+- warmup.py: Startup warm-up and query log
 """
 
+from .messages import MessageLog, add_messages_indexed
 from .state import State
-from .tools import search_transformer_paper, get_tools, load_vectorstore, get_retriever
-from .nodes import conversation_node, create_tool_node, should_continue
+from .tools import search_transformer_paper, get_tools, load_vectorstore, get_retriever, get_attribute_index, get_quantized_index, get_mutable_index
+from .nodes import conversation_node, create_tool_node, finalize_node, should_continue
+from .warmup import WarmupStatus, run_warmup
 
 __all__ = [
     # State
     "State",
+    "MessageLog",
+    "add_messages_indexed",
     
     # Tools
     "search_transformer_paper",
     "get_tools",
     "load_vectorstore",
     "get_retriever",
+    "get_attribute_index",
+    "get_quantized_index",
+    "get_mutable_index",
     
     # Nodes
     "conversation_node",
     "create_tool_node",
+    "finalize_node",
     "should_continue",
+
+    # Warm-up
+    "WarmupStatus",
+    "run_warmup",
 ]
 
@@ -0,0 +1,165 @@
+"""
+Chat model backends for the agents.
+
+``AGENT_LLM_BACKEND`` selects where the chat model runs:
+
+- ``openai`` (default): remote model through ``init_chat_model``.
+- ``llamacpp``: quantized GGUF model on CPU through llama.cpp
+  (``pip install llama-cpp-python``), with tool calling, a RAM KV cache
+  for repeated prompt prefixes and a configurable thread count.
+- ``offline``: deterministic stand-in from ``agents.offline`` (also
+  selected by ``AGENT_OFFLINE=1``).
+
+Every backend exposes the same chat-model interface (``invoke``,
+``bind_tools``, ``batch``...), so the nodes do not change.
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+
+from langchain.chat_models import init_chat_model
+from langchain_community.chat_models import ChatLlamaCpp
+from pydantic import PrivateAttr
+
+from agents.offline import OFFLINE, OfflineChatModel
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+LLM_BACKEND = os.getenv("AGENT_LLM_BACKEND", "offline" if OFFLINE else "openai")
+BACKENDS = ("openai", "llamacpp", "offline")
+
+LLAMACPP_MODEL_PATH = os.getenv("LLAMACPP_MODEL_PATH", "")
+LLAMACPP_THREADS = int(os.getenv("LLAMACPP_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+LLAMACPP_N_CTX = int(os.getenv("LLAMACPP_N_CTX", "8192"))
+LLAMACPP_N_BATCH = int(os.getenv("LLAMACPP_N_BATCH", "512"))
+LLAMACPP_MAX_TOKENS = int(os.getenv("LLAMACPP_MAX_TOKENS", "512"))
+LLAMACPP_CHAT_FORMAT = os.getenv("LLAMACPP_CHAT_FORMAT", "chatml-function-calling")
+LLAMACPP_CACHE_MB = int(os.getenv("LLAMACPP_CACHE_MB", "1024"))
+
+
+# ====================================================================================
+# llama.cpp
+# ====================================================================================
+
+class LocalChatModel(ChatLlamaCpp):
+    """
+    ChatLlamaCpp seguro entre hilos.
+
+    Una instancia de llama.cpp mantiene un único estado KV, así que las
+    generaciones concurrentes se serializan con un lock.
+    """
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _generate(self, *args, **kwargs):
+        with self._lock:
+            return super()._generate(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        with self._lock:
+            yield from super()._stream(*args, **kwargs)
+
+
+# Un solo modelo cargado por (ruta, parámetros de carga): main, simple, rag y
+# support lo comparten, con su cache KV y su lock
+_llamacpp_models: Dict[tuple, LocalChatModel] = {}
+_llamacpp_lock = threading.Lock()
+
+
+def _create_llamacpp_model(temperature: Optional[float]) -> LocalChatModel:
+    """
+    Obtiene el modelo GGUF compartido con la temperatura indicada.
+
+    El modelo se carga una vez; cada temperatura es una copia superficial
+    que comparte el cliente de llama.cpp, la cache KV y el lock.
+    """
+    key = (
+        LLAMACPP_MODEL_PATH, LLAMACPP_N_CTX, LLAMACPP_THREADS, LLAMACPP_N_BATCH,
+        LLAMACPP_CHAT_FORMAT, LLAMACPP_CACHE_MB,
+    )
+    with _llamacpp_lock:
+        model = _llamacpp_models.get(key)
+        if model is None:
+            model = _llamacpp_models[key] = _load_llamacpp_model()
+    temperature = 0.0 if temperature is None else temperature
+    if model.temperature == temperature:
+        return model
+    return model.model_copy(update={"temperature": temperature})
+
+
+def _load_llamacpp_model() -> LocalChatModel:
+    if not LLAMACPP_MODEL_PATH or not os.path.exists(LLAMACPP_MODEL_PATH):
+        raise FileNotFoundError(
+            f"❌ Modelo GGUF no encontrado en '{LLAMACPP_MODEL_PATH}'\n"
+            "Define LLAMACPP_MODEL_PATH con la ruta a un modelo cuantizado (.gguf)."
+        )
+
+    model = LocalChatModel(
+        model_path=LLAMACPP_MODEL_PATH,
+        n_ctx=LLAMACPP_N_CTX,
+        n_threads=LLAMACPP_THREADS,
+        n_batch=LLAMACPP_N_BATCH,
+        max_tokens=LLAMACPP_MAX_TOKENS,
+        temperature=0.0,
+        model_kwargs={"chat_format": LLAMACPP_CHAT_FORMAT},
+        verbose=False,
+    )
+
+    # Cache KV en RAM: los prompts que comparten prefijo (system prompt +
+    # tools) reutilizan el estado en lugar de volver a evaluarlo
+    if LLAMACPP_CACHE_MB > 0:
+        from llama_cpp import LlamaRAMCache
+        model.client.set_cache(LlamaRAMCache(capacity_bytes=LLAMACPP_CACHE_MB * 1024 * 1024))
+    return model
+
+
+# ====================================================================================
+# Factory
+# ====================================================================================
+
+def create_chat_model(model: str, temperature: Optional[float] = None, backend: str = None, **provider_kwargs):
+    """
+    Crea el chat model según el backend configurado.
+
+    Args:
+        model: Modelo remoto (p. ej. "openai:gpt-4o-mini"); se ignora en los
+            backends locales
+        temperature: Temperatura (None = valor por defecto del proveedor)
+        backend: "openai", "llamacpp" u "offline" (por defecto AGENT_LLM_BACKEND)
+        **provider_kwargs: Parámetros extra para init_chat_model (solo openai)
+
+    Returns:
+        Chat model de LangChain
+    """
+    backend = backend or LLM_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend!r} (usa uno de {BACKENDS})")
+
+    if backend == "offline":
+        return OfflineChatModel()
+    if backend == "llamacpp":
+        return _create_llamacpp_model(temperature)
+
+    if temperature is not None:
+        provider_kwargs["temperature"] = temperature
+    return init_chat_model(model, **provider_kwargs)
+
+
+def warm_prompt_cache(llm_with_tools, system_prompt: str, backend: str = None):
+    """
+    Precalienta la cache KV con el prefijo estático (tools + system prompt).
+
+    Solo tiene efecto con el backend llamacpp; en los demás no hace nada.
+
+    Args:
+        llm_with_tools: LLM con las tools ya bindeadas
+        system_prompt: System prompt fijo del agente
+        backend: Backend (por defecto AGENT_LLM_BACKEND)
+    """
+    if (backend or LLM_BACKEND) != "llamacpp":
+        return
+    llm_with_tools.invoke([("system", system_prompt), ("user", "")], max_tokens=1)
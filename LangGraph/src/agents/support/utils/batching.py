@@ -0,0 +1,182 @@
+"""
+Micro-batching utilities for the Support Agent.
+
+A ``MicroBatcher`` collects the items submitted by concurrent callers during
+a short window and hands them to a single batch function. It is thread-safe,
+so it works both for sync graph runs (one thread per call) and for async
+runs (``acall``).
+
+``BatchedEmbeddings`` uses it to merge concurrent query embeddings into one
+``embed_documents`` call.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+DEFAULT_WINDOW_MS = 10.0
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_INFLIGHT_BATCHES = 4
+
+
+# ====================================================================================
+# Micro Batcher
+# ====================================================================================
+
+class MicroBatcher:
+    """
+    Agrupa elementos enviados de forma concurrente y los procesa en lote.
+
+    El primer elemento abre una ventana de ``window_ms``; todo lo que llega
+    antes de que cierre (o hasta ``max_batch`` elementos) va en el mismo lote.
+    Los elementos cuyo Future fue cancelado antes del despacho se descartan.
+
+    Args:
+        batch_fn: Función que recibe una lista de elementos y devuelve una
+            lista de resultados del mismo tamaño y en el mismo orden. Si un
+            resultado es una excepción, se propaga solo a ese elemento
+        window_ms: Duración de la ventana de agrupación
+        max_batch: Tamaño máximo de lote
+        max_inflight: Lotes que pueden ejecutarse a la vez
+        name: Nombre del hilo despachador
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        window_ms: float = DEFAULT_WINDOW_MS,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_inflight: int = DEFAULT_MAX_INFLIGHT_BATCHES,
+        name: str = "micro-batcher",
+    ):
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._pending: List[tuple] = []
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix=name)
+        self._dispatcher: Optional[threading.Thread] = None
+        self._closed = False
+
+    def submit(self, item: Any) -> Future:
+        """Encola un elemento y devuelve el Future con su resultado."""
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} está cerrado")
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._dispatcher.start()
+            self._pending.append((item, future))
+            self._cond.notify()
+        return future
+
+    def call(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Versión bloqueante de submit()."""
+        return self.submit(item).result(timeout=timeout)
+
+    async def acall(self, item: Any) -> Any:
+        """Versión async de submit(); cancelar la corutina cancela el elemento."""
+        return await asyncio.wrap_future(self.submit(item))
+
+    def close(self):
+        """Despacha lo pendiente y detiene el hilo despachador."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def _take_batch(self) -> List[tuple]:
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[: self.max_batch]
+            del self._pending[: self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self._closed:
+                    return
+                continue
+            # Un Future cancelado no llega al backend
+            live = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if live:
+                self._executor.submit(self._dispatch, live)
+
+    def _dispatch(self, batch: List[tuple]):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"{self.name}: batch_fn devolvió {len(results)} resultados para {len(batch)} elementos"
+                )
+        except BaseException as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+# ====================================================================================
+# Batched Embeddings
+# ====================================================================================
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Envuelve un modelo de embeddings para agrupar las consultas concurrentes.
+
+    ``embed_query`` pasa por el MicroBatcher; ``embed_documents`` ya es una
+    llamada en lote y va directo al modelo.
+
+    Args:
+        embeddings: Modelo de embeddings a envolver
+        window_ms: Ventana de agrupación
+        max_batch: Tamaño máximo de lote
+    """
+
+    def __init__(self, embeddings: Embeddings, window_ms: float = DEFAULT_WINDOW_MS, max_batch: int = DEFAULT_MAX_BATCH):
+        self.embeddings = embeddings
+        self.batcher = MicroBatcher(
+            embeddings.embed_documents,
+            window_ms=window_ms,
+            max_batch=max_batch,
+            name="embedding-batcher",
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.call(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.batcher.acall(text)
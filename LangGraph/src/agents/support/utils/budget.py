@@ -0,0 +1,93 @@
+"""
+Per-turn budget for the conversation <-> tools loop.
+
+``conversation_node`` only sees the last message, so the model can keep
+asking for searches. Each user turn therefore tracks, in the graph state,
+how many tool calls were requested, how many tokens were spent and when
+the turn started. The router stops the loop when any limit is reached and
+sends the turn to ``finalize``, which answers without tools.
+
+Every finished turn records its termination reason in ``termination_metrics``.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+MAX_TOOL_CALLS = int(os.getenv("AGENT_MAX_TOOL_CALLS", "3"))
+MAX_TOKENS = int(os.getenv("AGENT_MAX_TOKENS", "20000"))
+MAX_SECONDS = float(os.getenv("AGENT_MAX_SECONDS", "60"))
+
+# Motivos de terminación
+ANSWERED = "answered"
+MAX_TOOL_CALLS_REACHED = "max_tool_calls"
+MAX_TOKENS_REACHED = "max_tokens"
+MAX_SECONDS_REACHED = "max_seconds"
+
+
+# ====================================================================================
+# Budget Accounting
+# ====================================================================================
+
+def usage_tokens(message) -> int:
+    """Tokens totales de una respuesta del LLM (0 si no informa uso)."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens", 0) or 0
+
+
+def exceeded(state: dict, now: Optional[float] = None) -> Optional[str]:
+    """
+    Comprueba los límites del turno actual.
+
+    Args:
+        state: Estado con tool_calls, tokens y started_at
+        now: Instante actual (time.time() si no se indica)
+
+    Returns:
+        Motivo del límite alcanzado, o None si queda presupuesto
+    """
+    if state.get("tool_calls", 0) > MAX_TOOL_CALLS:
+        return MAX_TOOL_CALLS_REACHED
+    if state.get("tokens", 0) >= MAX_TOKENS:
+        return MAX_TOKENS_REACHED
+    started_at = state.get("started_at")
+    if started_at is not None and (now or time.time()) - started_at >= MAX_SECONDS:
+        return MAX_SECONDS_REACHED
+    return None
+
+
+# ====================================================================================
+# Termination Metrics
+# ====================================================================================
+
+class TerminationMetrics:
+    """Cuenta los turnos terminados por motivo, con sus tool calls y tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_reason: Dict[str, Dict[str, float]] = {}
+
+    def record(self, reason: str, state: dict):
+        """Registra el fin de un turno."""
+        elapsed = time.time() - state["started_at"] if state.get("started_at") else 0.0
+        with self._lock:
+            totals = self._by_reason.setdefault(reason, {"turns": 0, "tool_calls": 0, "tokens": 0, "seconds": 0.0})
+            totals["turns"] += 1
+            totals["tool_calls"] += state.get("tool_calls", 0)
+            totals["tokens"] += state.get("tokens", 0)
+            totals["seconds"] += elapsed
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Totales por motivo de terminación."""
+        with self._lock:
+            return {reason: dict(totals) for reason, totals in self._by_reason.items()}
+
+
+# Instancia compartida por el agente
+termination_metrics = TerminationMetrics()
@@ -0,0 +1,367 @@
+"""
+Memory accounting and leak diagnostics for long-running workers.
+
+``process_memory()`` reads the RSS, PSS and USS of the worker from
+``/proc/self/smaps_rollup``. USS counts only pages that no other process
+shares. ``GET /graphs`` reports these numbers.
+
+With ``AGENT_MEMORY_DIAGNOSTICS=1``, ``track_memory`` starts a monitor
+thread. The thread starts tracemalloc one interval later
+(``AGENT_MEMORY_INTERVAL``). That way imports and the index load are not
+traced: under tracemalloc they are many times slower, and they are not
+leaks. After that, the monitor takes a snapshot every interval and
+compares it with the previous one. Each report has:
+
+- ``tags``: memory and growth per graph node and tool. An allocation is
+  attributed to the innermost node or tool function in its traceback, so
+  the traceback must be deep enough (``AGENT_MEMORY_FRAMES``).
+- ``sites``: the source lines whose allocations grew the most.
+- ``objects``: the Python types whose live instance count grew the most.
+
+Reports are kept in memory and, if ``AGENT_MEMORY_DIR`` is set, appended
+to ``memory-<pid>.jsonl``. ``api.soak`` runs the graphs for hours and
+fails on unbounded growth.
+
+Usage:
+    AGENT_MEMORY_DIAGNOSTICS=1 AGENT_MEMORY_INTERVAL=300 AGENT_MEMORY_DIR=memory \\
+        uvicorn api.app:app --app-dir LangGraph/src
+"""
+
+import gc
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Callable, Dict, List, Optional
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+MEMORY_DIAGNOSTICS = os.getenv("AGENT_MEMORY_DIAGNOSTICS", "0").lower() in ("1", "true", "yes")
+DEFAULT_MEMORY_INTERVAL = float(os.getenv("AGENT_MEMORY_INTERVAL", "300"))
+DEFAULT_MEMORY_FRAMES = int(os.getenv("AGENT_MEMORY_FRAMES", "32"))
+DEFAULT_MEMORY_TOP = int(os.getenv("AGENT_MEMORY_TOP", "15"))
+DEFAULT_MEMORY_DIR = os.getenv("AGENT_MEMORY_DIR", "")
+MAX_REPORTS = 48
+
+UNTAGGED = "(untagged)"
+
+# Asignaciones del propio diagnóstico y de la maquinaria de imports
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+# ====================================================================================
+# Process Memory
+# ====================================================================================
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """
+    Memoria del proceso actual en MB.
+
+    Returns:
+        Diccionario con pid, rss_mb, pss_mb, uss_mb y max_rss_mb (None si el
+        sistema no lo expone; sin /proc solo hay max_rss_mb)
+    """
+    fields: Dict[str, int] = {}
+    try:
+        with open("/proc/self/smaps_rollup", encoding="ascii") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                parts = value.split()
+                if len(parts) == 2 and parts[1] == "kB":
+                    fields[key] = int(parts[0]) * 1024
+    except OSError:
+        pass
+
+    def mb(value: Optional[int]) -> Optional[float]:
+        return None if value is None else round(value / 1e6, 1)
+
+    uss = None
+    if "Private_Clean" in fields:
+        uss = fields["Private_Clean"] + fields.get("Private_Dirty", 0)
+    max_rss = None
+    try:
+        import resource
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    except ImportError:
+        pass
+    return {
+        "pid": os.getpid(),
+        "rss_mb": mb(fields.get("Rss")),
+        "pss_mb": mb(fields.get("Pss")),
+        "uss_mb": mb(uss),
+        "max_rss_mb": mb(max_rss),
+    }
+
+
+# ====================================================================================
+# Node and Tool Tags
+# ====================================================================================
+
+class _TagIndex:
+    """Rangos de líneas de las funciones de nodos y tools, por archivo."""
+
+    def __init__(self):
+        self._by_file: Dict[str, List[list]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, tag: str, func: Optional[Callable]):
+        func = inspect.unwrap(getattr(func, "__func__", func)) if func is not None else None
+        code = getattr(func, "__code__", None)
+        if code is None:
+            return
+        lines = [line for _, _, line in code.co_lines() if line is not None]
+        first, last = code.co_firstlineno, max(lines, default=code.co_firstlineno)
+        with self._lock:
+            ranges = self._by_file.setdefault(code.co_filename, [])
+            for entry in ranges:
+                if entry[0] == first and entry[1] == last:
+                    # La misma función en varios grafos
+                    if tag not in entry[2].split(","):
+                        entry[2] = f"{entry[2]},{tag}"
+                    return
+            ranges.append([first, last, tag])
+            # Los rangos más cortos primero: una función anidada gana a la que la contiene
+            ranges.sort(key=lambda entry: entry[1] - entry[0])
+
+    def tag_of(self, traceback: tracemalloc.Traceback) -> str:
+        # El traceback va del frame más antiguo al más reciente
+        for frame in reversed(traceback):
+            for first, last, tag in self._by_file.get(frame.filename, ()):
+                if first <= frame.lineno <= last:
+                    return tag
+        return UNTAGGED
+
+
+_tags = _TagIndex()
+
+
+def register_graph(agent, graph_name: str):
+    """
+    Registra los nodos (y las tools de los ToolNode) de un grafo compilado.
+
+    Las etiquetas son "grafo.nodo" y "grafo.nodo.tool".
+    """
+    builder = getattr(agent, "builder", None)
+    for node_name, spec in getattr(builder, "nodes", {}).items():
+        runnable = spec.runnable
+        tools = getattr(runnable, "tools_by_name", None)
+        if tools:
+            for tool_name, tool in tools.items():
+                _tags.register(f"{graph_name}.{node_name}.{tool_name}", tool.func or tool.coroutine)
+        else:
+            _tags.register(f"{graph_name}.{node_name}", getattr(runnable, "func", None) or getattr(runnable, "afunc", None))
+
+
+# ====================================================================================
+# Monitor
+# ====================================================================================
+
+def _short_path(filename: str) -> str:
+    # Relativo a la entrada de sys.path más larga que lo contiene
+    best = ""
+    for entry in sys.path:
+        if entry and filename.startswith(entry.rstrip(os.sep) + os.sep) and len(entry) > len(best):
+            best = entry
+    return os.path.relpath(filename, best) if best else filename
+
+
+class MemoryMonitor:
+    """
+    Toma snapshots de tracemalloc periódicamente y reporta el crecimiento.
+
+    Args:
+        interval: Segundos entre reportes (y antes de empezar a trazar)
+        frames: Profundidad de los tracebacks de tracemalloc
+        top: Entradas por sección del reporte
+        directory: Directorio para los reportes JSONL (vacío = solo en memoria)
+    """
+
+    def __init__(
+        self,
+        interval: float = DEFAULT_MEMORY_INTERVAL,
+        frames: int = DEFAULT_MEMORY_FRAMES,
+        top: int = DEFAULT_MEMORY_TOP,
+        directory: str = DEFAULT_MEMORY_DIR,
+    ):
+        self.interval = interval
+        self.frames = frames
+        self.top = top
+        self.directory = directory
+        self.reports: deque = deque(maxlen=MAX_REPORTS)
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._previous_tags: Dict[str, int] = {}
+        self._previous_objects: Counter = Counter()
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def start(self):
+        """Arranca el hilo de reportes (tracemalloc empieza un intervalo después)."""
+        self._started = time.time()
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name="memory-monitor", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """Detiene el hilo de reportes (tracemalloc sigue activo)."""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def _run(self):
+        if self._stop.wait(self.interval):
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.take()  # línea base
+        while not self._stop.wait(self.interval):
+            self.take()
+
+    def take(self) -> dict:
+        """
+        Toma un snapshot y lo compara con el anterior.
+
+        Returns:
+            Reporte con la memoria del proceso y el crecimiento por
+            etiqueta, línea de código y tipo de objeto
+
+        Raises:
+            RuntimeError: Si tracemalloc no está activo
+        """
+        with self._lock:
+            snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            traced, peak = tracemalloc.get_traced_memory()
+
+            tag_sizes: Counter = Counter()
+            tag_counts: Counter = Counter()
+            for stat in snapshot.statistics("traceback"):
+                tag = _tags.tag_of(stat.traceback)
+                tag_sizes[tag] += stat.size
+                tag_counts[tag] += stat.count
+            tags = [
+                {
+                    "tag": tag,
+                    "size_mb": round(size / 1e6, 3),
+                    "growth_kb": round((size - self._previous_tags.get(tag, 0)) / 1e3, 1),
+                    "count": tag_counts[tag],
+                }
+                for tag, size in tag_sizes.items()
+            ]
+            tags.sort(key=lambda row: row["growth_kb"], reverse=True)
+
+            sites = []
+            if self._previous is not None:
+                for diff in snapshot.compare_to(self._previous, "lineno")[: self.top]:
+                    if diff.size_diff <= 0:
+                        break
+                    frame = diff.traceback[0]
+                    sites.append({
+                        "site": f"{_short_path(frame.filename)}:{frame.lineno}",
+                        "growth_kb": round(diff.size_diff / 1e3, 1),
+                        "count_growth": diff.count_diff,
+                        "size_kb": round(diff.size / 1e3, 1),
+                    })
+
+            objects = Counter(type(obj).__qualname__ for obj in gc.get_objects())
+            object_growth = [
+                {"type": name, "count": objects[name], "growth": objects[name] - self._previous_objects.get(name, 0)}
+                for name in objects
+            ]
+            object_growth = sorted(
+                (row for row in object_growth if row["growth"] > 0), key=lambda row: row["growth"], reverse=True
+            )[: self.top]
+
+            report = {
+                "ts": round(time.time(), 3),
+                "uptime_s": round(time.time() - self._started, 1),
+                **process_memory(),
+                "traced_mb": round(traced / 1e6, 1),
+                "traced_peak_mb": round(peak / 1e6, 1),
+                "tags": tags[: self.top],
+                "sites": sites,
+                "objects": object_growth,
+            }
+            self._previous = snapshot
+            self._previous_tags = dict(tag_sizes)
+            self._previous_objects = objects
+            self.reports.append(report)
+            if self.directory:
+                self._write(report)
+            return report
+
+    def _write(self, report: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"memory-{os.getpid()}.jsonl")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
+
+    def latest(self) -> Optional[dict]:
+        """Último reporte (None si todavía no hay ninguno)."""
+        with self._lock:
+            return self.reports[-1] if self.reports else None
+
+
+_monitor: Optional[MemoryMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def get_memory_monitor() -> Optional[MemoryMonitor]:
+    """Monitor del proceso (None si el diagnóstico no está habilitado)."""
+    return _monitor
+
+
+def track_memory(agent, graph_name: str, enabled: Optional[bool] = None):
+    """
+    Registra los nodos y tools del grafo y arranca el monitor del proceso.
+
+    Si el diagnóstico no está habilitado, el agente se devuelve sin cambios.
+
+    Args:
+        agent: Grafo compilado
+        graph_name: Nombre del grafo para las etiquetas
+        enabled: Fuerza habilitar/deshabilitar (por defecto AGENT_MEMORY_DIAGNOSTICS)
+
+    Returns:
+        El mismo agente
+    """
+    global _monitor
+    if enabled is None:
+        enabled = MEMORY_DIAGNOSTICS
+    if not enabled:
+        return agent
+    register_graph(agent, graph_name)
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = MemoryMonitor()
+            _monitor.start()
+    return agent
+
+
+def memory_stats() -> dict:
+    """Memoria del proceso y, con el diagnóstico habilitado, un resumen del último reporte."""
+    stats = process_memory()
+    report = _monitor.latest() if _monitor is not None else None
+    if report is not None:
+        stats["diagnostics"] = {
+            "ts": report["ts"],
+            "traced_mb": report["traced_mb"],
+            "tags": report["tags"][:5],
+            "sites": report["sites"][:5],
+        }
+    return stats
@@ -0,0 +1,407 @@
+"""
+Compact message history for long sessions.
+
+``add_messages`` from LangGraph converts every message already in the
+state, copies the list and rebuilds its id index on every step. The cost of
+a step therefore grows with the length of the session, and the history
+keeps one full pydantic object per message.
+
+``MessageLog`` keeps the same history in a smaller form:
+
+- One ``MessageRecord`` (a namedtuple, no per-instance ``__dict__``) per
+  message, with the role interned and only the fields that differ from
+  their defaults.
+- Tool outputs of ``MESSAGE_REF_MIN_CHARS`` characters or more are stored
+  once in a content table. Records point to them by digest, so a repeated
+  retrieval result is kept only once.
+- A dict from message id to position. Merging a step costs O(1) per new
+  message instead of O(history).
+
+Merging never changes a log: it returns a new one, so the values a graph
+streams or checkpoints stay as they were. Appending shares the record list,
+the index and the content table with the previous log, which keeps reading
+only its own prefix. Replacing or removing a message, or appending to a log
+that is not the latest, copies them first.
+
+The graph states only use it with ``COMPACT_MESSAGES=1`` (see
+``messages_reducer``), because it changes the type of ``messages`` and of
+the checkpointed state. With a checkpointer, allow the type in its
+serializer with
+``JsonPlusSerializer(allowed_msgpack_modules=CHECKPOINT_MSGPACK_MODULES)``;
+checkpointers that do not take that option, or strict msgpack mode, reject
+it.
+
+Messages are rebuilt when they are read. A small cache keeps the latest
+ones, because the nodes mostly read ``messages[-1]``. ``add_messages_indexed``
+is a drop-in replacement for ``add_messages``. It supports the same id
+replacement and ``RemoveMessage`` semantics.
+
+Benchmark (1000 turns, reducer only and through the support graph):
+    python -m agents.support.utils.messages --turns 1000
+    COMPACT_MESSAGES=1 python -m agents.support.utils.messages --turns 1000 --graph
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from langchain_core.messages import (
+    AnyMessage,
+    BaseMessage,
+    BaseMessageChunk,
+    RemoveMessage,
+    convert_to_messages,
+    message_chunk_to_message,
+    messages_from_dict,
+)
+from langgraph.graph.message import REMOVE_ALL_MESSAGES, add_messages
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+# Guardar el historial de los grafos como MessageLog (opt-in, ver messages_reducer)
+COMPACT_MESSAGES = os.getenv("COMPACT_MESSAGES", "0") == "1"
+# Contenido de tools a partir del cual se guarda una sola vez, por referencia
+MESSAGE_REF_MIN_CHARS = 256
+# Mensajes reconstruidos que se mantienen en cache (los últimos leídos)
+MESSAGE_CACHE_SIZE = 16
+
+# Tipos a permitir en el serializer del checkpointer:
+# JsonPlusSerializer(allowed_msgpack_modules=CHECKPOINT_MSGPACK_MODULES)
+CHECKPOINT_MSGPACK_MODULES = [("agents.support.utils.messages", "MessageLog")]
+
+# Campos que viven en el propio registro (el resto va a ``extra``)
+_RECORD_FIELDS = {"type", "id", "content"}
+
+
+# ====================================================================================
+# Message Log
+# ====================================================================================
+
+class MessageRecord(NamedTuple):
+    """Registro compacto de un mensaje (rol internado, contenido o referencia)."""
+    role: str
+    id: str
+    content: Any
+    ref: Optional[str]
+    extra: Optional[dict]
+
+
+class MessageLog(Sequence):
+    """
+    Historial de mensajes compacto e inmutable con índice por id.
+
+    Se comporta como una secuencia de solo lectura de BaseMessage; ``merge``
+    (el reducer del estado) devuelve un MessageLog nuevo.
+
+    Args:
+        records: Registros (p. ej. al restaurar un checkpoint)
+        contents: Tabla de contenidos por referencia (digest -> contenido)
+    """
+
+    def __init__(self, records: Optional[list] = None, contents: Optional[dict] = None):
+        # Desde un checkpoint los namedtuples pueden volver como listas
+        self._records: List[MessageRecord] = [MessageRecord(*r) for r in records or ()]
+        self._contents: Dict[str, Any] = dict(contents or {})
+        self._index: Dict[str, int] = {r.id: i for i, r in enumerate(self._records)}
+        # Las estructuras anteriores pueden ser compartidas con otros logs: este solo ve
+        # las primeras _length posiciones
+        self._length = len(self._records)
+        self._owned = True
+        self._cache: "OrderedDict[int, BaseMessage]" = OrderedDict()
+
+    @classmethod
+    def from_messages(cls, messages) -> "MessageLog":
+        return cls().merge(messages)
+
+    @property
+    def records(self) -> List[MessageRecord]:
+        return self._records[:self._length]
+
+    @property
+    def contents(self) -> Dict[str, Any]:
+        referenced = {r.ref for r in self.records if r.ref is not None}
+        return {ref: c for ref, c in self._contents.items() if ref in referenced}
+
+    def _asdict(self) -> dict:
+        # Serialización del checkpointer de LangGraph (se reconstruye con cls(**kwargs));
+        # los registros van como tuplas planas
+        return {"records": [tuple(r) for r in self.records], "contents": self.contents}
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(self._length))]
+        position = item + self._length if item < 0 else item
+        if not 0 <= position < self._length:
+            raise IndexError("MessageLog index out of range")
+        message = self._cache.get(position)
+        if message is None:
+            message = self._materialize(self._records[position])
+            self._remember(position, message)
+        else:
+            self._cache.move_to_end(position)
+        return message
+
+    def __add__(self, other) -> list:
+        return list(self) + list(other)
+
+    def __radd__(self, other) -> list:
+        return list(other) + list(self)
+
+    def __repr__(self) -> str:
+        return f"MessageLog({self._length} messages, {len(self.contents)} shared contents)"
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, MessageLog):
+            return self.records == other.records and self.contents == other.contents
+        return isinstance(other, list) and list(self) == other
+
+    def index_of(self, message_id: str) -> Optional[int]:
+        """Posición del mensaje con ese id, o None."""
+        position = self._index.get(message_id)
+        # El índice compartido puede tener ids agregados por logs posteriores
+        return position if position is not None and position < self._length else None
+
+    # ------------------------------------------------------------------------------
+    # Records
+    # ------------------------------------------------------------------------------
+
+    def _record(self, message: BaseMessage) -> MessageRecord:
+        data = message.model_dump(exclude_defaults=True)
+        extra = {k: v for k, v in data.items() if k not in _RECORD_FIELDS} or None
+        content, ref = message.content, None
+        if message.type == "tool" and isinstance(content, str) and len(content) >= MESSAGE_REF_MIN_CHARS:
+            ref = hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+            content = None
+            # Agregar a la tabla compartida no cambia a los demás logs (no lo referencian)
+            self._contents.setdefault(ref, message.content)
+        return MessageRecord(sys.intern(message.type), message.id, content, ref, extra)
+
+    def _materialize(self, record: MessageRecord) -> BaseMessage:
+        content = self._contents[record.ref] if record.ref is not None else record.content
+        data = {**(record.extra or {}), "content": content, "id": record.id}
+        return messages_from_dict([{"type": record.role, "data": data}])[0]
+
+    def _remember(self, position: int, message: BaseMessage):
+        self._cache[position] = message
+        self._cache.move_to_end(position)
+        if len(self._cache) > MESSAGE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    # ------------------------------------------------------------------------------
+    # Merge
+    # ------------------------------------------------------------------------------
+
+    def merge(self, messages) -> "MessageLog":
+        """
+        Agrega o reemplaza mensajes por id, sin modificar este log.
+
+        Args:
+            messages: Mensaje o lista de mensajes (mismos formatos que add_messages)
+
+        Returns:
+            MessageLog nuevo con los mensajes combinados
+
+        Raises:
+            ValueError: Si se intenta borrar un id que no existe
+        """
+        if isinstance(messages, (MessageLog, tuple)):
+            messages = list(messages)
+        elif not isinstance(messages, list):
+            messages = [messages]
+        log = self._derive()
+        removed = set()
+        for message in convert_to_messages(messages):
+            message = message_chunk_to_message(message) if isinstance(message, BaseMessageChunk) else message
+            if message.id is None:
+                message.id = str(uuid.uuid4())
+            if isinstance(message, RemoveMessage):
+                if message.id == REMOVE_ALL_MESSAGES:
+                    log = MessageLog()
+                    removed.clear()
+                    continue
+                if log.index_of(message.id) is None:
+                    raise ValueError(f"Attempting to delete a message with an ID that doesn't exist ('{message.id}')")
+                removed.add(message.id)
+                continue
+
+            position = log.index_of(message.id)
+            if position is None:
+                position = log._append(message)
+            else:
+                removed.discard(message.id)
+                log._replace(position, message)
+            # El objeto recibido es el mismo que se devolvería al leerlo
+            log._remember(position, message)
+
+        if removed:
+            # Borrar del medio es O(historial); es la excepción, no el caso común
+            records = [r for r in log.records if r.id not in removed]
+            log = MessageLog(records, log.contents)
+        return log
+
+    def _derive(self) -> "MessageLog":
+        """Log nuevo con el mismo contenido, que comparte las estructuras de este."""
+        log = MessageLog.__new__(MessageLog)
+        log._records, log._contents, log._index = self._records, self._contents, self._index
+        log._length = self._length
+        log._owned = False
+        log._cache = OrderedDict(self._cache)
+        return log
+
+    def _own(self):
+        """Copia las estructuras compartidas antes de escribir sobre ellas."""
+        if not self._owned:
+            self._records = self._records[:self._length]
+            self._contents = dict(self._contents)
+            self._index = {r.id: i for i, r in enumerate(self._records)}
+            self._owned = True
+
+    def _append(self, message: BaseMessage) -> int:
+        # Solo se agrega al final compartido si ningún otro log lo extendió ya
+        if len(self._records) != self._length:
+            self._own()
+        record = self._record(message)
+        self._index[message.id] = self._length
+        self._records.append(record)
+        self._length += 1
+        return self._length - 1
+
+    def _replace(self, position: int, message: BaseMessage):
+        self._own()
+        self._records[position] = self._record(message)
+
+
+def add_messages_indexed(left, right):
+    """
+    Reducer de mensajes equivalente a add_messages, en O(1) por mensaje nuevo.
+
+    El historial se guarda como MessageLog; cada paso devuelve uno nuevo y
+    deja intacto el anterior.
+
+    Args:
+        left: Mensajes actuales (MessageLog, o lista en el primer paso)
+        right: Mensajes nuevos del paso
+
+    Returns:
+        MessageLog con los mensajes combinados
+    """
+    log = left if isinstance(left, MessageLog) else MessageLog.from_messages(list(left or []))
+    return log.merge(right)
+
+
+def messages_reducer():
+    """
+    Reducer de ``messages`` para los estados de los grafos.
+
+    Returns:
+        add_messages_indexed con COMPACT_MESSAGES=1; si no, add_messages
+        (el historial es una lista y se serializa sin registrar tipos)
+    """
+    return add_messages_indexed if COMPACT_MESSAGES else add_messages
+
+
+# ====================================================================================
+# Benchmark
+# ====================================================================================
+
+_TOOL_OUTPUTS = [
+    ("The Transformer uses multi-head attention with h = 8 parallel heads. " * 40).strip(),
+    ("Positional encodings use sine and cosine functions of different frequencies. " * 40).strip(),
+    ("Training used the Adam optimizer with beta1 = 0.9 and beta2 = 0.98. " * 40).strip(),
+]
+
+
+def _turn(index: int) -> List[List[AnyMessage]]:
+    """Escrituras de un turno del agente: usuario, tool call, tool, respuesta."""
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+    call_id = f"call_{index}"
+    return [
+        [HumanMessage(content=f"Question {index} about the paper?")],
+        [AIMessage(content="", tool_calls=[{"name": "search_transformer_paper", "args": {"query": f"q{index}"}, "id": call_id}],
+                   usage_metadata={"input_tokens": 120, "output_tokens": 20, "total_tokens": 140})],
+        [ToolMessage(content=_TOOL_OUTPUTS[index % len(_TOOL_OUTPUTS)], tool_call_id=call_id, name="search_transformer_paper")],
+        [AIMessage(content=f"Answer {index} based on the paper.",
+                   usage_metadata={"input_tokens": 900, "output_tokens": 60, "total_tokens": 960})],
+    ]
+
+
+def bench_reducer(reducer, turns: int) -> dict:
+    """
+    Aplica las escrituras de ``turns`` turnos con un reducer.
+
+    Returns:
+        Diccionario con seconds, last_step_us (coste de un paso al final de la
+        sesión) y state_bytes (memoria del historial)
+    """
+    tracemalloc.start()
+    state: Any = []
+    started = time.perf_counter()
+    for index in range(turns):
+        for update in _turn(index):
+            step_started = time.perf_counter()
+            state = reducer(state, update)
+            last_step = time.perf_counter() - step_started
+    seconds = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"messages": len(state), "seconds": seconds, "last_step_us": last_step * 1e6, "state_bytes": size}
+
+
+def bench_graph(turns: int) -> dict:
+    """Ejecuta ``turns`` turnos del agente de soporte offline con un checkpointer en memoria."""
+    from langgraph.checkpoint.memory import InMemorySaver
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+    from langchain_core.messages import HumanMessage
+    from agents.support.agent import create_graph
+
+    serde = JsonPlusSerializer(allowed_msgpack_modules=CHECKPOINT_MSGPACK_MODULES)
+    graph = create_graph(checkpointer=InMemorySaver(serde=serde))
+    config = {"configurable": {"thread_id": "bench"}}
+    latencies = []
+    for index in range(turns):
+        started = time.perf_counter()
+        graph.invoke({"messages": [HumanMessage(content=f"What is multi-head attention? ({index})")]}, config)
+        latencies.append(time.perf_counter() - started)
+    messages = graph.get_state(config).values["messages"]
+    return {
+        "messages": len(messages),
+        "first_10_ms": 1000 * sum(latencies[:10]) / min(10, turns),
+        "last_10_ms": 1000 * sum(latencies[-10:]) / min(10, turns),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark del historial de mensajes en sesiones largas")
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--graph", action="store_true", help="Medir también el grafo de soporte (offline)")
+    args = parser.parse_args(argv)
+
+    print(f"📊 {args.turns} turnos ({4 * args.turns} mensajes)")
+    for name, reducer in (("add_messages", add_messages), ("add_messages_indexed", add_messages_indexed)):
+        stats = bench_reducer(reducer, args.turns)
+        print(f"   {name:<22} total {stats['seconds']:.2f}s  último paso {stats['last_step_us']:.0f}µs  "
+              f"estado {stats['state_bytes'] / 1e6:.1f} MB")
+    if args.graph:
+        stats = bench_graph(args.turns)
+        state = "MessageLog" if COMPACT_MESSAGES else "lista (COMPACT_MESSAGES=0)"
+        print(f"   grafo de soporte, historial como {state}")
+        print(f"   {'':<22} {stats['messages']} mensajes  primeros 10 turnos {stats['first_10_ms']:.1f}ms/turno  "
+              f"últimos 10 {stats['last_10_ms']:.1f}ms/turno")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,28 @@ Node definitions for the Support Agent.
 This module contains all node functions that process the state.
 """
 
+import time
+
 from langgraph.graph import END
 from langgraph.prebuilt import ToolNode
-from langchain.chat_models import init_chat_model
+from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 
+from .budget import ANSWERED, MAX_TOOL_CALLS_REACHED, exceeded, termination_metrics, usage_tokens
+from .backends import LLM_BACKEND, create_chat_model, warm_prompt_cache
+from .prompt_cache import PROMPT_CACHE_KEY, build_prompt, prompt_cache_stats, static_system_message
+from .scheduler import LLM_BATCH_WINDOW_MS, LLMBatchScheduler, get_deadline, get_http_clients
+from .singleflight import coalesce_llm, llm_flight, messages_key
+from .speculative import (
+    SPECULATIVE_RETRIEVAL,
+    create_speculative_tool_node,
+    direct_retrieval_messages,
+    get_speculative_retriever,
+    is_in_domain,
+    speculation_key,
+)
 from .state import State
-from .tools import get_tools
+from .tools import get_tool_schemas, get_tools
 
 
 # ====================================================================================
@@ -24,6 +40,9 @@ SYSTEM_PROMPT = """Eres un asistente experto en el paper 'Attention Is All You N
 Usa la herramienta search_transformer_paper para buscar información en el paper. 
 Siempre basa tus respuestas en la información encontrada en el paper."""
 
+# Prefijo estático del prompt: mismo objeto (y mismos bytes) en cada llamada
+SYSTEM_MESSAGE = static_system_message(SYSTEM_PROMPT)
+
 
 # ====================================================================================
 # LLM Management (inline para evitar dependencias)
@@ -31,13 +50,19 @@ Siempre basa tus respuestas en la información encontrada en el paper."""
 
 _llm = None
 _llm_with_tools = None
+_llm_scheduler = None
 
 
 def get_llm():
     """Obtiene el LLM con lazy loading."""
     global _llm
     if _llm is None:
-        _llm = init_chat_model(DEFAULT_MODEL, temperature=DEFAULT_TEMPERATURE)
+        provider_kwargs = {}
+        if LLM_BATCH_WINDOW_MS > 0 and LLM_BACKEND == "openai":
+            # Con micro-batching, todas las llamadas comparten el pool HTTP
+            http_client, http_async_client = get_http_clients()
+            provider_kwargs = {"http_client": http_client, "http_async_client": http_async_client}
+        _llm = create_chat_model(DEFAULT_MODEL, temperature=DEFAULT_TEMPERATURE, **provider_kwargs)
     return _llm
 
 
@@ -46,16 +71,60 @@ def get_llm_with_tools():
     global _llm_with_tools
     if _llm_with_tools is None:
         llm = get_llm()
-        tools = get_tools()
-        _llm_with_tools = llm.bind_tools(tools)
+        # Esquemas precomputados: no se re-serializan en cada bind
+        bind_kwargs = {"prompt_cache_key": PROMPT_CACHE_KEY} if LLM_BACKEND == "openai" else {}
+        _llm_with_tools = llm.bind_tools(get_tool_schemas(), **bind_kwargs)
+        # Con un backend local, el prefijo fijo queda en la cache KV
+        warm_prompt_cache(_llm_with_tools, SYSTEM_PROMPT)
     return _llm_with_tools
 
 
+def get_llm_scheduler():
+    """
+    Obtiene el scheduler de micro-batching del LLM con tools.
+    
+    Returns:
+        LLMBatchScheduler, o None si LLM_BATCH_WINDOW_MS es 0
+    """
+    global _llm_scheduler
+    if _llm_scheduler is None and LLM_BATCH_WINDOW_MS > 0:
+        # create_chat_completion de llama.cpp no acepta timeout
+        _llm_scheduler = LLMBatchScheduler(get_llm_with_tools(), pass_timeout=LLM_BACKEND == "openai")
+    return _llm_scheduler
+
+
 # ====================================================================================
 # Node Functions
 # ====================================================================================
 
-def conversation_node(state: State) -> dict:
+def _invoke_llm(messages: list, config: RunnableConfig = None):
+    """Invoca el LLM con tools (vía el scheduler si hay micro-batching) y registra la cache."""
+    deadline = get_deadline(config)
+
+    def call(deadline):
+        # Con micro-batching, la llamada se agrupa con las de otras conversaciones
+        scheduler = get_llm_scheduler()
+        if scheduler is not None:
+            ai_message = scheduler.invoke(messages, deadline=deadline)
+        else:
+            # Invocar LLM con el system prompt y el mensaje del usuario
+            ai_message = get_llm_with_tools().invoke(messages)
+        prompt_cache_stats.record("conversation", ai_message)
+        return ai_message
+
+    if not coalesce_llm():
+        return call(deadline)
+    # Prompts idénticos en vuelo comparten una llamada; cada conversación recibe su copia.
+    # La llamada compartida no usa el deadline de quien la inició: cada una lo aplica a su espera
+    return llm_flight.do(
+        messages_key(messages),
+        lambda: call(None),
+        timeout=None if deadline is None else max(0.0, deadline - time.time()),
+        share=lambda message: message.model_copy(deep=True),
+    )
+
+
+def conversation_node(state: State, config: RunnableConfig = None) -> dict:
     """
     Nodo principal de conversación.
     
@@ -65,8 +134,13 @@ def conversation_node(state: State) -> dict:
     3. Invoca el LLM con las tools disponibles
     4. Retorna la respuesta del LLM
     
+    Con SPECULATIVE_RETRIEVAL, la búsqueda del mensaje del usuario arranca
+    en paralelo con el LLM ("prefetch"), o reemplaza la primera llamada al
+    LLM si la pregunta es claramente sobre el paper ("direct").
+    
     Args:
         state: Estado actual del agente
+        config: Config del grafo (``configurable.deadline`` se propaga al LLM)
         
     Returns:
         Diccionario con los nuevos mensajes a agregar al estado
@@ -75,17 +149,89 @@ def conversation_node(state: State) -> dict:
     history = state["messages"]
     last_message = history[-1]
     
-    # Obtener LLM con tools
-    llm_with_tools = get_llm_with_tools()
+    speculative = SPECULATIVE_RETRIEVAL != "off" and isinstance(last_message, HumanMessage)
+    if speculative:
+        retriever = get_speculative_retriever()
+        if SPECULATIVE_RETRIEVAL == "direct" and is_in_domain(last_message.content):
+            # Sin ida y vuelta: la búsqueda queda en el historial como si el LLM la hubiera pedido
+            context = retriever.search_fn(last_message.content)
+            ai_message = _invoke_llm(build_prompt(SYSTEM_MESSAGE, context), config)
+            new_messages = [*direct_retrieval_messages(last_message.content, context), ai_message]
+            return {"messages": new_messages, **_turn_budget(state, new_messages)}
+        retriever.start(last_message.id, last_message.content)
+    
+    # Prefijo estático (tools + system prompt) primero, turno del usuario al final
+    messages = build_prompt(SYSTEM_MESSAGE, last_message.content)
+    ai_message = _invoke_llm(messages, config)
+    
+    # El LLM respondió sin buscar: el prefetch ya no sirve
+    if speculative and not ai_message.tool_calls:
+        retriever.discard(last_message.id)
+    
+    # Retornar nuevo estado con el mensaje del AI y el presupuesto consumido
+    return {"messages": [ai_message], **_turn_budget(state, [ai_message])}
+
+
+def _turn_budget(state: State, new_messages: list) -> dict:
+    """Acumula tool calls y tokens del turno (un mensaje del usuario abre un turno nuevo)."""
+    if isinstance(state["messages"][-1], HumanMessage):
+        budget = {"tool_calls": 0, "tokens": 0, "started_at": time.time()}
+    else:
+        budget = {
+            "tool_calls": state.get("tool_calls", 0),
+            "tokens": state.get("tokens", 0),
+            "started_at": state.get("started_at") or time.time(),
+        }
+    for message in new_messages:
+        budget["tool_calls"] += len(getattr(message, "tool_calls", None) or [])
+        budget["tokens"] += usage_tokens(message)
+    # Sin tool calls el turno termina aquí; si no, sigue abierto
+    budget["termination"] = None if new_messages[-1].tool_calls else ANSWERED
+    return budget
+
+
+def finalize_node(state: State, config: RunnableConfig = None) -> dict:
+    """
+    Nodo de cierre cuando el turno agotó su presupuesto.
+    
+    Responde las tool calls pendientes sin ejecutarlas y pide al LLM (sin
+    tools) una respuesta final con la última información recuperada.
+    
+    Args:
+        state: Estado actual del agente
+        config: Config del grafo
+        
+    Returns:
+        Diccionario con los mensajes de cierre y el motivo de terminación
+    """
+    reason = exceeded(state) or MAX_TOOL_CALLS_REACHED
+    history = state["messages"]
+    last_message = history[-1]
+    
+    if SPECULATIVE_RETRIEVAL != "off":
+        get_speculative_retriever().discard(speculation_key(history))
+    
+    skipped = [
+        ToolMessage(
+            content=f"Límite del turno alcanzado ({reason}); responde con la información disponible.",
+            name=call["name"],
+            tool_call_id=call["id"],
+        )
+        for call in last_message.tool_calls
+    ]
+    # Último resultado de una tool del turno; si no hay, la pregunta del usuario
+    context = last_message.content
+    for message in reversed(history):
+        if isinstance(message, (ToolMessage, HumanMessage)):
+            context = message.content
+            break
     
-    # Invocar LLM con el system prompt y el mensaje del usuario
-    ai_message = llm_with_tools.invoke([
-        ("system", SYSTEM_PROMPT), 
-        ("user", last_message.content)
-    ])
+    ai_message = get_llm().invoke(build_prompt(SYSTEM_MESSAGE, context))
+    prompt_cache_stats.record("finalize", ai_message)
     
-    # Retornar nuevo estado con el mensaje del AI
-    return {"messages": [ai_message]}
+    tokens = state.get("tokens", 0) + usage_tokens(ai_message)
+    termination_metrics.record(reason, {**state, "tokens": tokens})
+    return {"messages": [*skipped, ai_message], "tokens": tokens, "termination": reason}
 
 
 def create_tool_node() -> ToolNode:
@@ -95,10 +241,15 @@ def create_tool_node() -> ToolNode:
     Este nodo ejecuta las tools cuando el LLM las invoca.
     
     Returns:
-        ToolNode configurado con las tools disponibles
+        ToolNode configurado con las tools disponibles (envuelto si hay
+        retrieval especulativo)
     """
     tools = get_tools()
-    return ToolNode(tools)
+    tool_node = ToolNode(tools)
+    if SPECULATIVE_RETRIEVAL != "off":
+        # Sirve las búsquedas que coinciden con el prefetch sin repetirlas
+        return create_speculative_tool_node(tool_node)
+    return tool_node
 
 
 # ====================================================================================
@@ -110,22 +261,26 @@ def should_continue(state: State) -> str:
     Función de routing que decide el siguiente paso.
     
     Lógica:
-    - Si el último mensaje tiene tool_calls -> ir a "tools"
+    - Si el último mensaje tiene tool_calls y queda presupuesto -> ir a "tools"
+    - Si tiene tool_calls pero se agotó el presupuesto -> "finalize"
     - Si no -> terminar (END)
     
     Args:
         state: Estado actual del agente
         
     Returns:
-        "tools" si hay tool calls, END si no
+        "tools", "finalize" o END
     """
     messages = state["messages"]
     last_message = messages[-1]
     
-    # Si el LLM llamó a una tool, ir al nodo de tools
+    # Si el LLM llamó a una tool, ir al nodo de tools (salvo que el turno agotó su presupuesto)
     if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
+        if exceeded(state) is not None:
+            return "finalize"
         return "tools"
     
     # Si no, terminar
+    termination_metrics.record(ANSWERED, state)
     return END
 
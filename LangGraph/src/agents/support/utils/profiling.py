@@ -0,0 +1,455 @@
+"""
+Sampling profiler hooks for the agents.
+
+This module wraps ``invoke``/``ainvoke``/``stream``/``astream`` of a compiled
+graph so that a sampled fraction of the calls is profiled and written to a
+rotating directory. Two profilers are supported:
+
+- ``cprofile``: deterministic profile, written as ``.prof`` (pstats).
+- ``sampler``: statistical stack sampler, written as ``.collapsed``
+  (one ``frame;frame;frame count`` line per stack, flamegraph-ready).
+
+Usage:
+    AGENT_PROFILING=1 AGENT_PROFILE_SAMPLE_RATE=0.1 langgraph dev
+
+    # Resumen de las funciones con más self-time en todos los perfiles
+    python -m agents.support.utils.profiling summarize profiles/ --top 25
+"""
+
+import argparse
+import contextvars
+import cProfile
+import functools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import merge_configs
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+PROFILING_ENABLED = os.getenv("AGENT_PROFILING", "0").lower() in ("1", "true", "yes")
+DEFAULT_SAMPLE_RATE = float(os.getenv("AGENT_PROFILE_SAMPLE_RATE", "0.05"))
+DEFAULT_PROFILER = os.getenv("AGENT_PROFILER", "cprofile")
+DEFAULT_PROFILE_DIR = os.getenv("AGENT_PROFILE_DIR", "profiles")
+DEFAULT_MAX_FILES = int(os.getenv("AGENT_PROFILE_MAX_FILES", "200"))
+DEFAULT_SAMPLE_INTERVAL = float(os.getenv("AGENT_PROFILE_INTERVAL", "0.005"))
+
+PROFILERS = ("cprofile", "sampler")
+
+# invoke() llama internamente a stream(): solo se perfila la llamada externa
+_active = contextvars.ContextVar("agent_profiling_active", default=False)
+
+
+# ====================================================================================
+# Stack Sampler
+# ====================================================================================
+
+class StackSampler:
+    """
+    Profiler estadístico que muestrea las pilas de los hilos a intervalos fijos.
+
+    Con ``threads`` solo se muestrean los hilos que tienen un run activo de la
+    invocación perfilada (ver ``ThreadTracker``): con ainvoke/astream los nodos
+    síncronos corren en hilos del executor, no en el que inició el perfil, y
+    los hilos ociosos del pool o de otras solicitudes no cuentan. Las pilas se
+    acumulan en formato "collapsed" (Brendan Gregg), que se puede pasar
+    directamente a flamegraph.pl o speedscope.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._threads: Optional[Callable[[], List[int]]] = None
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def start(self, threads: Optional[Callable[[], List[int]]] = None):
+        """Empieza a muestrear los hilos que devuelve ``threads()`` en cada muestra (por defecto, todos)."""
+        self._threads = threads
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """Detiene el muestreo y espera al hilo de muestreo."""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self._threads is not None:
+                frames = {t: frames[t] for t in self._threads() if t in frames}
+            for thread_id, frame in frames.items():
+                # Un hilo bloqueado en un lock o Condition (p. ej. esperando a otro hilo
+                # muestreado) no suma: su tiempo ya cuenta donde se hace el trabajo
+                if thread_id != own and frame.f_code.co_filename != threading.__file__:
+                    self.stacks[_collapse_frame(frame)] += 1
+
+    def dump(self, path: str):
+        """Escribe las pilas acumuladas en formato collapsed."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ThreadTracker(BaseCallbackHandler):
+    """
+    Callback que registra qué hilos ejecutan runs (grafo, nodos, tools) de una invocación.
+
+    Se llama en el mismo hilo que ejecuta cada run (``run_inline``); un hilo
+    cuenta mientras tenga algún run de la invocación sin terminar.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._threads: Counter = Counter()
+        self._runs: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+
+    def _enter(self, run_id, parent_run_id):
+        # El run raíz (el grafo) solo espera a sus nodos: su hilo cuenta si ejecuta alguno
+        if parent_run_id is None:
+            return
+        ident = threading.get_ident()
+        with self._lock:
+            self._runs[run_id] = ident
+            self._threads[ident] += 1
+
+    def _exit(self, run_id):
+        with self._lock:
+            ident = self._runs.pop(run_id, None)
+            if ident is not None:
+                self._threads[ident] -= 1
+                if self._threads[ident] <= 0:
+                    del self._threads[ident]
+
+    def threads(self) -> List[int]:
+        """Hilos con algún run activo de la invocación."""
+        with self._lock:
+            return list(self._threads)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._enter(run_id, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._exit(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._exit(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._enter(run_id, parent_run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._exit(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._exit(run_id)
+
+    def config(self, args: tuple, kwargs: dict) -> Tuple[tuple, dict]:
+        """Agrega este callback al config de una llamada invoke/stream(input, config, ...)."""
+        if len(args) > 1:
+            args = (args[0], merge_configs(args[1], {"callbacks": [self]}), *args[2:])
+        else:
+            kwargs = {**kwargs, "config": merge_configs(kwargs.get("config"), {"callbacks": [self]})}
+        return args, kwargs
+
+
+def _frame_label(frame) -> str:
+    # Mismo formato que las entradas de los .prof (pstats usa co_name), para que el resumen las junte
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name}({filename}:{code.co_firstlineno})"
+
+
+def _collapse_frame(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    # De la raíz a la hoja, separados por ';' (los espacios rompen el formato)
+    return ";".join(reversed(labels)).replace(" ", "_")
+
+
+# ====================================================================================
+# Output Directory
+# ====================================================================================
+
+def _rotate(directory: str, max_files: int):
+    """Elimina los perfiles más antiguos si se supera max_files."""
+    entries = [
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith((".prof", ".collapsed"))
+    ]
+    if len(entries) <= max_files:
+        return
+    entries.sort(key=os.path.getmtime)
+    for path in entries[: len(entries) - max_files]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _output_path(directory: str, graph_name: str, method: str, extension: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    name = f"{graph_name}-{method}-{stamp}-{uuid.uuid4().hex[:8]}{extension}"
+    return os.path.join(directory, name)
+
+
+# ====================================================================================
+# Profiling Session
+# ====================================================================================
+
+class Profiler:
+    """
+    Decide qué llamadas se perfilan y escribe el resultado de cada una.
+
+    Args:
+        graph_name: Nombre del grafo (se usa en el nombre del archivo)
+        sample_rate: Fracción de llamadas a perfilar (0.0 - 1.0)
+        kind: "cprofile" o "sampler"
+        directory: Directorio de salida
+        max_files: Número máximo de perfiles a conservar
+    """
+
+    def __init__(
+        self,
+        graph_name: str,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        kind: str = DEFAULT_PROFILER,
+        directory: str = DEFAULT_PROFILE_DIR,
+        max_files: int = DEFAULT_MAX_FILES,
+    ):
+        if kind not in PROFILERS:
+            raise ValueError(f"Profiler desconocido: {kind!r} (usa uno de {PROFILERS})")
+        self.graph_name = graph_name
+        self.sample_rate = sample_rate
+        self.kind = kind
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def should_sample(self) -> bool:
+        """Sorteo independiente por llamada (nunca dentro de otra sesión)."""
+        if _active.get():
+            return False
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @contextmanager
+    def session(self, method: str):
+        """
+        Perfila el bloque y escribe el resultado al salir.
+
+        Returns:
+            ThreadTracker a agregar como callback de la llamada perfilada
+        """
+        token = _active.set(True)
+        try:
+            tracker = ThreadTracker()
+            with self._profile(method, tracker):
+                yield tracker
+        finally:
+            _active.reset(token)
+
+    @contextmanager
+    def _profile(self, method: str, tracker: ThreadTracker):
+        if self.kind == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Solo puede haber un cProfile activo por intérprete: otra
+                # llamada concurrente ya se está perfilando
+                yield
+                return
+            try:
+                yield
+            finally:
+                profiler.disable()
+                path = _output_path(self.directory, self.graph_name, method, ".prof")
+                profiler.dump_stats(path)
+                self._after_write()
+        else:
+            sampler = StackSampler()
+            sampler.start(tracker.threads)
+            try:
+                yield
+            finally:
+                sampler.stop()
+                path = _output_path(self.directory, self.graph_name, method, ".collapsed")
+                sampler.dump(path)
+                self._after_write()
+
+    def _after_write(self):
+        with self._lock:
+            _rotate(self.directory, self.max_files)
+
+
+# ====================================================================================
+# Agent Instrumentation
+# ====================================================================================
+
+def instrument_agent(agent, graph_name: str, profiler: Optional[Profiler] = None, enabled: Optional[bool] = None):
+    """
+    Instala los hooks de profiling en un grafo compilado.
+
+    Los métodos se reemplazan en la instancia, de modo que el objeto sigue
+    siendo el mismo grafo compilado (la CLI de langgraph lo sigue aceptando).
+    Si el profiling no está habilitado, el agente se devuelve sin cambios.
+
+    Args:
+        agent: Grafo compilado
+        graph_name: Nombre del grafo para los archivos de salida
+        profiler: Profiler a usar (opcional, se crea uno con la config por defecto)
+        enabled: Fuerza habilitar/deshabilitar (por defecto AGENT_PROFILING)
+
+    Returns:
+        El mismo agente, instrumentado si corresponde
+    """
+    if enabled is None:
+        enabled = PROFILING_ENABLED
+    if not enabled:
+        return agent
+    if profiler is None:
+        profiler = Profiler(graph_name)
+
+    invoke, ainvoke = agent.invoke, agent.ainvoke
+    stream, astream = agent.stream, agent.astream
+
+    @functools.wraps(invoke)
+    def profiled_invoke(*args, **kwargs):
+        if not profiler.should_sample():
+            return invoke(*args, **kwargs)
+        with profiler.session("invoke") as tracker:
+            args, kwargs = tracker.config(args, kwargs)
+            return invoke(*args, **kwargs)
+
+    @functools.wraps(ainvoke)
+    async def profiled_ainvoke(*args, **kwargs):
+        if not profiler.should_sample():
+            return await ainvoke(*args, **kwargs)
+        # En async el hilo del event loop también ejecuta corutinas de otras solicitudes
+        with profiler.session("ainvoke") as tracker:
+            args, kwargs = tracker.config(args, kwargs)
+            return await ainvoke(*args, **kwargs)
+
+    @functools.wraps(stream)
+    def profiled_stream(*args, **kwargs) -> Iterator:
+        if not profiler.should_sample():
+            yield from stream(*args, **kwargs)
+            return
+        with profiler.session("stream") as tracker:
+            args, kwargs = tracker.config(args, kwargs)
+            yield from stream(*args, **kwargs)
+
+    @functools.wraps(astream)
+    async def profiled_astream(*args, **kwargs):
+        if not profiler.should_sample():
+            async for chunk in astream(*args, **kwargs):
+                yield chunk
+            return
+        with profiler.session("astream") as tracker:
+            args, kwargs = tracker.config(args, kwargs)
+            async for chunk in astream(*args, **kwargs):
+                yield chunk
+
+    agent.invoke = profiled_invoke
+    agent.ainvoke = profiled_ainvoke
+    agent.stream = profiled_stream
+    agent.astream = profiled_astream
+    return agent
+
+
+# ====================================================================================
+# Summary Tool
+# ====================================================================================
+
+def _self_times_from_prof(path: str) -> Dict[str, float]:
+    stats = pstats.Stats(path)
+    result = {}
+    for (filename, line, func), (_, _, tottime, _, _) in stats.stats.items():
+        label = f"{func}({os.path.basename(filename)}:{line})"
+        result[label] = result.get(label, 0.0) + tottime
+    return result
+
+
+def _self_times_from_collapsed(path: str, interval: float) -> Dict[str, float]:
+    result = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if not stack:
+                continue
+            # El self-time se atribuye al frame hoja de cada pila
+            leaf = stack.rsplit(";", 1)[-1]
+            result[leaf] = result.get(leaf, 0.0) + int(count) * interval
+    return result
+
+
+def summarize(directory: str, top: int = 20, interval: float = DEFAULT_SAMPLE_INTERVAL) -> List[Tuple[str, float, int]]:
+    """
+    Agrega el self-time por función en todos los perfiles de un directorio.
+
+    Args:
+        directory: Directorio con archivos .prof y/o .collapsed
+        top: Número de funciones a devolver
+        interval: Intervalo de muestreo usado por el sampler (segundos)
+
+    Returns:
+        Lista de (función, self-time total en segundos, nº de perfiles donde aparece)
+    """
+    totals: Dict[str, float] = {}
+    seen: Counter = Counter()
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(".prof"):
+            times = _self_times_from_prof(path)
+        elif name.endswith(".collapsed"):
+            times = _self_times_from_collapsed(path, interval)
+        else:
+            continue
+        for label, seconds in times.items():
+            totals[label] = totals.get(label, 0.0) + seconds
+            seen[label] += 1
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [(label, seconds, seen[label]) for label, seconds in ranked]
+
+
+def main(argv: Optional[List[str]] = None):
+    """CLI: python -m agents.support.utils.profiling summarize DIR"""
+    parser = argparse.ArgumentParser(description="Herramientas de profiling de los agentes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summary = subparsers.add_parser("summarize", help="Top funciones por self-time")
+    summary.add_argument("directory", nargs="?", default=DEFAULT_PROFILE_DIR)
+    summary.add_argument("--top", type=int, default=20)
+    summary.add_argument("--interval", type=float, default=DEFAULT_SAMPLE_INTERVAL)
+    args = parser.parse_args(argv)
+
+    rows = summarize(args.directory, top=args.top, interval=args.interval)
+    print(f"{'self (s)':>10}  {'perfiles':>8}  función")
+    for label, seconds, count in rows:
+        print(f"{seconds:>10.4f}  {count:>8}  {label}")
+
+
+if __name__ == "__main__":
+    main()
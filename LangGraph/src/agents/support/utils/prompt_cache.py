@@ -0,0 +1,126 @@
+"""
+Prompt-prefix caching helpers for the agents.
+
+Providers (and the local llama.cpp backend) reuse the work done on a prompt
+prefix only when it is byte-identical across calls. The static part of every
+request — tool definitions plus system prompt — is therefore built once
+here and always placed first; only the user turn changes.
+
+Cached-token usage is recorded per call and aggregated per node.
+"""
+
+import logging
+import os
+import threading
+from typing import Dict, List, Sequence
+
+from langchain_core.messages import SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+logger = logging.getLogger(__name__)
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+# Enruta las solicitudes con el mismo prefijo a la misma cache del proveedor
+PROMPT_CACHE_KEY = os.getenv("PROMPT_CACHE_KEY", "transformer-paper-support-v1")
+
+
+# ====================================================================================
+# Static Prefix
+# ====================================================================================
+
+def precompute_tool_schemas(tools: Sequence) -> List[dict]:
+    """
+    Serializa las tools al formato de OpenAI una sola vez.
+
+    ``bind_tools`` acepta estos dicts tal cual, así que el esquema no se
+    recalcula en cada bind y es idéntico byte a byte entre llamadas.
+
+    Args:
+        tools: Tools de LangChain
+
+    Returns:
+        Lista de esquemas de tools
+    """
+    return [convert_to_openai_tool(t) for t in tools]
+
+
+def static_system_message(system_prompt: str) -> SystemMessage:
+    """Crea el SystemMessage fijo que encabeza todas las solicitudes."""
+    return SystemMessage(content=system_prompt)
+
+
+def build_prompt(system_message: SystemMessage, user_content) -> list:
+    """
+    Ordena el prompt con el prefijo estático primero.
+
+    Args:
+        system_message: SystemMessage fijo (mismo objeto en cada llamada)
+        user_content: Contenido variable del turno
+
+    Returns:
+        Lista de mensajes para el chat model
+    """
+    return [system_message, ("user", user_content)]
+
+
+# ====================================================================================
+# Cached-token Stats
+# ====================================================================================
+
+class PromptCacheStats:
+    """Acumula tokens de entrada y tokens servidos desde cache por nodo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_node: Dict[str, Dict[str, int]] = {}
+
+    def record(self, node: str, ai_message) -> dict:
+        """
+        Registra el uso de una llamada.
+
+        Args:
+            node: Nombre del nodo que hizo la llamada
+            ai_message: Respuesta del LLM (con usage_metadata)
+
+        Returns:
+            Estadísticas de la llamada: input_tokens, cached_tokens, hit_ratio
+        """
+        usage = getattr(ai_message, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", 0) or 0
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        call = {
+            "input_tokens": input_tokens,
+            "cached_tokens": cached,
+            "hit_ratio": cached / input_tokens if input_tokens else 0.0,
+        }
+        with self._lock:
+            totals = self._by_node.setdefault(node, {"calls": 0, "input_tokens": 0, "cached_tokens": 0})
+            totals["calls"] += 1
+            totals["input_tokens"] += input_tokens
+            totals["cached_tokens"] += cached
+        # Queda también en la respuesta, para inspeccionarla llamada a llamada
+        if hasattr(ai_message, "response_metadata"):
+            ai_message.response_metadata["prompt_cache"] = call
+        logger.info(
+            "prompt cache [%s]: %d/%d tokens de entrada desde cache (%.0f%%)",
+            node, cached, input_tokens, call["hit_ratio"] * 100,
+        )
+        return call
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Totales por nodo con su hit ratio."""
+        with self._lock:
+            result = {}
+            for node, totals in self._by_node.items():
+                ratio = totals["cached_tokens"] / totals["input_tokens"] if totals["input_tokens"] else 0.0
+                result[node] = {**totals, "hit_ratio": ratio}
+            return result
+
+
+# Instancia compartida por los agentes
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,180 @@
+"""
+Micro-batching scheduler for concurrent LLM calls.
+
+When many conversations reach ``conversation_node`` at the same time, the
+scheduler collects their requests for a few milliseconds and sends them
+together through the model's ``batch`` path, over a shared pooled HTTP
+client (HTTP/2 when ``h2`` is installed). This pays off most with a local
+OpenAI-compatible server (``OPENAI_BASE_URL``) that batches on the GPU/CPU.
+
+Each request may carry an absolute deadline (``time.time()`` based, read
+from ``config["configurable"]["deadline"]``). Expired requests are dropped
+before dispatch, the remaining time is forwarded as the request timeout,
+and a caller that gives up cancels its pending request.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, List, Optional
+
+from .batching import MicroBatcher
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "0"))
+LLM_MAX_BATCH = int(os.getenv("LLM_MAX_BATCH", "16"))
+LLM_BATCH_CONCURRENCY = int(os.getenv("LLM_BATCH_CONCURRENCY", "16"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32"))
+
+
+# ====================================================================================
+# Shared HTTP clients
+# ====================================================================================
+
+_http_client = None
+_http_async_client = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_http_clients():
+    """
+    Obtiene los clientes HTTP compartidos (sync y async) con lazy loading.
+
+    Usa HTTP/2 si el paquete ``h2`` está instalado (todas las solicitudes
+    se multiplexan sobre una conexión); si no, un pool keep-alive HTTP/1.1.
+
+    Returns:
+        Tupla (httpx.Client, httpx.AsyncClient)
+    """
+    global _http_client, _http_async_client
+    if _http_client is None:
+        import httpx
+
+        http2 = _http2_available()
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        )
+        _http_client = httpx.Client(http2=http2, limits=limits)
+        _http_async_client = httpx.AsyncClient(http2=http2, limits=limits)
+    return _http_client, _http_async_client
+
+
+# ====================================================================================
+# Scheduler
+# ====================================================================================
+
+class LLMBatchScheduler:
+    """
+    Agrupa llamadas concurrentes a un chat model en lotes.
+
+    Args:
+        llm: Runnable de chat (normalmente el LLM con tools bindeadas)
+        window_ms: Ventana de agrupación
+        max_batch: Tamaño máximo de lote
+        max_concurrency: Llamadas paralelas dentro de un lote (si el
+            proveedor no tiene endpoint de lote, ``batch`` las paraleliza)
+        pass_timeout: Reenviar el tiempo restante como ``timeout`` al
+            proveedor (lo soportan los modelos de OpenAI)
+    """
+
+    def __init__(
+        self,
+        llm,
+        window_ms: float = LLM_BATCH_WINDOW_MS,
+        max_batch: int = LLM_MAX_BATCH,
+        max_concurrency: int = LLM_BATCH_CONCURRENCY,
+        pass_timeout: bool = True,
+    ):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.pass_timeout = pass_timeout
+        self.expired = 0
+        self.batcher = MicroBatcher(
+            self._run_batch,
+            window_ms=window_ms,
+            max_batch=max_batch,
+            name="llm-batcher",
+        )
+
+    def _run_batch(self, items: List[tuple]) -> List[Any]:
+        now = time.time()
+        results: List[Any] = [None] * len(items)
+        live = []
+        for index, (_, deadline) in enumerate(items):
+            if deadline is not None and deadline <= now:
+                self.expired += 1
+                results[index] = TimeoutError("Deadline excedido antes de llamar al LLM")
+            else:
+                live.append(index)
+        if not live:
+            return results
+
+        kwargs = {}
+        deadlines = [items[i][1] for i in live if items[i][1] is not None]
+        if self.pass_timeout and len(deadlines) == len(live):
+            # El lote espera hasta el deadline más lejano; cada llamador
+            # abandona por su cuenta al llegar al suyo
+            kwargs["timeout"] = max(deadlines) - now
+
+        outputs = self.llm.batch(
+            [items[i][0] for i in live],
+            config={"max_concurrency": self.max_concurrency},
+            return_exceptions=True,
+            **kwargs,
+        )
+        for index, output in zip(live, outputs):
+            results[index] = output
+        return results
+
+    def invoke(self, messages, deadline: Optional[float] = None):
+        """
+        Encola una llamada y espera su resultado.
+
+        Args:
+            messages: Entrada del chat model
+            deadline: Instante límite (time.time()) o None
+
+        Raises:
+            TimeoutError: Si se alcanza el deadline
+        """
+        future = self.batcher.submit((messages, deadline))
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def ainvoke(self, messages, deadline: Optional[float] = None):
+        """Versión async de invoke(); cancelar la corutina cancela la solicitud."""
+        future = asyncio.wrap_future(self.batcher.submit((messages, deadline)))
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        return await asyncio.wait_for(future, timeout)
+
+    def stats(self) -> dict:
+        batches = self.batcher.batches
+        return {
+            "batches": batches,
+            "requests": self.batcher.items,
+            "mean_batch_size": self.batcher.items / batches if batches else 0.0,
+            "expired": self.expired,
+        }
+
+
+def get_deadline(config) -> Optional[float]:
+    """Lee el deadline absoluto de config["configurable"]["deadline"]."""
+    if not config:
+        return None
+    return (config.get("configurable") or {}).get("deadline")
@@ -0,0 +1,201 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+When a popular question reaches many graph runs at once (e.g. on a cold
+start, before any cache is warm), every run would otherwise call the
+retriever and the LLM on its own. ``SingleFlight`` lets concurrent calls
+with the same normalized key share one call:
+
+- The first caller (leader) starts the call. It runs in the leader's
+  thread, or in a thread of its own when the leader has a timeout.
+- Callers that arrive while it is in flight wait for the same result.
+- Errors of the call are raised to every waiter.
+- The shared call has no deadline of its own. Each caller's timeout, the
+  leader's included, only limits that caller's wait. A caller that gives up
+  does not end the call for the others.
+
+The key is dropped when the call finishes, so this is not a cache: a call
+that arrives afterwards runs again.
+
+``SINGLE_FLIGHT`` selects what is coalesced: ``off``, ``retrieval`` or
+``all`` (retrieval and LLM calls, the default).
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "all")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def coalesce_retrieval() -> bool:
+    return SINGLE_FLIGHT in ("retrieval", "all")
+
+
+def coalesce_llm() -> bool:
+    return SINGLE_FLIGHT == "all"
+
+
+# ====================================================================================
+# Keys
+# ====================================================================================
+
+def normalize_text(text: str) -> str:
+    """Forma normalizada de un texto: NFKC, sin mayúsculas y con espacios colapsados."""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+def request_key(*parts: Any) -> str:
+    """
+    Clave estable de una solicitud a partir de sus partes.
+
+    Los strings se normalizan con normalize_text; el resto se serializa a
+    JSON con claves ordenadas.
+
+    Returns:
+        Digest hexadecimal de la solicitud
+    """
+    def _normalize(value):
+        if isinstance(value, str):
+            return normalize_text(value)
+        if isinstance(value, dict):
+            return {k: _normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [_normalize(v) for v in value]
+        return value
+
+    payload = json.dumps(_normalize(list(parts)), sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def messages_key(messages: list) -> str:
+    """Clave de una entrada de chat model (tipo, contenido y tool calls de cada mensaje)."""
+    from langchain_core.messages import convert_to_messages
+
+    return request_key(*[
+        (m.type, m.content, getattr(m, "tool_calls", None) or [], getattr(m, "tool_call_id", None))
+        for m in convert_to_messages(messages)
+    ])
+
+
+# ====================================================================================
+# Single Flight
+# ====================================================================================
+
+class SingleFlight:
+    """
+    Comparte una sola llamada entre solicitudes concurrentes con la misma clave.
+
+    Args:
+        name: Nombre para las estadísticas
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._stats = {"calls": 0, "coalesced": 0, "errors": 0, "abandoned": 0}
+
+    def _count(self, field: str):
+        with self._lock:
+            self._stats[field] += 1
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        timeout: Optional[float] = None,
+        share: Optional[Callable[[Any], Any]] = None,
+    ) -> Any:
+        """
+        Ejecuta fn() o espera a la llamada en curso con la misma clave.
+
+        Args:
+            key: Clave normalizada de la solicitud
+            fn: Llamada a compartir (sin el deadline de ningún llamador)
+            timeout: Espera máxima de este llamador, sea o no el líder
+            share: Función aplicada al resultado que reciben los que esperan
+                (p. ej. copiar un mensaje mutable); por defecto, el mismo objeto
+
+        Returns:
+            Resultado de fn()
+
+        Raises:
+            TimeoutError: Si este llamador deja de esperar
+            Exception: La excepción de fn(), para todos los llamadores
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if leader:
+            call.set_running_or_notify_cancel()
+            if timeout is None:
+                self._run(key, fn, call)
+            else:
+                # El líder espera como los demás: su timeout no corta la llamada compartida
+                context = contextvars.copy_context()
+                threading.Thread(
+                    target=context.run, args=(self._run, key, fn, call),
+                    name=f"single-flight-{self.name}", daemon=True,
+                ).start()
+
+        try:
+            result = call.result(timeout=timeout)
+        except TimeoutError:
+            self._count("abandoned")
+            raise
+        return share(result) if share is not None and not leader else result
+
+    def _run(self, key: str, fn: Callable[[], Any], call: Future):
+        try:
+            result = fn()
+        except BaseException as exc:
+            self._finish(key, call)
+            self._count("errors")
+            call.set_exception(exc)
+            return
+        self._finish(key, call)
+        call.set_result(result)
+
+    def _finish(self, key: str, call: Future):
+        # Se retira antes de publicar el resultado: quien llegue después hace una llamada nueva
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de llamadas reales, solicitudes coalescidas, errores y abandonos."""
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
+
+
+# Instancias compartidas por el nodo de conversación y las tools
+retrieval_flight = SingleFlight("retrieval")
+llm_flight = SingleFlight("llm")
+
+
+def single_flight_stats() -> Optional[Dict[str, Dict[str, int]]]:
+    """Contadores de retrieval y LLM, o None si no se ha coalescido nada."""
+    stats = {"retrieval": retrieval_flight.stats(), "llm": llm_flight.stats()}
+    if not any(s["calls"] for s in stats.values()):
+        return None
+    return stats
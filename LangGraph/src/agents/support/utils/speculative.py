@@ -0,0 +1,238 @@
+"""
+Speculative retrieval for the Support Agent.
+
+The usual turn is ``conversation`` -> the LLM asks for
+``search_transformer_paper`` -> ``tools`` -> ``conversation``. In
+``prefetch`` mode the search for the user's message starts in a background
+thread while the first LLM call is running. If the model then requests a
+search whose query matches the user's message, the tool node uses the
+prefetched result instead of searching again. Otherwise the prefetch is
+discarded.
+
+In ``direct`` mode a keyword classifier recognises clearly in-domain
+questions. For those, ``conversation`` skips the first LLM call: it writes
+the tool call and its result into the history itself, then answers from
+the retrieved context.
+"""
+
+import logging
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+# "off", "prefetch" (retrieval en paralelo con el LLM) o "direct" (además, sin ida y vuelta al LLM)
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "off")
+# Similitud de Jaccard mínima entre la consulta de la tool y el mensaje del usuario
+SPECULATIVE_MATCH_THRESHOLD = float(os.getenv("SPECULATIVE_MATCH_THRESHOLD", "0.5"))
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "4"))
+# Máximo de prefetches pendientes (los más viejos se descartan)
+SPECULATIVE_MAX_PENDING = 256
+
+SEARCH_TOOL_NAME = "search_transformer_paper"
+
+# Términos que identifican una pregunta sobre el paper sin preguntarle al LLM
+DOMAIN_TERMS = {
+    "attention", "atención", "transformer", "transformers", "encoder", "decoder",
+    "encoders", "decoders", "multi-head", "multihead", "self-attention", "positional",
+    "encoding", "bleu", "wmt", "softmax", "embedding", "embeddings", "heads", "head",
+    "dropout", "warmup", "optimizer", "adam", "residual", "layernorm", "feed-forward",
+    "recurrent", "convolutional", "sequence", "translation", "paper",
+}
+DOMAIN_MIN_TERMS = 2
+
+_WORD_RE = re.compile(r"[\w-]+", re.UNICODE)
+_STOPWORDS = {
+    "the", "a", "an", "of", "in", "on", "to", "is", "are", "what", "how", "does",
+    "do", "and", "or", "for", "el", "la", "los", "las", "de", "en", "y", "que",
+    "qué", "cómo", "como", "es", "un", "una", "del", "se", "por", "con",
+}
+
+
+def _terms(text: str) -> set:
+    return {w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS}
+
+
+def query_similarity(a: str, b: str) -> float:
+    """Similitud de Jaccard entre los términos de dos consultas."""
+    ta, tb = _terms(a), _terms(b)
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+def is_in_domain(question: str) -> bool:
+    """Clasificador barato: ¿la pregunta es claramente sobre el paper?"""
+    return len(_terms(question) & DOMAIN_TERMS) >= DOMAIN_MIN_TERMS
+
+
+# ====================================================================================
+# Prefetcher
+# ====================================================================================
+
+class SpeculativeRetriever:
+    """
+    Lanza búsquedas especulativas y las entrega si el LLM pide la misma.
+
+    Args:
+        search_fn: Función de búsqueda (query -> contexto)
+        workers: Hilos para las búsquedas en segundo plano
+        match_threshold: Similitud mínima para reutilizar un prefetch
+    """
+
+    def __init__(self, search_fn: Callable[[str], str], workers: int = SPECULATIVE_WORKERS, match_threshold: float = SPECULATIVE_MATCH_THRESHOLD):
+        self.search_fn = search_fn
+        self.match_threshold = match_threshold
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculative")
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self._stats = {"started": 0, "hits": 0, "misses": 0, "discarded": 0}
+
+    def start(self, key: str, query: str) -> Future:
+        """Inicia la búsqueda especulativa de ``query`` bajo ``key``."""
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key][1]
+            future = self._executor.submit(self.search_fn, query)
+            self._pending[key] = (query, future)
+            self._stats["started"] += 1
+            while len(self._pending) > SPECULATIVE_MAX_PENDING:
+                _, (_, stale) = self._pending.popitem(last=False)
+                stale.cancel()
+                self._stats["discarded"] += 1
+        return future
+
+    def claim(self, key: str, query: str) -> Optional[str]:
+        """
+        Entrega el resultado del prefetch si corresponde a ``query``.
+
+        Returns:
+            Contexto prefetcheado, o None si no hay prefetch que coincida
+        """
+        with self._lock:
+            entry = self._pending.pop(key, None)
+        if entry is None:
+            return None
+        prefetched_query, future = entry
+        if query_similarity(query, prefetched_query) < self.match_threshold:
+            future.cancel()
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        try:
+            result = future.result()
+        except Exception:
+            logger.warning("prefetch fallido para %r; se busca de nuevo", query, exc_info=True)
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        with self._lock:
+            self._stats["hits"] += 1
+        return result
+
+    def discard(self, key: str):
+        """Descarta el prefetch de ``key`` si sigue pendiente."""
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is not None:
+                self._stats["discarded"] += 1
+        if entry is not None:
+            entry[1].cancel()
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de prefetches iniciados, aprovechados, fallidos y descartados."""
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending)}
+
+
+# Instancia compartida (lazy loading)
+_retriever: Optional[SpeculativeRetriever] = None
+
+
+def get_speculative_retriever() -> SpeculativeRetriever:
+    """Obtiene el prefetcher compartido."""
+    global _retriever
+    if _retriever is None:
+        from .tools import search_transformer_paper
+        _retriever = SpeculativeRetriever(lambda query: search_transformer_paper.invoke({"query": query}))
+    return _retriever
+
+
+def speculative_stats() -> Optional[Dict[str, int]]:
+    """Contadores del prefetcher, o None si no se ha usado."""
+    return _retriever.stats() if _retriever is not None else None
+
+
+# ====================================================================================
+# Graph Helpers
+# ====================================================================================
+
+def speculation_key(messages: List) -> Optional[str]:
+    """Id del último mensaje del usuario (clave del prefetch de este turno)."""
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.id
+    return None
+
+
+def direct_retrieval_messages(question: str, context: str) -> List:
+    """
+    Mensajes equivalentes a la ida y vuelta del LLM a la tool.
+
+    Returns:
+        [AIMessage con la tool call, ToolMessage con el resultado]
+    """
+    call_id = f"call_{uuid.uuid4().hex[:24]}"
+    return [
+        AIMessage(content="", tool_calls=[{"name": SEARCH_TOOL_NAME, "args": {"query": question}, "id": call_id}]),
+        ToolMessage(content=context, name=SEARCH_TOOL_NAME, tool_call_id=call_id),
+    ]
+
+
+def create_speculative_tool_node(tool_node):
+    """
+    Envuelve el ToolNode para servir búsquedas desde el prefetch.
+
+    Args:
+        tool_node: ToolNode con las tools del agente
+
+    Returns:
+        Función de nodo compatible con el grafo
+    """
+    def speculative_tools(state, config=None) -> dict:
+        messages = state["messages"]
+        last_message = messages[-1]
+        key = speculation_key(messages)
+        retriever = get_speculative_retriever()
+
+        served, remaining = [], []
+        for call in last_message.tool_calls:
+            result = None
+            if key is not None and call["name"] == SEARCH_TOOL_NAME and set(call["args"]) == {"query"}:
+                result = retriever.claim(key, call["args"]["query"])
+            if result is None:
+                remaining.append(call)
+            else:
+                served.append(ToolMessage(content=result, name=call["name"], tool_call_id=call["id"]))
+        if key is not None:
+            retriever.discard(key)
+
+        if remaining:
+            pending = AIMessage(content=last_message.content, tool_calls=remaining)
+            served.extend(tool_node.invoke({"messages": [pending]}, config)["messages"])
+        return {"messages": served}
+
+    return speculative_tools
@@ -4,23 +4,39 @@ State definition for the Support Agent.
 This module defines the state schema used throughout the agent's graph.
 """
 
-from langgraph.graph import MessagesState
+from typing import Annotated
 
+from langchain_core.messages import AnyMessage
+from typing_extensions import TypedDict
 
-class State(MessagesState):
+from .messages import messages_reducer
+
+
+class State(TypedDict):
     """
     Estado del agente de soporte RAG.
     
-    Hereda de MessagesState que proporciona:
-    - messages: Lista de mensajes en la conversación
+    - messages: Lista de mensajes en la conversación (mismo contrato que
+      MessagesState; con COMPACT_MESSAGES=1 se guarda como MessageLog
+      compacto con índice por id)
+    
+    Presupuesto del turno actual (se reinicia con cada mensaje del usuario):
+    - tool_calls: Tool calls pedidas por el LLM en el turno
+    - tokens: Tokens consumidos en el turno
+    - started_at: Inicio del turno (time.time())
+    - termination: Motivo por el que terminó el último turno
     
     Puedes extender este estado con campos adicionales según sea necesario:
     
     Example:
-        class State(MessagesState):
+        class SessionState(State):
             user_id: str  # ID del usuario
             session_id: str  # ID de la sesión
             metadata: dict  # Metadatos adicionales
     """
-    pass
+    messages: Annotated[list[AnyMessage], messages_reducer()]
+    tool_calls: int
+    tokens: int
+    started_at: float
+    termination: str
 
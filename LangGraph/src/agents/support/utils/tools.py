@@ -4,12 +4,28 @@ Tools for the Support Agent.
 This module defines the tools/functions that the agent can use.
 """
 
+import atexit
 import os
-from typing import List
-from langchain_openai import OpenAIEmbeddings
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
 from langchain_community.vectorstores import FAISS
 from langchain_core.tools import tool
 
+from agents.offline import OFFLINE, build_offline_vectorstore
+from retrieval.compression import compress_context
+from retrieval.embeddings import EMBEDDING_CACHE_SIZE, CachedEmbeddings, create_embeddings
+from retrieval.filters import AttributeIndex, filtered_search
+from retrieval.mutable import MutableIndex
+from retrieval.quantized import QuantizedIndex, quantized_search
+from retrieval.stores import chroma_filter, chroma_from_faiss, chroma_metadata_values, open_vector_store
+from .batching import BatchedEmbeddings
+from .prompt_cache import precompute_tool_schemas
+from .singleflight import coalesce_retrieval, request_key, retrieval_flight
+from .warmup import record_query
+
 
 # ====================================================================================
 # Configuration (inline para evitar dependencia circular)
@@ -18,6 +34,30 @@ from langchain_core.tools import tool
 DEFAULT_CACHE_PATH = "../../../../faiss_cache/transformer_paper"
 DEFAULT_RETRIEVER_K = 3
 
+# Backend del vectorstore: "faiss" (DEFAULT_CACHE_PATH) o "chroma" (CHROMA_PATH)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "faiss")
+CHROMA_PATH = os.getenv("CHROMA_PATH", "../../../../chroma_db")
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "transformer_paper")
+
+# Ventana para agrupar embeddings de consultas concurrentes (0 = deshabilitado)
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "0"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+
+# Búsqueda: "flat" (FAISS exacto), "binary" o "int8" (prefiltro cuantizado + rescoring float)
+RETRIEVER_MODE = os.getenv("RETRIEVER_MODE", "flat")
+RETRIEVER_RESCORE = int(os.getenv("RETRIEVER_RESCORE", "10"))
+
+# Resultados de la tool en cache (LRU por consulta normalizada, filtros y versión del índice;
+# 0 = deshabilitado)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "0"))
+
+# Compresión extractiva del contexto: "off", "bm25" o "embeddings"
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "off")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "400"))
+# La compresión por embeddings vuelve a pedir el vector de la consulta recién buscada:
+# si EMBEDDING_CACHE_SIZE es 0 se usa esta cache pequeña para no recalcularlo
+COMPRESSION_QUERY_CACHE_SIZE = 64
+
 
 # ====================================================================================
 # Vector Store Setup
@@ -26,6 +66,22 @@ DEFAULT_RETRIEVER_K = 3
 # Variables globales para lazy loading
 _vectorstore = None
 _retriever = None
+_attributes = None
+_quantized = None
+_mutable = None
+_chroma_values = None
+_offline_dir = None
+_quantized_lock = threading.Lock()
+
+
+def resolve_cache_path(cache_path: str = None) -> str:
+    """Resuelve la ruta del cache (relativa a este archivo si no es absoluta)."""
+    if cache_path is None:
+        cache_path = DEFAULT_CACHE_PATH
+    if not os.path.isabs(cache_path):
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        cache_path = os.path.normpath(os.path.join(current_dir, cache_path))
+    return cache_path
 
 
 def load_vectorstore(cache_path: str = None):
@@ -36,19 +92,27 @@ def load_vectorstore(cache_path: str = None):
         cache_path: Ruta al cache (opcional, usa config por defecto si no se especifica)
         
     Returns:
-        Vectorstore FAISS cargado
+        Vectorstore cargado (FAISS o Chroma según VECTOR_STORE_BACKEND)
         
     Raises:
         FileNotFoundError: Si no se encuentra la base de datos
+        ValueError: Si el índice se construyó con otro modelo de embeddings
     """
-    if cache_path is None:
-        cache_path = DEFAULT_CACHE_PATH
-    
+    if OFFLINE:
+        vectorstore = build_offline_vectorstore()
+        if VECTOR_STORE_BACKEND == "chroma":
+            vectorstore = chroma_from_faiss(vectorstore, tempfile.mkdtemp(prefix="chroma-"), CHROMA_COLLECTION)
+        return _with_query_batching(vectorstore)
+
+    if VECTOR_STORE_BACKEND == "chroma":
+        vectorstore = open_vector_store(
+            "chroma", resolve_cache_path(cache_path or CHROMA_PATH), create_embeddings(),
+            collection=CHROMA_COLLECTION,
+        )
+        return _with_query_batching(vectorstore)
+
     # Resolver ruta relativa
-    if not os.path.isabs(cache_path):
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        cache_path = os.path.join(current_dir, cache_path)
-        cache_path = os.path.normpath(cache_path)
+    cache_path = resolve_cache_path(cache_path)
     
     # Verificar si existe el directorio y el archivo index.faiss
     index_file = os.path.join(cache_path, "index.faiss")
@@ -58,15 +122,57 @@ def load_vectorstore(cache_path: str = None):
             "Por favor, ejecuta primero el notebook 05-rag.ipynb para crear la base de datos."
         )
     
-    vectorstore = FAISS.load_local(
-        cache_path, 
-        OpenAIEmbeddings(), 
-        allow_dangerous_deserialization=True
-    )
+    # En modo cuantizado los float32 solo se usan para rescoring y búsquedas filtradas:
+    # el índice se abre mapeado en memoria
+    # El modelo de EMBEDDING_BACKEND debe ser el que construyó el índice (si no, ValueError)
+    vectorstore = open_vector_store("faiss", cache_path, create_embeddings(), mmap=RETRIEVER_MODE != "flat")
     
+    return _with_query_batching(vectorstore)
+
+
+def _with_query_batching(vectorstore):
+    """Agrupa los embeddings de consultas concurrentes si está habilitado (con la cache LRU delante)."""
+    # FAISS expone embedding_function como atributo; Chroma lo guarda en _embedding_function
+    attribute = "embedding_function" if isinstance(vectorstore, FAISS) else "_embedding_function"
+    embeddings = getattr(vectorstore, attribute)
+    cached = embeddings if isinstance(embeddings, CachedEmbeddings) else None
+    inner = cached.embeddings if cached is not None else embeddings
+    if EMBEDDING_BATCH_WINDOW_MS > 0 and not isinstance(inner, BatchedEmbeddings):
+        inner = BatchedEmbeddings(
+            inner,
+            window_ms=EMBEDDING_BATCH_WINDOW_MS,
+            max_batch=EMBEDDING_MAX_BATCH,
+        )
+    # Un acierto de la cache no espera la ventana de batching
+    if cached is not None:
+        cached.embeddings = inner
+    elif EMBEDDING_CACHE_SIZE > 0:
+        cached = CachedEmbeddings(inner)
+    elif CONTEXT_COMPRESSION == "embeddings":
+        cached = CachedEmbeddings(inner, max_size=COMPRESSION_QUERY_CACHE_SIZE)
+    setattr(vectorstore, attribute, cached if cached is not None else inner)
     return vectorstore
 
 
+def enable_embedding_batching(window_ms: float, max_batch: int = None):
+    """
+    Habilita el micro-batching de embeddings de consultas.
+    
+    Debe llamarse antes de la primera búsqueda; si el vectorstore ya está
+    cargado, se envuelve su modelo de embeddings en ese momento.
+    
+    Args:
+        window_ms: Ventana de agrupación en milisegundos (0 deshabilita)
+        max_batch: Tamaño máximo de lote (opcional)
+    """
+    global EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_MAX_BATCH
+    EMBEDDING_BATCH_WINDOW_MS = window_ms
+    if max_batch is not None:
+        EMBEDDING_MAX_BATCH = max_batch
+    if _vectorstore is not None:
+        _with_query_batching(_vectorstore)
+
+
 def get_retriever(k: int = None):
     """
     Obtiene el retriever con lazy loading.
@@ -90,12 +196,183 @@ def get_retriever(k: int = None):
     return _retriever
 
 
+def get_chroma_values() -> Dict[str, List[str]]:
+    """
+    Obtiene los source y section guardados en Chroma con lazy loading.
+
+    Con ellos, los filtros de la tool se resuelven por subcadena igual que
+    con FAISS (ver chroma_filter).
+    """
+    global _chroma_values
+    if _chroma_values is None:
+        get_retriever()
+        _chroma_values = chroma_metadata_values(_vectorstore)
+    return _chroma_values
+
+
+def get_attribute_index() -> AttributeIndex:
+    """
+    Obtiene el índice de atributos (source/page/section) con lazy loading.
+    
+    Usa el attributes.npz precomputado por la ingesta si existe; si no, lo
+    construye a partir del docstore.
+    
+    Returns:
+        AttributeIndex del vectorstore cargado
+    """
+    global _attributes
+    if _attributes is None:
+        get_retriever()
+        if not OFFLINE:
+            _attributes = AttributeIndex.load(resolve_cache_path())
+        # Un attributes.npz de otra versión del índice no sirve
+        if _attributes is None or _attributes.size != _vectorstore.index.ntotal:
+            _attributes = AttributeIndex.from_vectorstore(_vectorstore)
+    return _attributes
+
+
+def _offline_quantized_dir() -> str:
+    """Directorio temporal del proceso para el índice cuantizado offline (se borra al salir)."""
+    global _offline_dir
+    if _offline_dir is None:
+        _offline_dir = tempfile.mkdtemp(prefix="quantized-")
+        atexit.register(shutil.rmtree, _offline_dir, True)
+    return _offline_dir
+
+
+def get_quantized_index() -> QuantizedIndex:
+    """
+    Obtiene el índice cuantizado de RETRIEVER_MODE con lazy loading.
+    
+    Usa <cache>/quantized si existe y corresponde al índice cargado; si no,
+    lo construye (en modo offline, en cada versión del índice y siempre en el
+    mismo directorio temporal del proceso). La versión nueva se escribe
+    aparte y se mueve a su sitio, sin tocar los archivos que las búsquedas
+    en curso tienen mapeados.
+    
+    Returns:
+        QuantizedIndex del vectorstore cargado
+    """
+    global _quantized
+    quantized = _quantized
+    if quantized is not None:
+        return quantized
+    # Dos solicitudes en frío no deben escribir los mismos archivos a la vez
+    with _quantized_lock:
+        if _quantized is not None:
+            return _quantized
+        get_retriever()
+        vectorstore = _vectorstore
+        if OFFLINE:
+            quantized = QuantizedIndex.build(vectorstore, _offline_quantized_dir(), RETRIEVER_MODE)
+        else:
+            directory = resolve_cache_path()
+            quantized = QuantizedIndex.load(directory)
+            if quantized is None or quantized.mode != RETRIEVER_MODE or quantized.ntotal != vectorstore.index.ntotal:
+                quantized = QuantizedIndex.build(vectorstore, directory, RETRIEVER_MODE)
+        # Si el índice cambió mientras se construía, el siguiente llamador reconstruye
+        if _vectorstore is vectorstore:
+            _quantized = quantized
+        return quantized
+        directory = resolve_cache_path()
+        _quantized = QuantizedIndex.load(directory)
+        if _quantized is None or _quantized.mode != RETRIEVER_MODE or _quantized.ntotal != _vectorstore.index.ntotal:
+            _quantized = QuantizedIndex.build(_vectorstore, directory, RETRIEVER_MODE)
+    return _quantized
+
+
+def get_mutable_index() -> MutableIndex:
+    """
+    Obtiene el índice con borrados/actualizaciones (solo FAISS) con lazy loading.
+    
+    Carga los tombstones guardados junto al índice. Tras un update o una
+    compactación, el retriever y los índices derivados se recrean con el
+    vectorstore nuevo.
+    
+    Returns:
+        MutableIndex del vectorstore cargado
+    """
+    global _mutable
+    if _mutable is None:
+        get_retriever()
+        _mutable = MutableIndex(_vectorstore, None if OFFLINE else resolve_cache_path(), get_attribute_index())
+        _mutable.on_swap(_use_vectorstore)
+    return _mutable
+
+
+def _use_vectorstore(vectorstore):
+    global _vectorstore, _retriever, _attributes, _quantized
+    _vectorstore = vectorstore
+    _retriever = vectorstore.as_retriever(search_kwargs={"k": DEFAULT_RETRIEVER_K})
+    _attributes = None
+    _quantized = None
+
+
+class _ResultCache:
+    """LRU de resultados de la tool (thread-safe)."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[str]:
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value: str):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+_results = _ResultCache(RETRIEVAL_CACHE_SIZE)
+
+
+def _index_version() -> int:
+    # Los borrados y actualizaciones del índice FAISS dejan obsoletas las entradas anteriores
+    return get_mutable_index().version if VECTOR_STORE_BACKEND == "faiss" else 0
+
+
+def retrieval_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Contadores de las caches de resultados y de embeddings de consultas."""
+    stats = {"results": _results.stats()}
+    embeddings = getattr(_vectorstore, "embeddings", None)
+    if isinstance(embeddings, CachedEmbeddings):
+        stats["query_embeddings"] = embeddings.stats()
+    return stats
+
+
 # ====================================================================================
 # Tool Definitions
 # ====================================================================================
 
 @tool
-def search_transformer_paper(query: str) -> str:
+def search_transformer_paper(
+    query: str,
+    source: Optional[str] = None,
+    page_from: Optional[int] = None,
+    page_to: Optional[int] = None,
+    section: Optional[str] = None,
+) -> str:
     """
     Busca información en el paper 'Attention Is All You Need'.
     
@@ -109,12 +386,60 @@ def search_transformer_paper(query: str) -> str:
     
     Args:
         query: La pregunta o consulta sobre el paper
+        source: (opcional) Documento, p. ej. "Paper.pdf"
+        page_from: (opcional) Primera página, numerada desde 0
+        page_to: (opcional) Última página, incluida
+        section: (opcional) Sección, p. ej. "3.2 Attention" o "Multi-Head"
         
     Returns:
         Contexto relevante del paper
     """
-    retriever = get_retriever()
-    docs = retriever.invoke(query)
+    filters = {"source": source, "page_from": page_from, "page_to": page_to, "section": section}
+    record_query(query, filters)
+    key = request_key("search", query, filters)
+    cache_key = (_index_version(), key)
+    context = _results.get(cache_key)
+    if context is not None:
+        return context
+    if coalesce_retrieval():
+        # Búsquedas idénticas concurrentes (misma consulta normalizada y filtros) comparten una sola
+        context = retrieval_flight.do(key, lambda: _search(query, filters))
+    else:
+        context = _search(query, filters)
+    _results.put(cache_key, context)
+    return context
+
+
+def _search(query: str, filters: dict) -> str:
+    filtered = any(value is not None for value in filters.values())
+    if VECTOR_STORE_BACKEND == "chroma":
+        get_retriever()
+        if filtered:
+            docs = _vectorstore.similarity_search(query, k=DEFAULT_RETRIEVER_K, filter=chroma_filter(**filters, values=get_chroma_values()))
+        else:
+            docs = _retriever.invoke(query)
+    else:
+        # Los documentos borrados (tombstones) se excluyen dentro de la búsqueda
+        vectorstore, attributes, deleted = get_mutable_index().snapshot()
+        deleted = deleted if deleted.any() else None
+        if RETRIEVER_MODE != "flat" and not filtered:
+            results = quantized_search(
+                vectorstore, get_quantized_index(), query, DEFAULT_RETRIEVER_K, RETRIEVER_RESCORE, deleted,
+            )
+            docs = [doc for doc, _ in results]
+        elif filtered or deleted is not None:
+            # El filtro se aplica dentro de la búsqueda (sin over-fetch)
+            results = filtered_search(vectorstore, attributes, query, DEFAULT_RETRIEVER_K, deleted, **filters)
+            docs = [doc for doc, _ in results]
+        else:
+            docs = get_retriever().invoke(query)
+    if filtered and not docs:
+        return "No se encontraron fragmentos que cumplan el filtro indicado."
+    if CONTEXT_COMPRESSION != "off":
+        return compress_context(
+            query, docs, CONTEXT_TOKEN_BUDGET,
+            scorer=CONTEXT_COMPRESSION, embeddings=_vectorstore.embeddings,
+        )
     context = "\n\n".join([doc.page_content for doc in docs])
     return context
 
@@ -126,6 +451,9 @@ def search_transformer_paper(query: str) -> str:
 # Lista de todas las tools disponibles
 TOOLS: List = [search_transformer_paper]
 
+# Esquemas JSON de las tools, serializados una sola vez (prefijo estable del prompt)
+TOOL_SCHEMAS: List[dict] = precompute_tool_schemas(TOOLS)
+
 
 def get_tools() -> List:
     """
@@ -136,3 +464,12 @@ def get_tools() -> List:
     """
     return TOOLS
 
+
+def get_tool_schemas() -> List[dict]:
+    """
+    Obtiene los esquemas precomputados de las tools.
+    
+    Returns:
+        Lista de esquemas en formato OpenAI
+    """
+    return TOOL_SCHEMAS
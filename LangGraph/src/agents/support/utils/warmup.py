@@ -0,0 +1,324 @@
+"""
+Startup warm-up for the support agent.
+
+After a deploy, the first requests would otherwise pay for loading the
+FAISS index, creating the LLM clients and filling empty caches. The
+warm-up runs these phases once, before the worker reports ready:
+
+1. ``graphs``: import and build the graphs (when run by the API).
+2. ``index``: load the vector store and its derived indexes, then read
+   the index files so their pages are in the OS page cache. This matters
+   most when they are memory-mapped.
+3. ``connections``: create the LLM clients and the shared HTTP pool. With
+   OpenAI, one ``GET /models`` opens the pooled connection.
+4. ``queries``: replay the top-N queries of the query log through the
+   search tool. This fills the query-embedding cache and the retrieval
+   cache when ``EMBEDDING_CACHE_SIZE`` / ``RETRIEVAL_CACHE_SIZE`` are set.
+   A log that cannot be read fails this phase instead of blocking startup.
+
+The search tool appends every query to ``QUERY_LOG_PATH`` (JSONL), when
+that path is set. ``WarmupStatus`` holds the phase, progress and duration.
+The API reports it on ``GET /ready``.
+
+Usage:
+    QUERY_LOG_PATH=queries.jsonl python -m agents.support.utils.warmup --top 50
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "")
+WARMUP_TOP_QUERIES = int(os.getenv("WARMUP_TOP_QUERIES", "50"))
+PREFAULT_CHUNK_BYTES = 1 << 20
+
+
+# ====================================================================================
+# Query Log
+# ====================================================================================
+
+_log_lock = threading.Lock()
+_log_file = None
+# Las consultas repetidas por el warm-up no se vuelven a registrar
+_replaying = threading.local()
+
+
+def record_query(query: str, filters: Optional[dict] = None):
+    """Agrega una consulta de la tool al log (no hace nada si QUERY_LOG_PATH está vacío)."""
+    global _log_file
+    if not QUERY_LOG_PATH or getattr(_replaying, "active", False):
+        return
+    entry = {"ts": time.time(), "query": query}
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+    if filters:
+        entry["filters"] = filters
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with _log_lock:
+        if _log_file is None:
+            _log_file = open(QUERY_LOG_PATH, "a", encoding="utf-8", buffering=1)
+        _log_file.write(line)
+
+
+def top_queries(path: str, n: int) -> List[Tuple[str, dict]]:
+    """
+    Consultas más frecuentes del log.
+
+    Las variantes que solo difieren en mayúsculas o espacios cuentan como
+    la misma consulta (se devuelve la primera forma vista).
+
+    Args:
+        path: Archivo JSONL del log
+        n: Número de consultas
+
+    Returns:
+        Lista de (consulta, filtros) de más a menos frecuente
+    """
+    from .singleflight import request_key
+
+    if not path or not os.path.exists(path):
+        return []
+    counts: Counter = Counter()
+    first_seen: Dict[str, Tuple[str, dict]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # línea a medio escribir
+            # Entradas que no son de record_query (otro formato o editadas a mano) se ignoran
+            if not isinstance(entry, dict) or not isinstance(entry.get("query"), str):
+                continue
+            filters = entry.get("filters") or {}
+            if not isinstance(filters, dict):
+                continue
+            key = request_key(entry["query"], filters)
+            counts[key] += 1
+            first_seen.setdefault(key, (entry["query"], filters))
+    return [first_seen[key] for key, _ in counts.most_common(n)]
+
+
+# ====================================================================================
+# Status
+# ====================================================================================
+
+PHASES = ("graphs", "index", "connections", "queries")
+
+
+class WarmupStatus:
+    """
+    Estado del warm-up para el endpoint de readiness.
+
+    Estados: "pending", "running", "ready", "failed" o "skipped" (sin warm-up).
+    Un warm-up fallido también cuenta como listo: el worker atiende en frío.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.state = "pending" if enabled else "skipped"
+        self.phase: Optional[str] = None
+        self.phases: Dict[str, float] = {}
+        self.queries_total = 0
+        self.queries_done = 0
+        self.query_errors = 0
+        self.prefaulted_bytes = 0
+        self.error: Optional[str] = None
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state in ("ready", "failed", "skipped")
+
+    def start(self):
+        with self._lock:
+            self.state = "running"
+            self._started = time.perf_counter()
+
+    def begin(self, phase: str):
+        with self._lock:
+            self.phase = phase
+
+    def end(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] = round(seconds, 3)
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._lock:
+            self._finished = time.perf_counter()
+            self.phase = None
+            self.state = "failed" if error is not None else "ready"
+            self.error = f"{type(error).__name__}: {error}" if error is not None else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            seconds = None
+            if self._started is not None:
+                seconds = round((self._finished or time.perf_counter()) - self._started, 3)
+            return {
+                "status": self.state,
+                "ready": self.state in ("ready", "failed", "skipped"),
+                "phase": self.phase,
+                "phases_done": len(self.phases),
+                "phases_total": len(PHASES),
+                "phase_seconds": dict(self.phases),
+                "queries": {"done": self.queries_done, "total": self.queries_total, "errors": self.query_errors},
+                "prefaulted_mb": round(self.prefaulted_bytes / 1e6, 1),
+                "seconds": seconds,
+                "error": self.error,
+            }
+
+
+# ====================================================================================
+# Phases
+# ====================================================================================
+
+def prefault(directory: str) -> int:
+    """
+    Lee los archivos de un directorio para dejarlos en la page cache del SO.
+
+    Returns:
+        Bytes leídos
+    """
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb", buffering=0) as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                while True:
+                    chunk = f.read(PREFAULT_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    total += len(chunk)
+    return total
+
+
+def warm_index(status: WarmupStatus):
+    """Carga el vectorstore y sus índices derivados y los pagina en memoria."""
+    from agents.offline import OFFLINE
+    from . import tools
+
+    tools.get_retriever()
+    if tools.VECTOR_STORE_BACKEND == "faiss":
+        tools.get_mutable_index()
+        tools.get_attribute_index()
+        if tools.RETRIEVER_MODE != "flat":
+            tools.get_quantized_index()
+    if not OFFLINE:
+        path = tools.CHROMA_PATH if tools.VECTOR_STORE_BACKEND == "chroma" else None
+        status.prefaulted_bytes = prefault(tools.resolve_cache_path(path))
+
+
+def warm_connections(status: WarmupStatus):
+    """Crea los clientes del LLM y abre la conexión del pool."""
+    from agents.offline import OFFLINE
+    from .backends import LLM_BACKEND
+    from .nodes import get_llm, get_llm_scheduler, get_llm_with_tools
+
+    get_llm_with_tools()
+    get_llm_scheduler()
+    if OFFLINE or LLM_BACKEND != "openai":
+        return
+    try:
+        get_llm().root_client.models.list()
+    except Exception:
+        # Sin permiso para /models la conexión igual queda abierta (o se abre en la primera llamada)
+        logger.warning("no se pudo precalentar la conexión con OpenAI", exc_info=True)
+
+
+def replay_queries(status: WarmupStatus, queries: List[Tuple[str, dict]]):
+    """Repite consultas del log por la tool de búsqueda (llena las caches)."""
+    from .tools import search_transformer_paper
+
+    status.queries_total = len(queries)
+    _replaying.active = True
+    try:
+        for query, filters in queries:
+            try:
+                search_transformer_paper.invoke({"query": query, **filters})
+            except Exception:
+                status.query_errors += 1
+                logger.warning("falló la consulta de warm-up %r", query, exc_info=True)
+            status.queries_done += 1
+    finally:
+        _replaying.active = False
+
+
+def run_warmup(
+    status: Optional[WarmupStatus] = None,
+    load_graphs: Optional[Callable[[], None]] = None,
+    query_log: Optional[str] = None,
+    top_n: int = WARMUP_TOP_QUERIES,
+) -> WarmupStatus:
+    """
+    Ejecuta todas las fases del warm-up.
+
+    Un error detiene el warm-up y queda en el estado (no se propaga): el
+    worker sigue pudiendo atender, aunque en frío.
+
+    Args:
+        status: Estado a actualizar (opcional)
+        load_graphs: Carga de los grafos (la pasa la API)
+        query_log: Log de consultas (por defecto QUERY_LOG_PATH)
+        top_n: Consultas a repetir
+
+    Returns:
+        WarmupStatus final
+    """
+    status = status or WarmupStatus()
+    query_log = query_log if query_log is not None else QUERY_LOG_PATH
+    phases = {
+        "graphs": load_graphs or (lambda: None),
+        "index": lambda: warm_index(status),
+        "connections": lambda: warm_connections(status),
+        # El log se lee dentro de la fase: si no se puede leer, el warm-up termina como failed
+        "queries": lambda: replay_queries(status, top_queries(query_log, top_n)),
+    }
+    status.start()
+    try:
+        for phase in PHASES:
+            status.begin(phase)
+            started = time.perf_counter()
+            phases[phase]()
+            status.end(phase, time.perf_counter() - started)
+    except Exception as exc:
+        logger.exception("falló el warm-up en la fase %s", status.phase)
+        status.finish(exc)
+    else:
+        status.finish()
+    return status
+
+
+# ====================================================================================
+# CLI
+# ====================================================================================
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Warm-up del agente de soporte")
+    parser.add_argument("--log", default=QUERY_LOG_PATH, help="Log de consultas (JSONL)")
+    parser.add_argument("--top", type=int, default=WARMUP_TOP_QUERIES)
+    args = parser.parse_args(argv)
+
+    status = run_warmup(query_log=args.log, top_n=args.top)
+    print(json.dumps(status.snapshot(), indent=2, ensure_ascii=False))
+
+    from .tools import retrieval_cache_stats
+    print(json.dumps(retrieval_cache_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
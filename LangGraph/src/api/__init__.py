@@ -0,0 +1,20 @@
+"""
+HTTP serving layer for the LangGraph agents.
+
+Usage:
+    uvicorn api.app:app --app-dir LangGraph/src --port 8000
+"""
+
+from .app import GraphApp, create_app
+from .registry import GraphRegistry, load_graph_specs
+from .scheduling import FairScheduler, Overloaded, Shed
+
+__all__ = [
+    "GraphApp",
+    "create_app",
+    "GraphRegistry",
+    "load_graph_specs",
+    "Overloaded",
+    "FairScheduler",
+    "Shed",
+]
@@ -0,0 +1,376 @@
+"""
+ASGI service for the graphs declared in ``langgraph.json``.
+
+Endpoints (one set per graph):
+
+- ``POST /{graph}/invoke``: ``{"input": {...}, "config": {...}, "deadline_ms": 30000}``
+- ``POST /{graph}/stream``: same body plus ``stream_mode``; NDJSON response
+- ``POST /{graph}/batch``: ``{"inputs": [...], "config": {...}, "deadline_ms": ...}``
+- ``GET /graphs`` and ``GET /health``
+- ``GET /ready``: 503 until the startup warm-up has finished, with its progress
+
+With ``API_WARMUP=1`` the worker loads the graphs, the index and the LLM
+clients at startup, and replays the most frequent logged queries (see
+``agents.support.utils.warmup``) before it reports ready.
+
+Executions share a process-wide pool of slots, handed out by weighted fair
+queuing across tenants (``x-tenant-id``) and graphs, with ``interactive``
+requests ahead of ``batch`` ones (``x-priority``; see ``api.scheduling``).
+Queues are bounded per graph and per tenant (429 when full). Every request
+runs under a deadline (504 when exceeded), and queued requests that can no
+longer meet it are shed before running (503). Concurrent query embeddings
+from the retrieval tools are micro-batched.
+
+Usage:
+    uvicorn api.app:app --app-dir LangGraph/src --port 8000
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections.abc import Sequence
+from typing import Any, Optional
+
+from .registry import GraphRegistry, load_graph_specs
+from .scheduling import DEFAULT_TENANT, PRIORITIES, FairScheduler, Overloaded, Shed
+
+
+logger = logging.getLogger(__name__)
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "8"))
+# Turnos de todo el proceso: por defecto ningún grafo ocupa más de la mitad
+DEFAULT_MAX_CONCURRENCY_TOTAL = int(os.getenv("API_MAX_CONCURRENCY_TOTAL", str(2 * DEFAULT_MAX_CONCURRENCY)))
+DEFAULT_MAX_QUEUE = int(os.getenv("API_MAX_QUEUE", "32"))
+DEFAULT_DEADLINE_MS = float(os.getenv("API_DEADLINE_MS", "60000"))
+DEFAULT_EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("API_EMBEDDING_BATCH_WINDOW_MS", "10"))
+DEFAULT_WARMUP = os.getenv("API_WARMUP", "0") == "1"
+MAX_BODY_BYTES = 1024 * 1024
+
+STREAM_MODES = ("values", "updates", "messages", "debug")
+
+
+# ====================================================================================
+# Serialization
+# ====================================================================================
+
+def _default(obj: Any):
+    """Serializa mensajes de LangChain, modelos pydantic y secuencias (p. ej. MessageLog)."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, (set, tuple, Sequence)):
+        return list(obj)
+    return str(obj)
+
+
+def _dumps(payload: Any) -> bytes:
+    return json.dumps(payload, default=_default, ensure_ascii=False).encode("utf-8")
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key.lower() == name:
+            return value.decode("latin-1").strip()
+    return None
+
+
+def _with_deadline(config: Optional[dict], expires_at: float) -> dict:
+    """
+    Propaga el deadline absoluto (time.time()) a los nodos vía config["configurable"].
+
+    Un deadline enviado por el cliente en el config solo puede acortar el del
+    servidor: se usa el menor de los dos (uno no numérico se ignora).
+    """
+    config = dict(config or {})
+    configurable = dict(config.get("configurable") or {})
+    client = configurable.get("deadline")
+    if isinstance(client, (int, float)) and not isinstance(client, bool):
+        expires_at = min(float(client), expires_at)
+    configurable["deadline"] = expires_at
+    config["configurable"] = configurable
+    return config
+
+
+class HTTPError(Exception):
+    """Error con código HTTP para devolver al cliente."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ====================================================================================
+# ASGI helpers
+# ====================================================================================
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+        if len(body) > MAX_BODY_BYTES:
+            raise HTTPError(413, "Cuerpo de la solicitud demasiado grande")
+    return body
+
+
+async def _send_json(send, status: int, payload: Any, headers: Optional[list] = None):
+    body = _dumps(payload)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), *(headers or [])],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# ====================================================================================
+# Application
+# ====================================================================================
+
+class GraphApp:
+    """
+    Aplicación ASGI que expone invoke/stream/batch para cada grafo.
+
+    Args:
+        registry: Registro de grafos
+        max_concurrency: Ejecuciones simultáneas por grafo
+        max_queue: Solicitudes en espera por grafo antes de responder 429
+        deadline_ms: Deadline por defecto de cada solicitud
+        embedding_batch_window_ms: Ventana de micro-batching de embeddings (0 = off)
+        warmup: Ejecutar el warm-up al arrancar (GET /ready responde 503 hasta que termine)
+        max_concurrency_total: Ejecuciones simultáneas en todo el proceso (compartidas por los grafos)
+    """
+
+    def __init__(
+        self,
+        registry: GraphRegistry,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        deadline_ms: float = DEFAULT_DEADLINE_MS,
+        embedding_batch_window_ms: float = DEFAULT_EMBEDDING_BATCH_WINDOW_MS,
+        warmup: bool = DEFAULT_WARMUP,
+        max_concurrency_total: int = DEFAULT_MAX_CONCURRENCY_TOTAL,
+    ):
+        self.registry = registry
+        self.deadline_ms = deadline_ms
+        self.scheduler = FairScheduler(registry.names(), max_concurrency_total, max_concurrency, max_queue)
+        self.embedding_batch_window_ms = embedding_batch_window_ms
+        self._batching_configured = False
+        self.warmup = warmup
+        self._warmup_status = None
+        self._warmup_task = None
+
+    @property
+    def warmup_status(self):
+        # Importar los agentes al crear la app fijaría su configuración (p. ej. AGENT_OFFLINE) demasiado pronto
+        if self._warmup_status is None:
+            from agents.support.utils.warmup import WarmupStatus
+            self._warmup_status = WarmupStatus(enabled=self.warmup)
+        return self._warmup_status
+
+    def _get_graph(self, name: str):
+        # El micro-batching se configura al cargar el primer grafo, no al importar
+        if not self._batching_configured:
+            self._batching_configured = True
+            if self.embedding_batch_window_ms > 0:
+                from agents.support.utils.tools import enable_embedding_batching
+                enable_embedding_batching(self.embedding_batch_window_ms)
+        return self.registry.get(name)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        try:
+            await self._route(scope, receive, send)
+        except HTTPError as exc:
+            await _send_json(send, exc.status, {"error": exc.message})
+        except Exception as exc:
+            # Un fallo del grafo (o un bug) también responde con el cuerpo JSON de error
+            logger.exception("Error no controlado en %s %s", scope["method"], scope["path"])
+            await _send_json(send, 500, {"error": f"Error interno: {type(exc).__name__}"})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.warmup_status.state == "pending":
+                    # En segundo plano: el worker ya responde /health y /ready mientras calienta
+                    self._warmup_task = asyncio.get_running_loop().run_in_executor(None, self._warmup)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _warmup(self):
+        from agents.support.utils.warmup import run_warmup
+
+        def load_graphs():
+            for name in self.registry.names():
+                self._get_graph(name)
+
+        run_warmup(self.warmup_status, load_graphs=load_graphs)
+
+    async def _route(self, scope, receive, send):
+        method = scope["method"]
+        parts = [part for part in scope["path"].split("/") if part]
+
+        if method == "GET" and parts == ["health"]:
+            await _send_json(send, 200, {"status": "ok", "loaded": self.registry.loaded()})
+            return
+        if method == "GET" and parts == ["ready"]:
+            await _send_json(send, 200 if self.warmup_status.ready else 503, self.warmup_status.snapshot())
+            return
+        if method == "GET" and parts == ["graphs"]:
+            from agents.support.utils.prompt_cache import prompt_cache_stats
+            from agents.support.utils.budget import termination_metrics
+            from agents.support.utils.memory import memory_stats
+            from agents.support.utils.speculative import speculative_stats
+            from agents.support.utils.singleflight import single_flight_stats
+            from agents.support.utils.tools import retrieval_cache_stats
+            stats = {name: self.scheduler.graph_stats(name) for name in self.registry.names()}
+            body = {
+                "graphs": stats,
+                "scheduler": self.scheduler.stats(),
+                "prompt_cache": prompt_cache_stats.snapshot(),
+                "terminations": termination_metrics.snapshot(),
+                "retrieval_cache": retrieval_cache_stats(),
+                "memory": memory_stats(),
+            }
+            if speculative_stats() is not None:
+                body["speculative"] = speculative_stats()
+            if single_flight_stats() is not None:
+                body["single_flight"] = single_flight_stats()
+            await _send_json(send, 200, body)
+            return
+
+        if len(parts) != 2 or parts[1] not in ("invoke", "stream", "batch"):
+            raise HTTPError(404, "Ruta no encontrada")
+        if method != "POST":
+            raise HTTPError(405, "Método no permitido")
+        graph_name, action = parts
+        if graph_name not in self.scheduler.graph_names:
+            raise HTTPError(404, f"Grafo desconocido: {graph_name}")
+
+        try:
+            request = json.loads(await _read_body(receive) or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPError(400, "JSON inválido")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "El cuerpo debe ser un objeto JSON")
+
+        try:
+            deadline = float(request.get("deadline_ms", self.deadline_ms)) / 1000
+        except (TypeError, ValueError):
+            raise HTTPError(400, "'deadline_ms' debe ser un número")
+        # Absoluto desde la llegada: el tiempo en cola se descuenta del que ven los nodos
+        expires_at = time.time() + deadline
+        tenant = _header(scope, b"x-tenant-id") or DEFAULT_TENANT
+        priority = _header(scope, b"x-priority") or ("batch" if action == "batch" else "interactive")
+        if priority not in PRIORITIES:
+            raise HTTPError(400, f"x-priority debe ser uno de {PRIORITIES}")
+        inputs = request.get("inputs")
+        cost = len(inputs) if action == "batch" and isinstance(inputs, list) and inputs else 1
+        started = time.monotonic()
+        slot = self.scheduler.slot(graph_name, tenant, priority, started + deadline, cost)
+
+        try:
+            if action == "stream":
+                await self._stream(graph_name, slot, request, deadline, expires_at, send)
+                return
+            async with asyncio.timeout(deadline):
+                async with slot as ticket:
+                    graph = self._get_graph(graph_name)
+                    if action == "invoke":
+                        result = await self._invoke(graph, request, expires_at)
+                    else:
+                        result = await self._batch(graph, request, expires_at)
+        except Overloaded:
+            raise HTTPError(429, f"Cola de '{graph_name}' llena para el tenant '{tenant}', reintenta más tarde")
+        except Shed:
+            raise HTTPError(503, f"Solicitud descartada en cola: no llegaría al deadline de {deadline * 1000:.0f} ms")
+        except TimeoutError:
+            raise HTTPError(504, f"Deadline de {deadline * 1000:.0f} ms excedido")
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+        timing = f"queue;dur={ticket.queue_ms:.1f}, total;dur={elapsed_ms:.1f}"
+        headers = [(b"server-timing", timing.encode())]
+        await _send_json(send, 200, {"output": result}, headers)
+
+    async def _invoke(self, graph, request: dict, expires_at: float):
+        if "input" not in request:
+            raise HTTPError(400, "Falta 'input'")
+        return await graph.ainvoke(request["input"], _with_deadline(request.get("config"), expires_at))
+
+    async def _batch(self, graph, request: dict, expires_at: float):
+        inputs = request.get("inputs")
+        if not isinstance(inputs, list):
+            raise HTTPError(400, "'inputs' debe ser una lista")
+        # Un lote ocupa un turno, pero respeta la concurrencia máxima del grafo
+        config = _with_deadline(request.get("config"), expires_at)
+        config.setdefault("max_concurrency", self.scheduler.graph_max_concurrency)
+        return await graph.abatch(inputs, config, return_exceptions=True)
+
+    async def _stream(self, graph_name, slot, request, deadline, expires_at, send):
+        if "input" not in request:
+            raise HTTPError(400, "Falta 'input'")
+        stream_mode = request.get("stream_mode", "updates")
+        if stream_mode not in STREAM_MODES:
+            raise HTTPError(400, f"stream_mode debe ser uno de {STREAM_MODES}")
+
+        headers_sent = False
+        try:
+            async with asyncio.timeout(deadline):
+                async with slot:
+                    graph = self._get_graph(graph_name)
+                    await send({
+                        "type": "http.response.start",
+                        "status": 200,
+                        "headers": [(b"content-type", b"application/x-ndjson")],
+                    })
+                    headers_sent = True
+                    config = _with_deadline(request.get("config"), expires_at)
+                    async for chunk in graph.astream(request["input"], config, stream_mode=stream_mode):
+                        await send({"type": "http.response.body", "body": _dumps(chunk) + b"\n", "more_body": True})
+        except TimeoutError:
+            if not headers_sent:
+                raise
+            # Las cabeceras ya salieron: el error va como última línea
+            error = {"error": f"Deadline de {deadline * 1000:.0f} ms excedido"}
+            await send({"type": "http.response.body", "body": _dumps(error) + b"\n", "more_body": True})
+        except Exception as exc:
+            if not headers_sent:
+                raise
+            logger.exception("Error no controlado en el stream de %s", graph_name)
+            error = {"error": f"Error interno: {type(exc).__name__}"}
+            await send({"type": "http.response.body", "body": _dumps(error) + b"\n", "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+
+def create_app(config_path: str = None, **kwargs) -> GraphApp:
+    """
+    Crea la aplicación ASGI a partir de langgraph.json.
+
+    Args:
+        config_path: Ruta a langgraph.json (opcional)
+        **kwargs: Parámetros de GraphApp (límites, deadline, batching)
+
+    Returns:
+        Aplicación ASGI
+    """
+    return GraphApp(GraphRegistry(load_graph_specs(config_path)), **kwargs)
+
+
+# Instancia por defecto para `uvicorn api.app:app`
+app = create_app()
@@ -0,0 +1,151 @@
+"""
+Load benchmark for the HTTP API.
+
+By default the app runs in-process (no server needed) with the offline
+model stand-ins, so the numbers measure the serving layer itself:
+
+    python -m api.bench --graph support --endpoint invoke --requests 200 --concurrency 32
+    AGENT_OFFLINE_LATENCY_MS=50 python -m api.bench --graph rag
+    python -m api.bench --graph support --endpoint batch --tenant bulk --priority batch
+
+Use ``--url http://localhost:8000`` to benchmark a running server instead.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from collections import Counter
+from typing import List, Optional
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+QUESTIONS = [
+    "What is multi-head attention?",
+    "How does positional encoding work?",
+    "What BLEU score did the Transformer get on WMT 2014 English-German?",
+    "Why use scaled dot-product attention?",
+    "How many layers does the encoder have?",
+    "What optimizer and learning rate schedule were used?",
+    "What is the role of residual dropout?",
+    "How does self-attention compare to recurrent layers?",
+]
+
+
+def _payload(endpoint: str, index: int, batch_size: int, deadline_ms: float) -> dict:
+    def message(i):
+        return {"messages": [["user", QUESTIONS[i % len(QUESTIONS)]]]}
+
+    if endpoint == "batch":
+        return {"inputs": [message(index + i) for i in range(batch_size)], "deadline_ms": deadline_ms}
+    return {"input": message(index), "deadline_ms": deadline_ms}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# ====================================================================================
+# Benchmark
+# ====================================================================================
+
+async def run_benchmark(
+    graph: str,
+    endpoint: str,
+    requests: int,
+    concurrency: int,
+    batch_size: int = 8,
+    deadline_ms: float = 60000,
+    url: Optional[str] = None,
+    tenant: Optional[str] = None,
+    priority: Optional[str] = None,
+) -> dict:
+    """
+    Lanza `requests` solicitudes con `concurrency` clientes simultáneos.
+
+    Returns:
+        Diccionario con throughput, percentiles de latencia y códigos HTTP
+    """
+    import httpx
+
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=None)
+    else:
+        os.environ.setdefault("AGENT_OFFLINE", "1")
+        from .app import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    counter = iter(range(requests))
+    headers = {}
+    if tenant:
+        headers["x-tenant-id"] = tenant
+    if priority:
+        headers["x-priority"] = priority
+
+    async def worker():
+        for index in counter:
+            payload = _payload(endpoint, index, batch_size, deadline_ms)
+            started = time.perf_counter()
+            response = await client.post(f"/{graph}/{endpoint}", json=payload, headers=headers)
+            await response.aread()
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    async with client:
+        # Una solicitud de calentamiento para cargar el grafo y el índice
+        await client.post(f"/{graph}/invoke", json=_payload("invoke", 0, 1, deadline_ms))
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    items_per_request = batch_size if endpoint == "batch" else 1
+    return {
+        "graph": graph,
+        "endpoint": endpoint,
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "throughput_rps": statuses[200] / elapsed if elapsed else 0.0,
+        "items_per_s": statuses[200] * items_per_request / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+        "mean_ms": statistics.fmean(latencies) if latencies else float("nan"),
+        "statuses": dict(statuses),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark de la API de grafos")
+    parser.add_argument("--graph", default="support")
+    parser.add_argument("--endpoint", choices=("invoke", "stream", "batch"), default="invoke")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--deadline-ms", type=float, default=60000)
+    parser.add_argument("--url", default=None, help="Servidor remoto (por defecto, in-process)")
+    parser.add_argument("--tenant", default=None, help="Cabecera x-tenant-id")
+    parser.add_argument("--priority", choices=("interactive", "batch"), default=None, help="Cabecera x-priority")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run_benchmark(
+        args.graph, args.endpoint, args.requests, args.concurrency,
+        batch_size=args.batch_size, deadline_ms=args.deadline_ms, url=args.url,
+        tenant=args.tenant, priority=args.priority,
+    ))
+    for key, value in result.items():
+        print(f"{key:>15}: {value:.2f}" if isinstance(value, float) else f"{key:>15}: {value}")
+
+
+if __name__ == "__main__":
+    main()
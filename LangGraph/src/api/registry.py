@@ -0,0 +1,102 @@
+"""
+Graph registry for the HTTP API.
+
+Reads the ``graphs`` section of ``langgraph.json`` and imports each graph
+lazily, the first time a request needs it.
+"""
+
+import importlib
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+SRC_PATH = Path(__file__).parent.parent
+DEFAULT_LANGGRAPH_CONFIG = SRC_PATH.parent / "langgraph.json"
+
+# Los grafos se importan como "agents.xxx", igual que en agent.py
+if str(SRC_PATH) not in sys.path:
+    sys.path.insert(0, str(SRC_PATH))
+
+
+# ====================================================================================
+# Spec Parsing
+# ====================================================================================
+
+def _spec_to_module(spec: str) -> tuple:
+    """
+    Convierte "./src/agents/support/agent.py:agent" en
+    ("agents.support.agent", "agent").
+    """
+    path, _, attribute = spec.partition(":")
+    path = os.path.normpath(path)
+    parts = Path(path).with_suffix("").parts
+    if parts and parts[0] == "src":
+        parts = parts[1:]
+    return ".".join(parts), attribute or "agent"
+
+
+def load_graph_specs(config_path: str = None) -> Dict[str, str]:
+    """
+    Lee los grafos declarados en langgraph.json.
+
+    Args:
+        config_path: Ruta a langgraph.json (opcional)
+
+    Returns:
+        Diccionario nombre -> "ruta.py:atributo"
+    """
+    config_path = config_path or DEFAULT_LANGGRAPH_CONFIG
+    with open(config_path, encoding="utf-8") as f:
+        config = json.load(f)
+    return dict(config.get("graphs", {}))
+
+
+# ====================================================================================
+# Registry
+# ====================================================================================
+
+class GraphRegistry:
+    """
+    Importa los grafos bajo demanda y los mantiene en memoria.
+
+    Args:
+        specs: Diccionario nombre -> "ruta.py:atributo" (como en langgraph.json)
+    """
+
+    def __init__(self, specs: Dict[str, str]):
+        self.specs = specs
+        self._graphs = {}
+        self._lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        return list(self.specs)
+
+    def loaded(self) -> List[str]:
+        return list(self._graphs)
+
+    def get(self, name: str):
+        """
+        Obtiene un grafo compilado por nombre.
+
+        Raises:
+            KeyError: Si el grafo no está declarado
+        """
+        graph = self._graphs.get(name)
+        if graph is not None:
+            return graph
+        if name not in self.specs:
+            raise KeyError(name)
+        with self._lock:
+            if name not in self._graphs:
+                module_name, attribute = _spec_to_module(self.specs[name])
+                module = importlib.import_module(module_name)
+                self._graphs[name] = getattr(module, attribute)
+            return self._graphs[name]
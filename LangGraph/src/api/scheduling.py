@@ -0,0 +1,401 @@
+"""
+Weighted fair scheduling of graph executions across tenants and graphs.
+
+All graphs share one process: the LLM client pool, the FAISS index and the
+CPU. The scheduler holds a process-wide pool of execution slots. Each
+request waits in the queue of its flow, which is its (tenant, graph) pair.
+
+- Weighted fair queuing (start-time fair queuing): each request gets a
+  virtual start tag ``max(V, finish of its flow)`` and advances its flow's
+  finish tag by ``cost / weight``. A free slot goes to the queued request
+  with the smallest start tag, so a tenant that floods ``support`` only
+  delays its own requests. A request that leaves the queue without running
+  (cancelled, timed out or shed) gives its share back to the flow. The weight of a flow is
+  ``tenant weight * graph weight`` (``API_TENANT_WEIGHTS``,
+  ``API_GRAPH_WEIGHTS``). A batch request costs one unit per input.
+- Priority classes: ``interactive`` is always served before ``batch``, and
+  batch executions may hold at most ``API_BATCH_MAX_SHARE`` of the slots.
+  Interactive arrivals therefore find a slot free without preempting
+  anything.
+- Bounded queues per graph (``API_MAX_QUEUE``) and per tenant
+  (``API_TENANT_MAX_QUEUE``): a full queue is rejected right away (429),
+  and it only rejects the tenant or graph that filled it.
+- Deadline shedding: when a slot frees up, a queued request whose deadline
+  has passed, or whose remaining time is below
+  ``API_SHED_SLACK * typical service time`` of its graph, is dropped
+  (503) before it makes any LLM call.
+
+Queue time is recorded per class, graph and tenant, and reported as
+p50/p95/p99 on ``GET /graphs``.
+
+The tenant comes from the ``x-tenant-id`` header and the class from
+``x-priority``. Without the header, ``/batch`` requests are ``batch`` and
+the others ``interactive``.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Iterable, List, Optional
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+PRIORITIES = ("interactive", "batch")
+DEFAULT_TENANT = "default"
+
+BATCH_MAX_SHARE = float(os.getenv("API_BATCH_MAX_SHARE", "0.5"))
+TENANT_MAX_QUEUE = int(os.getenv("API_TENANT_MAX_QUEUE", "32"))
+SHED_SLACK = float(os.getenv("API_SHED_SLACK", "0.5"))
+# Tiempo de servicio típico: mediana de las últimas ejecuciones (ignora la primera carga del grafo)
+SERVICE_TIME_SAMPLES = 64
+# Muestras de tiempo en cola por serie, y tenants con métricas (los menos recientes se descartan)
+QUEUE_TIME_SAMPLES = 1024
+MAX_TRACKED_TENANTS = 1024
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """
+    Interpreta pesos "nombre=peso" separados por comas ("acme=4,bulk=0.5").
+
+    Raises:
+        ValueError: Si un peso no es un número positivo
+    """
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        try:
+            weight = float(value)
+        except ValueError:
+            weight = 0.0
+        if weight <= 0:
+            raise ValueError(f"❌ Peso inválido {item!r}: usa nombre=peso con peso > 0")
+        weights[name.strip()] = weight
+    return weights
+
+
+TENANT_WEIGHTS = parse_weights(os.getenv("API_TENANT_WEIGHTS", ""))
+GRAPH_WEIGHTS = parse_weights(os.getenv("API_GRAPH_WEIGHTS", ""))
+
+
+class Overloaded(Exception):
+    """La cola del grafo está llena."""
+
+
+class Shed(Exception):
+    """La solicitud se descartó en cola porque ya no llegaría a su deadline."""
+
+
+# ====================================================================================
+# Metrics
+# ====================================================================================
+
+def _percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+
+class _Series:
+    """Contadores y tiempos en cola recientes de un grafo, tenant o clase."""
+
+    __slots__ = ("running", "waiting", "admitted", "rejected", "shed", "queue_ms")
+
+    def __init__(self):
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.queue_ms: Deque[float] = deque(maxlen=QUEUE_TIME_SAMPLES)
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.queue_ms)
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "queue_ms": {
+                "p50": _percentile(ordered, 0.50),
+                "p95": _percentile(ordered, 0.95),
+                "p99": _percentile(ordered, 0.99),
+            },
+        }
+
+
+# ====================================================================================
+# Scheduler
+# ====================================================================================
+
+class Ticket:
+    """Solicitud en cola o en ejecución."""
+
+    __slots__ = (
+        "graph", "tenant", "priority", "cost", "deadline",
+        "start_tag", "enqueued", "granted", "queue_ms", "future",
+    )
+
+    def __init__(self, graph: str, tenant: str, priority: str, cost: float, deadline: float):
+        self.graph = graph
+        self.tenant = tenant
+        self.priority = priority
+        self.cost = cost
+        self.deadline = deadline
+        self.start_tag = 0.0
+        self.enqueued = time.monotonic()
+        self.granted: Optional[float] = None
+        self.queue_ms = 0.0
+        self.future: Optional[asyncio.Future] = None
+
+
+class _Flow:
+    __slots__ = ("weight", "finish", "queue")
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.finish = 0.0
+        self.queue: Deque[Ticket] = deque()
+
+
+class FairScheduler:
+    """
+    Reparte los turnos de ejecución del proceso entre tenants y grafos.
+
+    Args:
+        graphs: Nombres de los grafos
+        max_concurrency: Ejecuciones simultáneas en todo el proceso
+        graph_max_concurrency: Ejecuciones simultáneas por grafo
+        max_queue: Solicitudes en espera por grafo antes de responder 429
+        tenant_max_queue: Solicitudes en espera por tenant antes de responder 429
+        batch_max_share: Fracción de los turnos que puede ocupar la clase batch
+        shed_slack: Descarta si el tiempo restante < shed_slack * tiempo de servicio típico (0 = solo vencidas)
+        tenant_weights: Peso por tenant (1 por defecto)
+        graph_weights: Peso por grafo (1 por defecto)
+    """
+
+    def __init__(
+        self,
+        graphs: Iterable[str],
+        max_concurrency: int,
+        graph_max_concurrency: int,
+        max_queue: int,
+        tenant_max_queue: int = TENANT_MAX_QUEUE,
+        batch_max_share: float = BATCH_MAX_SHARE,
+        shed_slack: float = SHED_SLACK,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        graph_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.graph_max_concurrency = graph_max_concurrency
+        self.max_queue = max_queue
+        self.tenant_max_queue = tenant_max_queue
+        self.batch_max_running = max(1, int(max_concurrency * batch_max_share))
+        self.shed_slack = shed_slack
+        self.tenant_weights = TENANT_WEIGHTS if tenant_weights is None else tenant_weights
+        self.graph_weights = GRAPH_WEIGHTS if graph_weights is None else graph_weights
+        self.graph_names = tuple(graphs)
+        self.running = 0
+        self._virtual = {priority: 0.0 for priority in PRIORITIES}
+        self._flows: Dict[str, Dict[tuple, _Flow]] = {priority: {} for priority in PRIORITIES}
+        self._service_samples: Dict[str, Deque[float]] = {}
+        self._service_ms: Dict[str, float] = {}
+        self._graphs = {name: _Series() for name in self.graph_names}
+        self._classes = {priority: _Series() for priority in PRIORITIES}
+        self._tenants: "OrderedDict[str, _Series]" = OrderedDict()
+
+    def _tenant(self, tenant: str) -> _Series:
+        series = self._tenants.get(tenant)
+        if series is None:
+            series = self._tenants[tenant] = _Series()
+            if len(self._tenants) > MAX_TRACKED_TENANTS:
+                # Solo se olvidan tenants sin solicitudes pendientes
+                for name, old in list(self._tenants.items()):
+                    if name != tenant and old.running == 0 and old.waiting == 0:
+                        del self._tenants[name]
+                        break
+        self._tenants.move_to_end(tenant)
+        return series
+
+    def _series(self, ticket: Ticket) -> tuple:
+        return self._graphs[ticket.graph], self._tenant(ticket.tenant), self._classes[ticket.priority]
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        graph: str,
+        tenant: str = DEFAULT_TENANT,
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        cost: float = 1.0,
+    ):
+        """
+        Reserva un turno de ejecución.
+
+        Args:
+            graph: Grafo a ejecutar
+            tenant: Tenant que hace la solicitud
+            priority: "interactive" o "batch"
+            deadline: Deadline absoluto (time.monotonic()), None = sin deadline
+            cost: Unidades de trabajo (entradas de un lote)
+
+        Returns:
+            Ticket con el tiempo que esperó en cola (queue_ms)
+
+        Raises:
+            Overloaded: Si la cola del grafo o del tenant está llena
+            Shed: Si la solicitud ya no llegaría a su deadline
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"❌ Prioridad desconocida {priority!r} (usa una de {PRIORITIES})")
+        ticket = Ticket(graph, tenant, priority, cost, deadline if deadline is not None else float("inf"))
+        self._enqueue(ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            # Timeout o cliente desconectado: libera el turno o la plaza en cola
+            if ticket.granted is not None:
+                self._release(ticket)
+            else:
+                self._withdraw(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def _enqueue(self, ticket: Ticket):
+        graph, tenant, _ = series = self._series(ticket)
+        if graph.waiting >= self.max_queue or tenant.waiting >= self.tenant_max_queue:
+            for item in series:
+                item.rejected += 1
+            raise Overloaded()
+
+        flows = self._flows[ticket.priority]
+        key = (ticket.tenant, ticket.graph)
+        flow = flows.get(key)
+        if flow is None:
+            weight = self.tenant_weights.get(ticket.tenant, 1.0) * self.graph_weights.get(ticket.graph, 1.0)
+            flow = flows[key] = _Flow(weight)
+        # Un flujo que estuvo inactivo no acumula crédito: empieza en el tiempo virtual actual
+        ticket.start_tag = max(self._virtual[ticket.priority], flow.finish)
+        flow.finish = ticket.start_tag + ticket.cost / flow.weight
+        flow.queue.append(ticket)
+        ticket.future = asyncio.get_running_loop().create_future()
+        for item in series:
+            item.waiting += 1
+        self._dispatch()
+
+    def _withdraw(self, ticket: Ticket):
+        flow = self._flows[ticket.priority].get((ticket.tenant, ticket.graph))
+        if flow is not None and ticket in flow.queue:
+            position = flow.queue.index(ticket)
+            del flow.queue[position]
+            self._refund(flow, ticket, position)
+            for item in self._series(ticket):
+                item.waiting -= 1
+
+    def _refund(self, flow: _Flow, ticket: Ticket, position: int):
+        """
+        Devuelve al flujo el avance de una solicitud que no llegó a ejecutarse.
+
+        Las solicitudes que iban detrás adelantan su etiqueta en ``cost / weight``,
+        sin bajar del tiempo virtual actual (un flujo no acumula crédito).
+
+        Args:
+            flow: Flujo de la solicitud
+            ticket: Solicitud retirada de la cola
+            position: Posición que ocupaba en la cola
+        """
+        share = ticket.cost / flow.weight
+        virtual = self._virtual[ticket.priority]
+        for index in range(position, len(flow.queue)):
+            queued = flow.queue[index]
+            queued.start_tag = max(virtual, queued.start_tag - share)
+        flow.finish = max(virtual, flow.finish - share)
+
+    def _release(self, ticket: Ticket):
+        service_ms = (time.monotonic() - ticket.granted) * 1000
+        if ticket.cost == 1:
+            samples = self._service_samples.setdefault(ticket.graph, deque(maxlen=SERVICE_TIME_SAMPLES))
+            samples.append(service_ms)
+            self._service_ms[ticket.graph] = sorted(samples)[len(samples) // 2]
+        self.running -= 1
+        for item in self._series(ticket):
+            item.running -= 1
+        self._dispatch()
+
+    def _should_shed(self, ticket: Ticket, now: float) -> bool:
+        remaining_ms = (ticket.deadline - now) * 1000
+        if remaining_ms <= 0:
+            return True
+        typical_ms = self._service_ms.get(ticket.graph)
+        # Solo solicitudes simples: el tiempo típico de un lote no es comparable
+        return ticket.cost == 1 and typical_ms is not None and remaining_ms < self.shed_slack * typical_ms
+
+    def _next(self, priority: str) -> Optional[_Flow]:
+        """Flujo de la clase con la menor etiqueta de inicio cuyo grafo tiene turnos libres."""
+        best = None
+        flows = self._flows[priority]
+        for key, flow in list(flows.items()):
+            if not flow.queue:
+                # Un flujo vacío se olvida en cuanto el tiempo virtual alcanza su etiqueta final
+                if flow.finish <= self._virtual[priority]:
+                    del flows[key]
+                continue
+            if self._graphs[key[1]].running >= self.graph_max_concurrency:
+                continue
+            if best is None or flow.queue[0].start_tag < best.queue[0].start_tag:
+                best = flow
+        return best
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self.running < self.max_concurrency:
+            flow = self._next("interactive")
+            if flow is None and self._classes["batch"].running < self.batch_max_running:
+                flow = self._next("batch")
+            if flow is None:
+                return
+            ticket = flow.queue.popleft()
+            series = self._series(ticket)
+            for item in series:
+                item.waiting -= 1
+            if ticket.future.done():
+                continue  # cancelado mientras esperaba
+            if self._should_shed(ticket, now):
+                self._refund(flow, ticket, 0)
+                for item in series:
+                    item.shed += 1
+                ticket.future.set_exception(Shed())
+                continue
+            self._virtual[ticket.priority] = ticket.start_tag
+            ticket.granted = now
+            ticket.queue_ms = (now - ticket.enqueued) * 1000
+            self.running += 1
+            for item in series:
+                item.running += 1
+                item.admitted += 1
+                item.queue_ms.append(ticket.queue_ms)
+            ticket.future.set_result(None)
+
+    def graph_stats(self, graph: str) -> dict:
+        stats = self._graphs[graph].snapshot()
+        stats.update(max_concurrency=self.graph_max_concurrency, max_queue=self.max_queue)
+        service_ms = self._service_ms.get(graph)
+        stats["service_ms"] = round(service_ms, 2) if service_ms is not None else None
+        return stats
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "batch_max_running": self.batch_max_running,
+            "classes": {name: series.snapshot() for name, series in self._classes.items()},
+            "tenants": {name: series.snapshot() for name, series in self._tenants.items()},
+        }
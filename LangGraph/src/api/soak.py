@@ -0,0 +1,219 @@
+"""
+Soak test for memory growth of the API workers.
+
+Runs the graphs for a long time (offline and in-process by default) and
+samples each worker's memory from ``GET /graphs``. After a warm-up, which
+excludes caches filling up, it fits a line to the USS (or RSS) of each
+worker. It exits with status 1 if any slope exceeds
+``--max-growth-mb-per-hour``, or if the share of 2xx responses is below
+``--min-success-rate`` (1.0 by default: any error fails the run, since a
+worker that only returns errors can look flat on memory).
+
+A fraction of the questions is made unique (``--unique-ratio``) so the
+bounded caches fill and evict, as they would in production.
+
+    python -m api.soak --graphs support rag --duration 7200 --interval 60
+    python -m api.soak --duration 600 --tracemalloc   # reportes por nodo y tool
+    python -m api.soak --url http://localhost:8000 --duration 14400
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from .bench import QUESTIONS
+
+
+# ====================================================================================
+# Growth
+# ====================================================================================
+
+def growth_rate(samples: List[Tuple[float, float]]) -> float:
+    """
+    Pendiente de mínimos cuadrados de (segundos, MB), en MB por hora.
+
+    Returns:
+        Pendiente (0.0 con menos de dos muestras)
+    """
+    if len(samples) < 2:
+        return 0.0
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_m = sum(m for _, m in samples) / n
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if variance == 0:
+        return 0.0
+    covariance = sum((t - mean_t) * (m - mean_m) for t, m in samples)
+    return covariance / variance * 3600
+
+
+def success_rate(statuses: Dict) -> float:
+    """
+    Fracción de solicitudes con respuesta 2xx.
+
+    Args:
+        statuses: Conteo por código HTTP ("error" para fallos de conexión)
+
+    Returns:
+        Fracción entre 0 y 1 (0.0 sin solicitudes)
+    """
+    total = sum(statuses.values())
+    ok = sum(count for status, count in statuses.items() if isinstance(status, int) and 200 <= status < 300)
+    return ok / total if total else 0.0
+
+
+def _memory_mb(memory: dict) -> Optional[float]:
+    return memory.get("uss_mb") if memory.get("uss_mb") is not None else memory.get("rss_mb")
+
+
+# ====================================================================================
+# Soak Test
+# ====================================================================================
+
+async def run_soak(
+    graphs: List[str],
+    duration: float,
+    interval: float,
+    concurrency: int,
+    warmup: float,
+    unique_ratio: float = 0.25,
+    url: Optional[str] = None,
+) -> dict:
+    """
+    Ejecuta los grafos durante `duration` segundos y muestrea la memoria.
+
+    Returns:
+        Diccionario con solicitudes, códigos HTTP, muestras y pendiente por worker
+    """
+    import httpx
+
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=None)
+    else:
+        os.environ.setdefault("AGENT_OFFLINE", "1")
+        from .app import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://soak", timeout=None)
+
+    statuses: Counter = Counter()
+    samples: Dict[int, List[Tuple[float, float]]] = {}
+    counter = iter(range(sys.maxsize))
+
+    def question(index: int) -> str:
+        text = QUESTIONS[index % len(QUESTIONS)]
+        # Consultas únicas: las caches se llenan y desalojan como en producción
+        return f"{text} (#{index})" if random.random() < unique_ratio else text
+
+    async def worker():
+        for index in counter:
+            if time.monotonic() >= deadline:
+                return
+            graph = graphs[index % len(graphs)]
+            payload = {"input": {"messages": [["user", question(index)]]}}
+            try:
+                response = await client.post(f"/{graph}/invoke", json=payload)
+                await response.aread()
+            except httpx.HTTPError:
+                statuses["error"] += 1
+                continue
+            statuses[response.status_code] += 1
+
+    async def sampler():
+        while True:
+            response = await client.get("/graphs")
+            memory = response.json().get("memory", {})
+            elapsed = time.monotonic() - started
+            value = _memory_mb(memory)
+            if value is not None:
+                samples.setdefault(memory["pid"], []).append((elapsed, value))
+            _print_sample(elapsed, sum(statuses.values()), memory)
+            if time.monotonic() + interval > deadline:
+                return
+            await asyncio.sleep(interval)
+
+    async with client:
+        # Una solicitud por grafo para cargar grafos e índice antes de medir
+        for graph in graphs:
+            await client.post(f"/{graph}/invoke", json={"input": {"messages": [["user", QUESTIONS[0]]]}})
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(sampler(), *(worker() for _ in range(concurrency)))
+
+    workers = {}
+    for pid, series in samples.items():
+        steady = [(t, m) for t, m in series if t >= warmup]
+        workers[pid] = {
+            "first_mb": series[0][1],
+            "last_mb": series[-1][1],
+            "samples": len(steady),
+            "growth_mb_per_hour": growth_rate(steady),
+        }
+    return {"requests": sum(statuses.values()), "statuses": dict(statuses), "workers": workers}
+
+
+def _print_sample(elapsed: float, requests: int, memory: dict):
+    print(
+        f"[{elapsed:8.0f}s] pid={memory.get('pid')} solicitudes={requests} "
+        f"rss={memory.get('rss_mb')} MB uss={memory.get('uss_mb')} MB",
+        flush=True,
+    )
+    diagnostics = memory.get("diagnostics")
+    if not diagnostics:
+        return
+    print(f"           traced={diagnostics['traced_mb']} MB")
+    for row in diagnostics["tags"]:
+        print(f"           {row['growth_kb']:>+10.1f} KB  {row['size_mb']:>8.3f} MB  {row['tag']}")
+    for row in diagnostics["sites"]:
+        print(f"           {row['growth_kb']:>+10.1f} KB  {row['site']}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Soak test de memoria de la API de grafos")
+    parser.add_argument("--graphs", nargs="+", default=["support", "rag"])
+    parser.add_argument("--duration", type=float, default=3600, help="Segundos")
+    parser.add_argument("--interval", type=float, default=60, help="Segundos entre muestras")
+    parser.add_argument("--warmup", type=float, default=None, help="Segundos excluidos del ajuste (por defecto 10%%)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--unique-ratio", type=float, default=0.25)
+    parser.add_argument("--max-growth-mb-per-hour", type=float, default=16.0)
+    parser.add_argument("--min-success-rate", type=float, default=1.0, help="Fracción mínima de respuestas 2xx")
+    parser.add_argument("--tracemalloc", action="store_true", help="Reportes por nodo y tool (in-process)")
+    parser.add_argument("--url", default=None, help="Servidor remoto (por defecto, in-process)")
+    args = parser.parse_args(argv)
+
+    if args.tracemalloc:
+        # Antes de importar los grafos: track_memory lee la variable al cargarlos
+        os.environ["AGENT_MEMORY_DIAGNOSTICS"] = "1"
+        os.environ.setdefault("AGENT_MEMORY_INTERVAL", str(args.interval))
+    warmup = args.warmup if args.warmup is not None else args.duration * 0.1
+
+    result = asyncio.run(run_soak(
+        args.graphs, args.duration, args.interval, args.concurrency, warmup,
+        unique_ratio=args.unique_ratio, url=args.url,
+    ))
+    rate = success_rate(result["statuses"])
+    print(f"solicitudes: {result['requests']} {result['statuses']} ({rate:.1%} 2xx)")
+    failed = False
+    for pid, worker in result["workers"].items():
+        rate = worker["growth_mb_per_hour"]
+        verdict = "OK" if rate <= args.max_growth_mb_per_hour else "CRECIMIENTO"
+        failed = failed or verdict != "OK"
+        print(
+            f"pid {pid}: {worker['first_mb']} -> {worker['last_mb']} MB, "
+            f"{rate:+.2f} MB/h en {worker['samples']} muestras [{verdict}]"
+        )
+    errors = rate < args.min_success_rate
+    if errors:
+        print(f"❌ Solo {rate:.1%} de las solicitudes respondieron 2xx (mínimo {args.min_success_rate:.1%})")
+    if failed:
+        print(f"❌ La memoria crece más de {args.max_growth_mb_per_hour} MB/h")
+    if failed or errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Batch structured-output extraction over message streams.
+
+Usage:
+    from extraction import read_messages, run_extraction
+
+    stats = run_extraction(read_messages("messages.jsonl"), "contacts.jsonl", concurrency=16)
+"""
+
+import importlib
+
+# Nombre -> submódulo (python -m extraction.pipeline no debe encontrarlo ya importado)
+_EXPORTS = {
+    "Extractor": "pipeline",
+    "can_pack": "pipeline",
+    "completed_ids": "pipeline",
+    "packed_schema": "pipeline",
+    "read_messages": "pipeline",
+    "run_extraction": "pipeline",
+    "ContactInfo": "schemas",
+}
+
+__all__ = [
+    "ContactInfo",
+    "Extractor",
+    "can_pack",
+    "completed_ids",
+    "packed_schema",
+    "read_messages",
+    "run_extraction",
+]
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
@@ -0,0 +1,359 @@
+"""
+Batch structured-output extraction.
+
+Runs ``llm.with_structured_output(schema)`` over a JSONL or Parquet stream
+of messages (``{"id": ..., "text": ...}`` per record):
+
+1. Packing: short messages are grouped, several per request, when the
+   schema is flat (scalar fields only). The model returns one indexed item
+   per message. Messages that the model leaves out of a packed answer are
+   retried one at a time.
+2. Extraction (thread pool): at most ``concurrency`` requests run at once,
+   and only a bounded number of packs are read ahead of them.
+3. Validation (process pool): raw outputs are validated against the
+   pydantic schema outside the threads that talk to the model.
+4. Output: results are appended to a JSONL file as soon as they are
+   validated. On restart, records that already have a successful result are
+   skipped. Failed records are retried, and the last line for an id wins.
+
+Usage:
+    python -m extraction.pipeline messages.jsonl --out contacts.jsonl
+    python -m extraction.pipeline messages.parquet --out contacts.jsonl --schema extraction.schemas:ContactInfo --concurrency 16 --pack-size 8
+"""
+
+import argparse
+import importlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional, Set, Tuple, Type
+
+from pydantic import BaseModel, Field, create_model
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+DEFAULT_MODEL = "openai:gpt-4o-mini"
+DEFAULT_SCHEMA = "extraction.schemas:ContactInfo"
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PACK_SIZE = 8
+DEFAULT_PACK_MAX_CHARS = 500  # solo se empaquetan mensajes cortos
+DEFAULT_VALIDATION_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+EXTRACTION_PROMPT = (
+    "Eres un asistente que extrae información de contacto de los mensajes. "
+    "Si no encuentras algún dato, usa valores por defecto razonables."
+)
+PACKED_PROMPT = (
+    EXTRACTION_PROMPT
+    + " Recibirás varios mensajes numerados: devuelve un elemento por mensaje"
+    " con su índice en el campo `index`."
+)
+
+_SCALAR_TYPES = (str, int, float, bool)
+
+
+# ====================================================================================
+# Input / Output
+# ====================================================================================
+
+def read_messages(path: str) -> Iterator[dict]:
+    """
+    Lee los mensajes de un JSONL o Parquet en streaming.
+
+    Args:
+        path: Archivo .jsonl o .parquet con los campos ``text`` e ``id``
+            (opcional; por defecto el número de registro)
+
+    Yields:
+        Diccionarios {"id": str, "text": str}
+
+    Raises:
+        ImportError: Si es Parquet y pyarrow no está instalado
+    """
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("❌ Leer Parquet requiere pyarrow: pip install pyarrow")
+        position = 0
+        for batch in pq.ParquetFile(path).iter_batches():
+            for row in batch.to_pylist():
+                yield {"id": str(row.get("id", position)), "text": row["text"]}
+                position += 1
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for position, line in enumerate(f):
+            if line.strip():
+                row = json.loads(line)
+                yield {"id": str(row.get("id", position)), "text": row["text"]}
+
+
+def completed_ids(out_path: str) -> Set[str]:
+    """Ids con resultado válido en una salida previa (una línea cortada se ignora)."""
+    done: Set[str] = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if row.get("ok"):
+                done.add(row["id"])
+    return done
+
+
+# ====================================================================================
+# Schemas
+# ====================================================================================
+
+def load_schema(path: str) -> Type[BaseModel]:
+    """Importa un schema con la forma "modulo:Clase"."""
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def can_pack(schema: Type[BaseModel]) -> bool:
+    """Un schema se puede empaquetar si todos sus campos son escalares."""
+    return "index" not in schema.model_fields and all(
+        field.annotation in _SCALAR_TYPES for field in schema.model_fields.values()
+    )
+
+
+def packed_schema(schema: Type[BaseModel]) -> Type[BaseModel]:
+    """Schema de lote: una lista de elementos del schema con su índice."""
+    item = create_model(
+        f"{schema.__name__}Item",
+        __base__=schema,
+        index=(int, Field(description="Índice del mensaje")),
+    )
+    return create_model(
+        f"{schema.__name__}Batch",
+        items=(List[item], Field(description="Un elemento por mensaje, en orden")),
+    )
+
+
+def _pack(records: Iterable[dict], pack_size: int, max_chars: int) -> Iterator[List[dict]]:
+    """Agrupa mensajes cortos consecutivos; los largos van solos."""
+    pack: List[dict] = []
+    for record in records:
+        if pack_size <= 1 or len(record["text"]) > max_chars:
+            yield [record]
+            continue
+        pack.append(record)
+        if len(pack) >= pack_size:
+            yield pack
+            pack = []
+    if pack:
+        yield pack
+
+
+# ====================================================================================
+# Extraction
+# ====================================================================================
+
+class Extractor:
+    """
+    Llama al LLM con structured output, empaquetando cuando se puede.
+
+    Args:
+        llm: Chat model de LangChain
+        schema: Schema pydantic de salida
+    """
+
+    def __init__(self, llm, schema: Type[BaseModel]):
+        # Salida cruda (dict): la validación se hace en el pool de procesos
+        self.single = llm.with_structured_output(schema.model_json_schema())
+        self.packed = llm.with_structured_output(packed_schema(schema).model_json_schema()) if can_pack(schema) else None
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def _one(self, record: dict) -> Tuple[str, Optional[dict], Optional[str]]:
+        self._count_request()
+        try:
+            return record["id"], self.single.invoke([("system", EXTRACTION_PROMPT), ("user", record["text"])]), None
+        except Exception as exc:
+            return record["id"], None, f"{type(exc).__name__}: {exc}"
+
+    def __call__(self, pack: List[dict]) -> List[Tuple[str, Optional[dict], Optional[str]]]:
+        """
+        Extrae un paquete de mensajes.
+
+        Returns:
+            Lista de (id, salida cruda, error) por mensaje
+        """
+        if len(pack) == 1 or self.packed is None:
+            return [self._one(record) for record in pack]
+
+        content = "\n\n".join(f"Mensaje {i}:\n{record['text']}" for i, record in enumerate(pack))
+        self._count_request()
+        try:
+            response = self.packed.invoke([("system", PACKED_PROMPT), ("user", content)]) or {}
+        except Exception:
+            response = {}
+        by_index = {}
+        for item in response.get("items") or []:
+            if isinstance(item, dict) and isinstance(item.get("index"), int):
+                by_index[item.pop("index")] = item
+
+        results = []
+        for i, record in enumerate(pack):
+            if i in by_index:
+                results.append((record["id"], by_index[i], None))
+            else:
+                # El modelo omitió el mensaje (o falló el lote): se reintenta solo
+                results.append(self._one(record))
+        return results
+
+
+# ====================================================================================
+# Validation (worker processes)
+# ====================================================================================
+
+_schema: Optional[Type[BaseModel]] = None
+
+
+def _init_validator(schema_path: str):
+    global _schema
+    _schema = load_schema(schema_path)
+
+
+def _validate(results: List[Tuple[str, Optional[dict], Optional[str]]]) -> List[dict]:
+    rows = []
+    for record_id, raw, error in results:
+        if error is None:
+            try:
+                rows.append({"id": record_id, "ok": True, "data": _schema.model_validate(raw).model_dump()})
+                continue
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+        rows.append({"id": record_id, "ok": False, "error": error})
+    return rows
+
+
+# ====================================================================================
+# Pipeline
+# ====================================================================================
+
+def run_extraction(
+    records: Iterable[dict],
+    out_path: str,
+    llm=None,
+    schema_path: str = DEFAULT_SCHEMA,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    pack_size: int = DEFAULT_PACK_SIZE,
+    pack_max_chars: int = DEFAULT_PACK_MAX_CHARS,
+    validation_workers: int = DEFAULT_VALIDATION_WORKERS,
+) -> dict:
+    """
+    Ejecuta la extracción y escribe los resultados de forma incremental.
+
+    Args:
+        records: Mensajes {"id", "text"} (p. ej. read_messages(path))
+        out_path: JSONL de salida (se continúa si ya existe)
+        llm: Chat model (por defecto create_chat_model(DEFAULT_MODEL, temperature=0))
+        schema_path: Schema como "modulo:Clase"
+        concurrency: Solicitudes simultáneas al LLM
+        pack_size: Mensajes cortos por solicitud (1 deshabilita el empaquetado)
+        pack_max_chars: Longitud máxima de un mensaje empaquetable
+        validation_workers: Procesos de validación
+
+    Returns:
+        Estadísticas: registros, válidos, fallidos, omitidos, solicitudes, segundos
+    """
+    if llm is None:
+        from agents.support.utils.backends import create_chat_model
+        llm = create_chat_model(DEFAULT_MODEL, temperature=0)
+
+    extractor = Extractor(llm, load_schema(schema_path))
+    done = completed_ids(out_path)
+    stats = {"records": 0, "ok": 0, "failed": 0, "skipped": 0}
+
+    def pending() -> Iterator[dict]:
+        for record in records:
+            if record["id"] in done:
+                stats["skipped"] += 1
+            else:
+                yield record
+
+    started = time.perf_counter()
+    packs = _pack(pending(), pack_size, pack_max_chars)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="extraction") as llm_pool, \
+            ProcessPoolExecutor(max_workers=validation_workers, initializer=_init_validator, initargs=(schema_path,)) as validators, \
+            open(out_path, "a", encoding="utf-8") as out:
+        extracting, validating = set(), set()
+        exhausted = False
+        while not exhausted or extracting or validating:
+            # Solo 2x concurrency paquetes en vuelo: la entrada se lee al ritmo del LLM
+            while not exhausted and len(extracting) < 2 * concurrency:
+                pack = next(packs, None)
+                if pack is None:
+                    exhausted = True
+                else:
+                    extracting.add(llm_pool.submit(extractor, pack))
+            finished, _ = wait(extracting | validating, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in extracting:
+                    extracting.discard(future)
+                    validating.add(validators.submit(_validate, future.result()))
+                    continue
+                validating.discard(future)
+                for row in future.result():
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    stats["records"] += 1
+                    stats["ok" if row["ok"] else "failed"] += 1
+                out.flush()
+
+    stats["requests"] = extractor.requests
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+# ====================================================================================
+# CLI
+# ====================================================================================
+
+def main(argv: Optional[List[str]] = None):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Extracción estructurada por lotes")
+    parser.add_argument("input", help="Mensajes en .jsonl o .parquet")
+    parser.add_argument("--out", required=True, help="JSONL de resultados (se reanuda si existe)")
+    parser.add_argument("--schema", default=DEFAULT_SCHEMA, help="Schema pydantic como modulo:Clase")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--pack-size", type=int, default=DEFAULT_PACK_SIZE)
+    parser.add_argument("--pack-max-chars", type=int, default=DEFAULT_PACK_MAX_CHARS)
+    parser.add_argument("--validation-workers", type=int, default=DEFAULT_VALIDATION_WORKERS)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        raise FileNotFoundError(f"❌ No se encontró el archivo de mensajes {args.input}")
+
+    stats = run_extraction(
+        read_messages(args.input),
+        args.out,
+        schema_path=args.schema,
+        concurrency=args.concurrency,
+        pack_size=args.pack_size,
+        pack_max_chars=args.pack_max_chars,
+        validation_workers=args.validation_workers,
+    )
+    print(f"✅ Resultados en {args.out}")
+    for key, value in stats.items():
+        print(f"   {key}: {value:.2f}" if isinstance(value, float) else f"   {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""
+Extraction schemas.
+
+Schemas used with ``extraction.pipeline`` must be importable at module level
+(``"extraction.schemas:ContactInfo"``) so the validation worker processes can
+load them.
+"""
+
+from pydantic import BaseModel, Field
+
+
+class ContactInfo(BaseModel):
+    """Información de contacto de una persona"""
+    name: str = Field(description="El nombre de la persona")
+    age: int = Field(description="La edad en años")
+    occupation: str = Field(description="Profesión u ocupación", default="No especificado")
+    interests: str = Field(description="Intereses o hobbies", default="No especificado")
+    tone: int = Field(description="Tono del mensaje (0=negativo, 100=positivo)", ge=0, le=100)
@@ -0,0 +1,60 @@
+"""
+Ingestion pipeline for the PDF corpora used by the agents.
+
+Usage:
+    from ingestion import discover_pdfs, build_index
+
+    vectorstore, stats = build_index(discover_pdfs(), workers=4)
+    vectorstore.save_local("faiss_cache/transformer_paper")
+
+    # Resumable, sharded jobs (see ingestion.jobs)
+    submit_job("jobs/papers", discover_pdfs())
+    run_worker("jobs/papers")
+    vectorstore, stats = merge_shards("jobs/papers")
+"""
+
+import importlib
+
+# Carga perezosa: pipeline y jobs se ejecutan con python -m y no deben importarse antes
+_EXPORTS = {
+    "MinHasher": "dedup",
+    "NearDuplicateFilter": "dedup",
+    "WorkQueue": "jobs",
+    "merge_shards": "jobs",
+    "run_worker": "jobs",
+    "run_workers": "jobs",
+    "submit_job": "jobs",
+    "build_index": "pipeline",
+    "default_embeddings": "pipeline",
+    "discover_pdfs": "pipeline",
+    "iter_chunks": "pipeline",
+    "parse_and_chunk": "pipeline",
+}
+
+__all__ = [
+    "MinHasher",
+    "NearDuplicateFilter",
+    "build_index",
+    "default_embeddings",
+    "discover_pdfs",
+    "iter_chunks",
+    "parse_and_chunk",
+    "WorkQueue",
+    "submit_job",
+    "run_worker",
+    "run_workers",
+    "merge_shards",
+]
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
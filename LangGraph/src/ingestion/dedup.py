@@ -0,0 +1,191 @@
+"""
+Near-duplicate chunk elimination with MinHash + LSH.
+
+Chunks are shingled into word n-grams, summarised with a MinHash signature
+and bucketed by LSH bands. A chunk whose estimated Jaccard similarity with
+an already kept chunk reaches the threshold is dropped, and a pointer from
+its id to the canonical chunk id is recorded.
+
+The filter is streaming: it plugs into ``build_index(chunk_filter=...)`` and
+only keeps the signatures of the chunks it has kept.
+"""
+
+import hashlib
+import json
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# ====================================================================================
+# MinHash
+# ====================================================================================
+
+def chunk_id(doc: Document) -> str:
+    """Id estable de un chunk: source:page:start_index."""
+    meta = doc.metadata
+    return f"{meta.get('source', '')}:{meta.get('page', '')}:{meta.get('start_index', meta.get('chunk_index', ''))}"
+
+
+def _shingles(text: str, size: int) -> List[str]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def _hash32(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Elige (bandas, filas) con bandas * filas <= num_perm cuyo umbral
+    aproximado (1/b)^(1/r) queda más cerca del umbral pedido.
+    """
+    best, best_error = (1, num_perm), float("inf")
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """
+    Calcula firmas MinHash con permutaciones (a*x + b) mod p.
+
+    Args:
+        num_perm: Número de permutaciones (longitud de la firma)
+        shingle_size: Palabras por shingle
+        seed: Semilla de las permutaciones
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, shingle_size: int = DEFAULT_SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # a < 2^31 y x < 2^32: a*x + b cabe en uint64 sin overflow
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """Firma MinHash del texto, o None si no tiene palabras."""
+        shingles = _shingles(text, self.shingle_size)
+        if not shingles:
+            return None
+        hashes = np.array([_hash32(s) for s in set(shingles)], dtype=np.uint64)
+        # Matriz (num_shingles, num_perm): mínimo por permutación
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+
+# ====================================================================================
+# LSH Filter
+# ====================================================================================
+
+class NearDuplicateFilter:
+    """
+    Filtro de chunks casi duplicados para el pipeline de ingesta.
+
+    Args:
+        threshold: Similitud de Jaccard estimada a partir de la cual un chunk
+            se considera duplicado
+        num_perm: Longitud de la firma MinHash
+        shingle_size: Palabras por shingle
+
+    Example:
+        dedup = NearDuplicateFilter(threshold=0.85)
+        vectorstore, stats = build_index(pdfs, chunk_filter=dedup)
+        print(dedup.report())
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = DEFAULT_NUM_PERM, shingle_size: int = DEFAULT_SHINGLE_SIZE):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self._buckets: List[Dict[bytes, List[str]]] = [defaultdict(list) for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self.duplicate_of: Dict[str, str] = {}
+        self.seen = 0
+        self.dropped_chars = 0
+        self.kept_chars = 0
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def _find_canonical(self, signature: np.ndarray, keys: List[bytes]) -> Optional[str]:
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(self._buckets[band].get(key, ()))
+        best, best_similarity = None, 0.0
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def __call__(self, batch: List[Document]) -> List[Document]:
+        """Devuelve los chunks del lote que no son duplicados."""
+        kept = []
+        for doc in batch:
+            self.seen += 1
+            doc_id = chunk_id(doc)
+            doc.metadata.setdefault("chunk_id", doc_id)
+            signature = self.hasher.signature(doc.page_content)
+            if signature is None:
+                kept.append(doc)
+                continue
+
+            keys = self._band_keys(signature)
+            canonical = self._find_canonical(signature, keys)
+            if canonical is not None:
+                self.duplicate_of[doc_id] = canonical
+                self.dropped_chars += len(doc.page_content)
+                continue
+
+            self._signatures[doc_id] = signature
+            for band, key in enumerate(keys):
+                self._buckets[band][key].append(doc_id)
+            self.kept_chars += len(doc.page_content)
+            kept.append(doc)
+        return kept
+
+    def report(self) -> dict:
+        """Resumen de la deduplicación (cuánto se redujo el índice)."""
+        dropped = len(self.duplicate_of)
+        return {
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows": self.rows,
+            "chunks_seen": self.seen,
+            "chunks_dropped": dropped,
+            "chunks_kept": self.seen - dropped,
+            "index_shrink": dropped / self.seen if self.seen else 0.0,
+            "chars_dropped": self.dropped_chars,
+        }
+
+    def save(self, path: str):
+        """Guarda el reporte y los punteros duplicado -> canónico en JSON."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"report": self.report(), "duplicate_of": self.duplicate_of}, f, ensure_ascii=False, indent=2)
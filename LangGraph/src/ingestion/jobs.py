@@ -0,0 +1,617 @@
+"""
+Resumable, sharded ingestion jobs coordinated through a sqlite work queue.
+
+``build_index`` runs a corpus in one go, so a crash loses all the
+embedding work done so far. A job instead splits the PDFs into work units
+of a few pages each, stored in ``<job>/queue.sqlite``:
+
+1. ``submit`` plans the units and records the chunking settings and the
+   embedding model. Submitting again with the same settings keeps the
+   progress.
+2. ``work`` runs worker processes, on one machine or on several sharing
+   the job directory. Each worker claims a unit with a lease, parses and
+   embeds it, and saves it as a FAISS shard under ``<job>/shards``. Only
+   then is the unit marked done, so done units survive any crash. The
+   lease is renewed after every embedding batch. A worker that dies stops
+   renewing, and its unit is reclaimed when the lease expires.
+3. ``merge`` combines the shards, in unit order, into the final index
+   (same files as ``ingestion.pipeline``). Chunks before the first heading
+   of a unit take the section of the previous unit. Optionally it drops
+   near duplicates. The result does not depend on how many workers ran.
+
+Workers only share the sqlite file, so the job directory must be on a
+filesystem with working file locks (a local disk, or a shared filesystem
+where sqlite locking works).
+
+Usage:
+    python -m ingestion.jobs submit ../jobs/papers ../pdfs --pages-per-unit 8
+    python -m ingestion.jobs work ../jobs/papers --processes 4
+    python -m ingestion.jobs status ../jobs/papers
+    python -m ingestion.jobs merge ../jobs/papers --out ../faiss_cache/transformer_paper
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import closing, contextmanager
+from multiprocessing import get_context
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from retrieval.embeddings import check_embedding_model, embedding_model_id, record_embedding_model
+from retrieval.filters import AttributeIndex
+from retrieval.reduction import parse_reduction, record_reduction, reduce_vectorstore
+from .pipeline import (
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_EMBED_BATCH,
+    _page_count,
+    default_embeddings,
+    discover_pdfs,
+    fill_sections,
+    parse_and_chunk,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+QUEUE_FILE = "queue.sqlite"
+SHARDS_DIR = "shards"
+
+DEFAULT_PAGES_PER_UNIT = 8
+DEFAULT_LEASE_SECONDS = 120.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+SQLITE_TIMEOUT = 30.0
+
+# Ajustes que deben coincidir al reanudar un job
+JOB_SETTINGS = ("chunk_size", "chunk_overlap", "pages_per_unit", "embedding_model")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    first_page INTEGER NOT NULL,
+    last_page INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER,
+    seconds REAL,
+    error TEXT,
+    UNIQUE (path, first_page)
+);
+CREATE INDEX IF NOT EXISTS units_state ON units (state, lease_until);
+"""
+
+
+# ====================================================================================
+# Queue
+# ====================================================================================
+
+class WorkQueue:
+    """
+    Cola de unidades de trabajo de un job (sqlite en el directorio del job).
+
+    Las unidades pasan por pending -> leased -> done. Una unidad leased con
+    el lease vencido vuelve a poder reclamarse; tras max_attempts fallos
+    queda en failed.
+
+    Args:
+        directory: Directorio del job
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, QUEUE_FILE)
+
+    @contextmanager
+    def _transaction(self, write: bool = True) -> Iterator[sqlite3.Connection]:
+        # Una conexión por operación: sirve igual entre hilos, procesos y máquinas
+        with closing(sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None)) as conn:
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def create(self, units: Sequence[tuple], settings: dict) -> int:
+        """
+        Crea la cola, o la reanuda si ya existe con los mismos ajustes.
+
+        Args:
+            units: Tuplas (path, first_page, last_page)
+            settings: Ajustes del job (chunking y modelo de embeddings)
+
+        Returns:
+            Unidades nuevas agregadas
+
+        Raises:
+            ValueError: Si el job existe con otros ajustes
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)) as conn:
+            conn.executescript(_SCHEMA)
+        with self._transaction() as conn:
+            recorded = dict(conn.execute("SELECT key, value FROM job"))
+            if recorded:
+                changed = [key for key in JOB_SETTINGS if recorded.get(key) != str(settings[key])]
+                if changed:
+                    raise ValueError(
+                        f"❌ El job en {self.directory} existe con otros ajustes ({', '.join(changed)})\n"
+                        "Usa otro directorio o los mismos ajustes para reanudarlo."
+                    )
+            else:
+                conn.executemany("INSERT INTO job VALUES (?, ?)", [(k, str(v)) for k, v in settings.items()])
+            before = conn.execute("SELECT COUNT(*) FROM units").fetchone()[0]
+            conn.executemany("INSERT OR IGNORE INTO units (path, first_page, last_page) VALUES (?, ?, ?)", units)
+            return conn.execute("SELECT COUNT(*) FROM units").fetchone()[0] - before
+
+    def settings(self) -> dict:
+        """Ajustes registrados del job."""
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"❌ No hay un job en {self.directory} (ejecuta primero `submit`)")
+        with self._transaction(write=False) as conn:
+            return dict(conn.execute("SELECT key, value FROM job"))
+
+    def claim(self, worker: str, lease: float, max_attempts: int) -> Optional[dict]:
+        """
+        Reclama la siguiente unidad libre (o con el lease vencido).
+
+        Returns:
+            Unidad (id, path, first_page, last_page, attempts) o None si no queda ninguna
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            # Un lease vencido en el último intento: el worker murió en cada uno
+            conn.execute(
+                "UPDATE units SET state = 'failed', lease_until = NULL, error = 'lease vencido' "
+                "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, max_attempts),
+            )
+            row = conn.execute(
+                "SELECT id, path, first_page, last_page, attempts FROM units "
+                "WHERE (state = 'pending' OR (state = 'leased' AND lease_until < ?)) AND attempts < ? "
+                "ORDER BY id LIMIT 1",
+                (now, max_attempts),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE units SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker, now + lease, row[0]),
+            )
+        return dict(zip(("id", "path", "first_page", "last_page", "attempts"), row))
+
+    def renew(self, unit_id: int, worker: str, lease: float) -> bool:
+        """Extiende el lease; False si la unidad ya no es de este worker."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE units SET lease_until = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+                (time.time() + lease, unit_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, unit_id: int, chunks: int, seconds: float):
+        """Marca la unidad como hecha (su shard ya está en disco)."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE units SET state = 'done', lease_until = NULL, chunks = ?, seconds = ?, error = NULL "
+                "WHERE id = ? AND state != 'done'",
+                (chunks, seconds, unit_id),
+            )
+
+    def fail(self, unit_id: int, worker: str, error: str, max_attempts: int):
+        """Libera la unidad tras un error (queda en failed si agotó los intentos)."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_until = NULL, error = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+                (max_attempts, error, unit_id, worker),
+            )
+
+    def retry_failed(self) -> int:
+        """Devuelve las unidades failed a pending con los intentos a cero."""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE units SET state = 'pending', attempts = 0, error = NULL WHERE state = 'failed'"
+            ).rowcount
+
+    def done_units(self) -> List[tuple]:
+        """(id, chunks) de las unidades hechas, en orden."""
+        with self._transaction(write=False) as conn:
+            return conn.execute("SELECT id, chunks FROM units WHERE state = 'done' ORDER BY id").fetchall()
+
+    def status(self) -> dict:
+        """Progreso del job: unidades por estado, chunks y throughput por worker."""
+        now = time.time()
+        with self._transaction(write=False) as conn:
+            states = dict(conn.execute("SELECT state, COUNT(*) FROM units GROUP BY state"))
+            expired = conn.execute(
+                "SELECT COUNT(*) FROM units WHERE state = 'leased' AND lease_until < ?", (now,)
+            ).fetchone()[0]
+            chunks, seconds = conn.execute(
+                "SELECT COALESCE(SUM(chunks), 0), COALESCE(SUM(seconds), 0) FROM units WHERE state = 'done'"
+            ).fetchone()
+            workers = {
+                worker: {"units": units, "chunks": worker_chunks, "seconds": round(worker_seconds, 1)}
+                for worker, units, worker_chunks, worker_seconds in conn.execute(
+                    "SELECT worker, COUNT(*), SUM(chunks), SUM(seconds) FROM units "
+                    "WHERE state = 'done' GROUP BY worker ORDER BY worker"
+                )
+            }
+            errors = conn.execute(
+                "SELECT path, first_page, error FROM units WHERE state = 'failed' ORDER BY id LIMIT 5"
+            ).fetchall()
+        total = sum(states.values())
+        return {
+            "units": total,
+            "states": states,
+            "expired_leases": expired,
+            "progress": states.get("done", 0) / total if total else 0.0,
+            "chunks": chunks,
+            "embedding_seconds": round(seconds, 1),
+            "workers": workers,
+            "failed": [{"path": path, "first_page": page, "error": error} for path, page, error in errors],
+        }
+
+
+# ====================================================================================
+# Submit
+# ====================================================================================
+
+def plan_units(pdfs: Sequence[str], pages_per_unit: int) -> List[tuple]:
+    """Divide los PDFs en unidades (path, first_page, last_page)."""
+    units = []
+    for path in pdfs:
+        total = _page_count(path)
+        for first in range(0, total, pages_per_unit):
+            units.append((os.path.abspath(path), first, min(first + pages_per_unit, total)))
+    return units
+
+
+def submit_job(
+    directory: str,
+    pdfs: Sequence[str],
+    embeddings=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    pages_per_unit: int = DEFAULT_PAGES_PER_UNIT,
+    embed_batch: int = DEFAULT_EMBED_BATCH,
+) -> int:
+    """
+    Crea (o reanuda) un job de ingesta.
+
+    Args:
+        directory: Directorio del job
+        pdfs: PDFs a ingerir (los nuevos se agregan a un job existente)
+        embeddings: Modelo de embeddings (por defecto default_embeddings())
+        chunk_size: Tamaño de chunk
+        chunk_overlap: Solapamiento entre chunks
+        pages_per_unit: Páginas por unidad de trabajo
+        embed_batch: Chunks por llamada de embeddings (y por renovación del lease)
+
+    Returns:
+        Unidades nuevas
+
+    Raises:
+        ValueError: Si el job existe con otros ajustes
+    """
+    embeddings = embeddings or default_embeddings()
+    settings = {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "pages_per_unit": pages_per_unit,
+        "embedding_model": embedding_model_id(embeddings),
+        "embed_batch": embed_batch,
+    }
+    return WorkQueue(directory).create(plan_units(pdfs, pages_per_unit), settings)
+
+
+# ====================================================================================
+# Workers
+# ====================================================================================
+
+def _shard_path(directory: str, unit_id: int) -> str:
+    return os.path.join(directory, SHARDS_DIR, f"unit-{unit_id:06d}")
+
+
+def _build_shard(queue: WorkQueue, unit: dict, worker: str, settings: dict, embeddings, lease: float) -> Optional[int]:
+    """Parsea, embebe y guarda una unidad; None si se perdió el lease a mitad."""
+    from langchain_community.vectorstores import FAISS
+
+    chunks = parse_and_chunk(
+        unit["path"], unit["first_page"], unit["last_page"],
+        int(settings["chunk_size"]), int(settings["chunk_overlap"]),
+    )
+    final = _shard_path(queue.directory, unit["id"])
+    if not chunks:
+        os.makedirs(final, exist_ok=True)  # unidad sin texto: shard vacío
+        return 0
+
+    batch_size = int(settings["embed_batch"])
+    texts = [text for text, _ in chunks]
+    vectors: List[List[float]] = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+        if not queue.renew(unit["id"], worker, lease):
+            return None
+
+    staging = f"{final}.{worker}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    vectorstore = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=[m for _, m in chunks])
+    vectorstore.save_local(staging)
+    record_embedding_model(staging, embeddings, vectorstore.index.d)
+    try:
+        os.rename(staging, final)
+    except OSError:
+        # Otro worker (con el lease vencido) ya lo guardó: el contenido es el mismo
+        shutil.rmtree(staging, ignore_errors=True)
+    return len(chunks)
+
+
+def run_worker(
+    directory: str,
+    worker: Optional[str] = None,
+    embeddings=None,
+    lease: float = DEFAULT_LEASE_SECONDS,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    max_units: Optional[int] = None,
+) -> dict:
+    """
+    Procesa unidades del job hasta que no quede ninguna libre.
+
+    Args:
+        directory: Directorio del job
+        worker: Nombre del worker (por defecto host:pid:aleatorio)
+        embeddings: Modelo de embeddings (por defecto default_embeddings())
+        lease: Segundos de lease de cada unidad (se renueva por lote)
+        max_attempts: Intentos por unidad antes de marcarla failed
+        max_units: Detenerse tras N unidades (opcional)
+
+    Returns:
+        Estadísticas del worker (unidades, chunks, errores, segundos)
+
+    Raises:
+        ValueError: Si el modelo de embeddings no es el del job
+    """
+    queue = WorkQueue(directory)
+    settings = queue.settings()
+    embeddings = embeddings or default_embeddings()
+    check_embedding_model(directory, embeddings, recorded=settings["embedding_model"])
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+    stats = {"worker": worker, "units": 0, "chunks": 0, "errors": 0, "lost_leases": 0}
+    started = time.perf_counter()
+    while max_units is None or stats["units"] < max_units:
+        unit = queue.claim(worker, lease, max_attempts)
+        if unit is None:
+            break
+        unit_started = time.perf_counter()
+        try:
+            chunks = _build_shard(queue, unit, worker, settings, embeddings, lease)
+        except Exception as exc:
+            logger.exception("falló la unidad %s (%s, páginas %s-%s)", unit["id"], unit["path"], unit["first_page"], unit["last_page"])
+            queue.fail(unit["id"], worker, f"{type(exc).__name__}: {exc}", max_attempts)
+            stats["errors"] += 1
+            continue
+        if chunks is None:
+            stats["lost_leases"] += 1
+            continue
+        queue.complete(unit["id"], chunks, time.perf_counter() - unit_started)
+        stats["units"] += 1
+        stats["chunks"] += chunks
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def _worker_main(directory: str, lease: float, max_attempts: int) -> dict:
+    return run_worker(directory, lease=lease, max_attempts=max_attempts)
+
+
+def run_workers(
+    directory: str,
+    processes: int = DEFAULT_PROCESSES,
+    lease: float = DEFAULT_LEASE_SECONDS,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+) -> List[dict]:
+    """
+    Lanza `processes` workers locales (cada uno con su modelo de embeddings).
+
+    Returns:
+        Estadísticas de cada worker
+    """
+    if processes <= 1:
+        return [run_worker(directory, lease=lease, max_attempts=max_attempts)]
+    # spawn: los workers no heredan clientes HTTP ni hilos del proceso padre
+    with get_context("spawn").Pool(processes) as pool:
+        return pool.starmap(_worker_main, [(directory, lease, max_attempts)] * processes)
+
+
+# ====================================================================================
+# Merge
+# ====================================================================================
+
+def merge_shards(directory: str, embeddings=None, chunk_filter=None):
+    """
+    Une los shards del job en un solo índice FAISS, en orden de unidad.
+
+    Args:
+        directory: Directorio del job
+        embeddings: Modelo de embeddings (por defecto default_embeddings())
+        chunk_filter: Callable opcional que recibe los Documents de un shard
+            y devuelve los que deben indexarse (p. ej. NearDuplicateFilter)
+
+    Returns:
+        Tupla (vectorstore FAISS o None si no hubo chunks, estadísticas)
+
+    Raises:
+        ValueError: Si quedan unidades sin terminar o un shard es de otro modelo
+    """
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    queue = WorkQueue(directory)
+    status = queue.status()
+    remaining = status["units"] - status["states"].get("done", 0)
+    if remaining:
+        raise ValueError(
+            f"❌ Quedan {remaining} de {status['units']} unidades sin terminar en {directory}\n"
+            "Ejecuta `work` hasta completarlas (o `retry` para las fallidas)."
+        )
+    embeddings = embeddings or default_embeddings()
+    check_embedding_model(directory, embeddings, recorded=queue.settings()["embedding_model"])
+    # Restos de workers que murieron (o perdieron el lease) mientras guardaban
+    for name in os.listdir(os.path.join(directory, SHARDS_DIR)):
+        if name.endswith(".tmp"):
+            shutil.rmtree(os.path.join(directory, SHARDS_DIR, name), ignore_errors=True)
+
+    index, docs = None, {}
+    sections: Dict[str, tuple] = {}
+    stats = {"shards": 0, "chunks": 0, "indexed": 0}
+    for unit_id, chunks in queue.done_units():
+        if not chunks:
+            continue
+        path = _shard_path(directory, unit_id)
+        check_embedding_model(path, embeddings)
+        shard = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+        shard_docs = [shard.docstore.search(shard.index_to_docstore_id[i]) for i in range(shard.index.ntotal)]
+        # Las unidades llegan en orden de documento: completa las secciones de los primeros chunks
+        fill_sections(((doc.page_content, doc.metadata) for doc in shard_docs), sections)
+        positions = np.arange(len(shard_docs))
+        if chunk_filter is not None:
+            kept = {id(doc) for doc in chunk_filter(shard_docs)}
+            positions = np.array([i for i, doc in enumerate(shard_docs) if id(doc) in kept], dtype=np.int64)
+        if index is None:
+            index = faiss.clone_index(shard.index)
+            index.reset()
+        if positions.size:
+            index.add(shard.index.reconstruct_batch(positions))
+            for i in positions:
+                docs[str(uuid.uuid4())] = shard_docs[int(i)]
+        stats["shards"] += 1
+        stats["chunks"] += len(shard_docs)
+        stats["indexed"] += int(positions.size)
+
+    if index is None or not docs:
+        return None, stats
+    ids = list(docs)
+    vectorstore = FAISS(embeddings, index, InMemoryDocstore(docs), dict(enumerate(ids)))
+    return vectorstore, stats
+
+
+def save_index(vectorstore, out: str):
+    """Guarda el índice con los mismos archivos que ingestion.pipeline."""
+    vectorstore.save_local(out)
+    AttributeIndex.from_vectorstore(vectorstore).save(out)
+    record_reduction(out, vectorstore.embedding_function)
+    record_embedding_model(out, vectorstore.embedding_function, vectorstore.index.d)
+
+
+# ====================================================================================
+# CLI
+# ====================================================================================
+
+def _print_status(status: dict):
+    print(f"   unidades: {status['units']} {status['states']} ({status['progress']:.1%})")
+    if status["expired_leases"]:
+        print(f"   leases vencidos (se reclamarán): {status['expired_leases']}")
+    print(f"   chunks: {status['chunks']} en {status['embedding_seconds']} s de trabajo")
+    for worker, row in status["workers"].items():
+        print(f"   {worker}: {row['units']} unidades, {row['chunks']} chunks, {row['seconds']} s")
+    for row in status["failed"]:
+        print(f"   ❌ {row['path']} (página {row['first_page']}): {row['error']}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Jobs de ingesta reanudables y por shards")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit = subparsers.add_parser("submit", help="Crea o reanuda un job")
+    submit.add_argument("job")
+    submit.add_argument("paths", nargs="*", help="PDFs o directorios (por defecto los papers del repo)")
+    submit.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    submit.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    submit.add_argument("--pages-per-unit", type=int, default=DEFAULT_PAGES_PER_UNIT)
+    submit.add_argument("--embed-batch", type=int, default=DEFAULT_EMBED_BATCH)
+
+    work = subparsers.add_parser("work", help="Procesa unidades hasta vaciar la cola")
+    work.add_argument("job")
+    work.add_argument("--processes", type=int, default=DEFAULT_PROCESSES)
+    work.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS)
+    work.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+
+    status = subparsers.add_parser("status", help="Progreso del job")
+    status.add_argument("job")
+
+    retry = subparsers.add_parser("retry", help="Reintenta las unidades fallidas")
+    retry.add_argument("job")
+
+    merge = subparsers.add_parser("merge", help="Une los shards en el índice final")
+    merge.add_argument("job")
+    merge.add_argument("--out", required=True, help="Directorio de salida del índice FAISS")
+    merge.add_argument("--dedup-threshold", type=float, default=0.0,
+                       help="Umbral de Jaccard para eliminar casi duplicados (0 = sin dedup)")
+    merge.add_argument("--reduce", default=None, metavar="METHOD:DIM",
+                       help="Reducir las dimensiones del índice (pca:256, truncate:512)")
+    args = parser.parse_args(argv)
+
+    if args.command == "submit":
+        pdfs = discover_pdfs(args.paths or None)
+        if not pdfs:
+            raise FileNotFoundError("❌ No se encontraron PDFs para ingerir")
+        added = submit_job(
+            args.job, pdfs, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+            pages_per_unit=args.pages_per_unit, embed_batch=args.embed_batch,
+        )
+        print(f"✅ Job en {args.job}: {added} unidades nuevas")
+        _print_status(WorkQueue(args.job).status())
+    elif args.command == "work":
+        started = time.perf_counter()
+        results = run_workers(args.job, args.processes, args.lease, args.max_attempts)
+        elapsed = time.perf_counter() - started
+        chunks = sum(r["chunks"] for r in results)
+        print(f"✅ {sum(r['units'] for r in results)} unidades, {chunks} chunks en {elapsed:.1f} s "
+              f"({chunks / elapsed if elapsed else 0.0:.1f} chunks/s con {len(results)} workers)")
+        _print_status(WorkQueue(args.job).status())
+    elif args.command == "status":
+        print(json.dumps(WorkQueue(args.job).status(), indent=2, ensure_ascii=False))
+    elif args.command == "retry":
+        print(f"✅ {WorkQueue(args.job).retry_failed()} unidades de vuelta a pending")
+    else:
+        dedup = None
+        if args.dedup_threshold > 0:
+            from .dedup import NearDuplicateFilter
+            dedup = NearDuplicateFilter(threshold=args.dedup_threshold)
+        vectorstore, stats = merge_shards(args.job, chunk_filter=dedup)
+        if vectorstore is None:
+            raise ValueError("❌ Los PDFs no contienen texto extraíble")
+        if args.reduce:
+            vectorstore = reduce_vectorstore(vectorstore, *parse_reduction(args.reduce))
+        save_index(vectorstore, args.out)
+        if dedup is not None:
+            dedup.save(os.path.join(args.out, "dedup.json"))
+        print(f"✅ Índice guardado en {args.out}")
+        for key, value in stats.items():
+            print(f"   {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+Streaming ingestion pipeline for the PDF corpora.
+
+Stages:
+
+1. Parse + chunk (process pool): each task opens one PDF, extracts a small
+   range of pages and splits every page as soon as it is read. Chunks keep
+   ``source``, ``page``, ``start_index`` (offset inside the page),
+   ``chunk_index`` and ``section`` (last numbered heading) metadata.
+   Chunks that come before the first heading of their range get their
+   section from the earlier ranges, in document order (``fill_sections``).
+2. Embed + index (main process): chunks arrive through a bounded queue and
+   are embedded in batches and appended to a FAISS index. The attribute
+   index used by filtered search is saved next to it.
+
+Only a bounded number of page ranges and chunk batches are in flight at any
+time, so memory stays flat as the corpus grows, while parsing scales with the
+number of cores.
+
+Usage:
+    python -m ingestion.pipeline --out ../faiss_cache/transformer_paper --workers 4
+    python -m ingestion.pipeline --out ../faiss_cache/transformer_paper --dedup-threshold 0.8
+    python -m ingestion.pipeline --out ../faiss_cache/transformer_paper_pca256 --reduce pca:256
+    python -m ingestion.pipeline --out ../chroma_db --backend chroma
+"""
+
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from retrieval.embeddings import record_embedding_model
+from retrieval.filters import SECTION_RE, AttributeIndex
+from retrieval.reduction import parse_reduction, record_reduction, reduce_vectorstore
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+DEFAULT_SOURCES = [
+    REPO_ROOT / "LangGraph" / "pdfs",
+    REPO_ROOT / "LangChain" / "Papers",
+]
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+DEFAULT_PAGES_PER_TASK = 4
+DEFAULT_EMBED_BATCH = 64
+DEFAULT_QUEUE_SIZE = 8  # lotes de chunks esperando embedding
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+
+# ====================================================================================
+# Discovery
+# ====================================================================================
+
+def discover_pdfs(paths: Optional[Iterable] = None) -> List[str]:
+    """
+    Lista los PDFs a ingerir.
+
+    Args:
+        paths: Archivos o directorios (por defecto LangGraph/pdfs y LangChain/Papers)
+
+    Returns:
+        Rutas de los PDFs, ordenadas
+    """
+    found = []
+    for path in paths or DEFAULT_SOURCES:
+        path = Path(path)
+        if path.is_dir():
+            found.extend(str(p) for p in path.rglob("*.pdf"))
+        elif path.suffix.lower() == ".pdf" and path.exists():
+            found.append(str(path))
+    return sorted(found)
+
+
+def _page_count(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+# ====================================================================================
+# Stage 1: Parse + Chunk (worker processes)
+# ====================================================================================
+
+def _headings(text: str) -> List[tuple]:
+    return [(m.start(), " ".join(m.group(0).split())) for m in SECTION_RE.finditer(text)]
+
+
+def fill_sections(chunks: Iterable[tuple], sections: Dict[str, tuple]):
+    """
+    Completa la sección de los chunks que no la traen, en orden de documento.
+
+    parse_and_chunk no conoce los encabezados de las páginas anteriores a su
+    rango: esos chunks toman el último encabezado anterior a su inicio que
+    aparece en el texto de los chunks previos del mismo source (por página y
+    start_index, así el solapamiento entre chunks no adelanta la sección).
+
+    Args:
+        chunks: Tuplas (texto, metadata) en orden de documento (la metadata se modifica)
+        sections: Estado por source entre llamadas: (sección actual, encabezados pendientes)
+    """
+    for text, metadata in chunks:
+        source = metadata.get("source", "")
+        page, start = metadata.get("page", 0), metadata.get("start_index", 0)
+        current, pending = sections.get(source, ("", []))
+        reached = [item for item in pending if item[:2] <= (page, start)]
+        if reached:
+            current = max(reached)[2]
+            pending = [item for item in pending if item[:2] > (page, start)]
+        if "section" not in metadata:
+            metadata["section"] = current
+        current = metadata["section"]
+        pending = sorted(set(pending) | {(page, start + position, heading) for position, heading in _headings(text)})
+        sections[source] = (current, pending)
+
+
+def parse_and_chunk(path: str, first_page: int, last_page: int, chunk_size: int, chunk_overlap: int) -> List[tuple]:
+    """
+    Extrae y divide en chunks un rango de páginas de un PDF.
+    
+    Cada chunk lleva la sección (último encabezado numerado antes de su
+    inicio) en metadata["section"]. Los chunks anteriores al primer
+    encabezado del rango no la llevan (salvo en la primera página): la
+    completa fill_sections con los rangos anteriores.
+
+    Se ejecuta en un proceso del pool, por eso devuelve tuplas simples
+    (texto, metadata) en lugar de Documents.
+
+    Args:
+        path: Ruta del PDF
+        first_page: Primera página (0-indexada, incluida)
+        last_page: Última página (excluida)
+        chunk_size: Tamaño de chunk en caracteres
+        chunk_overlap: Solapamiento entre chunks
+
+    Returns:
+        Lista de (texto, metadata)
+    """
+    from pypdf import PdfReader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    reader = PdfReader(path)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True,
+    )
+    chunks = []
+    section = "" if first_page == 0 else None
+    for page_number in range(first_page, min(last_page, len(reader.pages))):
+        text = reader.pages[page_number].extract_text() or ""
+        if not text.strip():
+            continue
+        headings = _headings(text)
+        page_doc = Document(page_content=text, metadata={"source": path, "page": page_number})
+        for chunk_index, chunk in enumerate(splitter.split_documents([page_doc])):
+            start = chunk.metadata["start_index"]
+            for position, heading in headings:
+                if position <= start:
+                    section = heading
+            chunk.metadata["chunk_index"] = chunk_index
+            if section is not None:
+                chunk.metadata["section"] = section
+            chunks.append((chunk.page_content, chunk.metadata))
+        if headings:
+            section = headings[-1][1]
+    return chunks
+
+
+def _page_ranges(pdfs: Sequence[str], pages_per_task: int) -> Iterator[tuple]:
+    for path in pdfs:
+        total = _page_count(path)
+        for first in range(0, total, pages_per_task):
+            yield path, first, min(first + pages_per_task, total)
+
+
+def iter_chunks(
+    pdfs: Sequence[str],
+    workers: int = DEFAULT_WORKERS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    pages_per_task: int = DEFAULT_PAGES_PER_TASK,
+) -> Iterator[Document]:
+    """
+    Genera los chunks de los PDFs a medida que los workers los producen.
+
+    Como máximo hay ``2 * workers`` rangos de páginas en vuelo. Los chunks
+    salen en orden de documento (los rangos ya terminados esperan al
+    anterior), para completar las secciones con fill_sections.
+
+    Yields:
+        Documents con metadata source/page/start_index/chunk_index/section
+    """
+    ranges = _page_ranges(pdfs, pages_per_task)
+    max_inflight = 2 * workers
+    sections: Dict[str, tuple] = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        inflight: Deque = deque()
+        exhausted = False
+        try:
+            while inflight or not exhausted:
+                while not exhausted and len(inflight) < max_inflight:
+                    task = next(ranges, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    inflight.append(pool.submit(parse_and_chunk, *task, chunk_size, chunk_overlap))
+                if not inflight:
+                    break
+                # El resto de los rangos en vuelo sigue parseándose mientras se espera el primero
+                chunks = inflight.popleft().result()
+                fill_sections(chunks, sections)
+                for text, metadata in chunks:
+                    yield Document(page_content=text, metadata=metadata)
+        finally:
+            # Si se cierra el generador antes de tiempo, el pool no espera a las tareas encoladas
+            for future in inflight:
+                future.cancel()
+
+
+# ====================================================================================
+# Stage 2: Embed + Index
+# ====================================================================================
+
+def default_embeddings():
+    """Embeddings de EMBEDDING_BACKEND (OpenAI por defecto, offline con AGENT_OFFLINE=1)."""
+    from agents.offline import OfflineEmbeddings
+    from retrieval.embeddings import create_embeddings, default_backend
+    if default_backend() == "offline":
+        return OfflineEmbeddings(latency_ms=0)
+    return create_embeddings()
+
+
+_DONE = object()
+
+
+def _batched(documents: Iterator[Document], size: int) -> Iterator[List[Document]]:
+    batch = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_index(
+    pdfs: Sequence[str],
+    embeddings=None,
+    workers: int = DEFAULT_WORKERS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    pages_per_task: int = DEFAULT_PAGES_PER_TASK,
+    embed_batch: int = DEFAULT_EMBED_BATCH,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    chunk_filter=None,
+):
+    """
+    Ejecuta el pipeline completo y devuelve el índice FAISS.
+
+    Un hilo productor lee los chunks del pool de procesos y los deja en una
+    cola acotada; el hilo principal los embebe por lotes y los añade al
+    índice. Si la cola se llena, el productor (y con él el pool) espera.
+
+    Args:
+        pdfs: PDFs a ingerir
+        embeddings: Modelo de embeddings (por defecto default_embeddings())
+        workers: Procesos de parsing
+        chunk_size: Tamaño de chunk
+        chunk_overlap: Solapamiento entre chunks
+        pages_per_task: Páginas por tarea del pool
+        embed_batch: Chunks por llamada de embeddings
+        queue_size: Lotes máximos esperando embedding
+        chunk_filter: Callable opcional que recibe un lote de Documents y
+            devuelve los que deben indexarse
+
+    Returns:
+        Tupla (vectorstore FAISS o None si no hubo chunks, estadísticas)
+    """
+    from langchain_community.vectorstores import FAISS
+
+    embeddings = embeddings or default_embeddings()
+    batches: queue.Queue = queue.Queue(maxsize=queue_size)
+    errors: List[BaseException] = []
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Espera sitio en la cola, salvo que el consumidor ya no vaya a leerla
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        chunks = iter_chunks(pdfs, workers, chunk_size, chunk_overlap, pages_per_task)
+        try:
+            for batch in _batched(chunks, embed_batch):
+                if not put(batch):
+                    break
+        except BaseException as exc:
+            errors.append(exc)
+        finally:
+            # Cierra el generador en este hilo: cancela las tareas pendientes y apaga el pool
+            chunks.close()
+            put(_DONE)
+
+    started = time.perf_counter()
+    producer = threading.Thread(target=produce, name="ingestion-producer", daemon=True)
+    producer.start()
+
+    vectorstore = None
+    stats = {"pdfs": len(pdfs), "chunks": 0, "indexed": 0, "embed_calls": 0}
+    try:
+        while True:
+            batch = batches.get()
+            if batch is _DONE:
+                break
+            stats["chunks"] += len(batch)
+            if chunk_filter is not None:
+                batch = chunk_filter(batch)
+                if not batch:
+                    continue
+            texts = [doc.page_content for doc in batch]
+            vectors = embeddings.embed_documents(texts)
+            stats["embed_calls"] += 1
+            stats["indexed"] += len(batch)
+            metadatas = [doc.metadata for doc in batch]
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+            else:
+                vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+    finally:
+        # Si el embedding falla, el productor deja de esperar sitio y cierra el pool
+        stop.set()
+        producer.join()
+    if errors:
+        raise errors[0]
+    stats["seconds"] = time.perf_counter() - started
+    return vectorstore, stats
+
+
+# ====================================================================================
+# CLI
+# ====================================================================================
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Ingesta paralela de PDFs a un índice FAISS")
+    parser.add_argument("paths", nargs="*", help="PDFs o directorios (por defecto los papers del repo)")
+    parser.add_argument("--out", required=True, help="Directorio de salida del índice FAISS o del store de Chroma")
+    parser.add_argument("--backend", choices=("faiss", "chroma"), default="faiss")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--pages-per-task", type=int, default=DEFAULT_PAGES_PER_TASK)
+    parser.add_argument("--embed-batch", type=int, default=DEFAULT_EMBED_BATCH)
+    parser.add_argument("--dedup-threshold", type=float, default=0.0,
+                        help="Umbral de Jaccard para eliminar casi duplicados (0 = sin dedup)")
+    parser.add_argument("--reduce", default=None, metavar="METHOD:DIM",
+                        help="Reducir las dimensiones del índice FAISS (pca:256, truncate:512)")
+    args = parser.parse_args(argv)
+
+    reduction = parse_reduction(args.reduce) if args.reduce else None
+    if reduction and args.backend == "chroma":
+        raise ValueError("❌ --reduce solo está disponible con el backend faiss")
+
+    pdfs = discover_pdfs(args.paths or None)
+    if not pdfs:
+        raise FileNotFoundError("❌ No se encontraron PDFs para ingerir")
+
+    dedup = None
+    if args.dedup_threshold > 0:
+        from .dedup import NearDuplicateFilter
+        dedup = NearDuplicateFilter(threshold=args.dedup_threshold)
+
+    vectorstore, stats = build_index(
+        pdfs,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        pages_per_task=args.pages_per_task,
+        embed_batch=args.embed_batch,
+        chunk_filter=dedup,
+    )
+    if vectorstore is None:
+        raise ValueError("❌ Los PDFs no contienen texto extraíble")
+    if reduction:
+        vectorstore = reduce_vectorstore(vectorstore, *reduction)
+    if args.backend == "chroma":
+        from retrieval.stores import chroma_from_faiss
+        chroma_from_faiss(vectorstore, args.out)
+        print(f"✅ Colección de Chroma guardada en {args.out}")
+    else:
+        vectorstore.save_local(args.out)
+        AttributeIndex.from_vectorstore(vectorstore).save(args.out)
+        record_reduction(args.out, vectorstore.embedding_function)
+        record_embedding_model(args.out, vectorstore.embedding_function, vectorstore.index.d)
+        print(f"✅ Índice guardado en {args.out} ({vectorstore.index.d} dimensiones)")
+    if dedup is not None:
+        dedup.save(os.path.join(args.out, "dedup.json"))
+        report = dedup.report()
+        print(f"   dedup: {report['chunks_dropped']} de {report['chunks_seen']} chunks eliminados "
+              f"({report['index_shrink']:.1%} menos índice)")
+    for key, value in stats.items():
+        print(f"   {key}: {value:.2f}" if isinstance(value, float) else f"   {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
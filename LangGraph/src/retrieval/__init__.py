@@ -0,0 +1,63 @@
+"""
+Retrieval utilities shared by the agents: vector-store backends and search
+over the indexes built by the ingestion pipeline.
+"""
+
+import importlib
+
+# Los submódulos también son CLIs (python -m ...): se importan al pedir un nombre,
+# no al importar el paquete, para que runpy no los encuentre ya cargados
+_EXPORTS = {
+    "compress_context": "compression",
+    "OnnxEmbeddings": "embeddings",
+    "check_embedding_model": "embeddings",
+    "create_embeddings": "embeddings",
+    "embedding_model_id": "embeddings",
+    "AttributeIndex": "filters",
+    "filtered_search": "filters",
+    "MutableIndex": "mutable",
+    "QuantizedIndex": "quantized",
+    "quantized_search": "quantized",
+    "recall_report": "quantized",
+    "DimensionReducer": "reduction",
+    "ReducedEmbeddings": "reduction",
+    "reduce_vectorstore": "reduction",
+    "BACKENDS": "stores",
+    "bulk_upsert": "stores",
+    "get_chroma_client": "stores",
+    "open_vector_store": "stores",
+}
+
+__all__ = [
+    "compress_context",
+    "OnnxEmbeddings",
+    "check_embedding_model",
+    "create_embeddings",
+    "embedding_model_id",
+    "AttributeIndex",
+    "filtered_search",
+    "MutableIndex",
+    "QuantizedIndex",
+    "quantized_search",
+    "recall_report",
+    "DimensionReducer",
+    "ReducedEmbeddings",
+    "reduce_vectorstore",
+    "BACKENDS",
+    "bulk_upsert",
+    "get_chroma_client",
+    "open_vector_store",
+]
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
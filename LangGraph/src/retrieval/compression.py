@@ -0,0 +1,217 @@
+"""
+Extractive compression of retrieved chunks.
+
+Retrieved chunks are split into sentences. Sentences repeated by the chunk
+overlap are dropped, and the rest are scored against the query with BM25
+or with embeddings. The best sentences are kept up to a token budget and
+emitted in their original order, so the LLM reads only the passages that
+matter for the question. Sentences with no match at all (score 0) are never
+added just to fill the budget.
+
+The ``embeddings`` scorer embeds every retrieved sentence on each search:
+one extra ``embed_documents`` call of a few dozen sentences, which is a
+full round trip (typically 100-300 ms) with a remote model. The query
+vector itself should come from a cache (see ``CachedEmbeddings``) since the
+search has just computed it. BM25 adds no model calls and is the default.
+"""
+
+import logging
+import math
+import re
+from collections import Counter
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+logger = logging.getLogger(__name__)
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+SCORERS = ("bm25", "embeddings")
+DEFAULT_TOKEN_BUDGET = 400
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\"'])")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+# Encoder de tiktoken (lazy loading); False si no está disponible
+_encoder = None
+
+
+# ====================================================================================
+# Sentences
+# ====================================================================================
+
+def count_tokens(text: str) -> int:
+    """Cuenta tokens con tiktoken (cl100k_base) o aproxima con 4 caracteres por token."""
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text))
+    return max(1, len(text) // 4)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Divide un chunk en oraciones (los saltos de línea del PDF se colapsan)."""
+    text = _SPACE_RE.sub(" ", text).strip()
+    return [s for s in _SENTENCE_RE.split(text) if s]
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def unique_sentences(docs: Sequence[Document]) -> List[Tuple[int, int, str]]:
+    """
+    Oraciones de los chunks sin las repetidas por el solapamiento.
+
+    Los bordes de un chunk suelen ser fragmentos de una oración completa del
+    chunk vecino: una oración contenida en otra ya vista también se descarta.
+
+    Returns:
+        Lista de (índice de documento, posición, oración)
+    """
+    candidates = []
+    for doc_index, doc in enumerate(docs):
+        for position, sentence in enumerate(split_sentences(doc.page_content)):
+            key = " ".join(_words(sentence))
+            if key:
+                candidates.append((doc_index, position, sentence, key))
+
+    # Las más largas primero: un fragmento se compara contra la oración completa
+    kept, keys = [], []
+    for item in sorted(candidates, key=lambda c: -len(c[3])):
+        if any(item[3] in seen for seen in keys):
+            continue
+        keys.append(item[3])
+        kept.append(item[:3])
+    kept.sort(key=lambda c: (c[0], c[1]))
+    return kept
+
+
+# ====================================================================================
+# Scoring
+# ====================================================================================
+
+def bm25_scores(query: str, sentences: Sequence[str]) -> np.ndarray:
+    """
+    Puntúa las oraciones contra la consulta con BM25.
+
+    Las oraciones recuperadas hacen de corpus para el idf.
+    """
+    tokenized = [_words(s) for s in sentences]
+    if not tokenized:
+        return np.zeros(0)
+    avg_length = sum(len(t) for t in tokenized) / len(tokenized) or 1.0
+    document_frequency = Counter(term for t in tokenized for term in set(t))
+    n = len(tokenized)
+
+    scores = np.zeros(n)
+    for term in set(_words(query)):
+        df = document_frequency.get(term, 0)
+        if not df:
+            continue
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        for i, tokens in enumerate(tokenized):
+            tf = tokens.count(term)
+            if tf:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / avg_length)
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+    return scores
+
+
+def embedding_scores(embeddings, query: str, sentences: Sequence[str]) -> np.ndarray:
+    """
+    Similitud coseno entre la consulta y cada oración.
+
+    Las oraciones se embeben en una sola llamada batch (una llamada al modelo
+    por búsqueda); el vector de la consulta se pide con ``embed_query``, que
+    con ``CachedEmbeddings`` delante es un acierto de la cache.
+    """
+    if not sentences:
+        return np.zeros(0)
+    matrix = np.array(embeddings.embed_documents(list(sentences)), dtype=np.float32)
+    vector = np.array(embeddings.embed_query(query), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(vector) or 1.0)
+    return (matrix @ vector) / np.where(norms == 0, 1.0, norms)
+
+
+# ====================================================================================
+# Compression
+# ====================================================================================
+
+def compress_context(
+    query: str,
+    docs: Sequence[Document],
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    scorer: str = "bm25",
+    embeddings=None,
+) -> str:
+    """
+    Comprime los chunks recuperados a las oraciones más relevantes.
+
+    Args:
+        query: Consulta de la búsqueda
+        docs: Chunks recuperados
+        token_budget: Máximo de tokens del contexto resultante
+        scorer: "bm25" o "embeddings"
+        embeddings: Modelo de embeddings (requerido con scorer="embeddings");
+            añade una llamada ``embed_documents`` por búsqueda
+
+    Returns:
+        Contexto comprimido: oraciones en su orden original, un párrafo por chunk;
+        solo entran oraciones con puntuación positiva
+
+    Raises:
+        ValueError: Si el scorer no es válido
+    """
+    if scorer not in SCORERS:
+        raise ValueError(f"Scorer desconocido: {scorer!r} (usa uno de {SCORERS})")
+
+    sentences = unique_sentences(docs)
+    texts = [s for _, _, s in sentences]
+    if scorer == "embeddings" and embeddings is not None:
+        scores = embedding_scores(embeddings, query, texts)
+    else:
+        scores = bm25_scores(query, texts)
+
+    # Mejores oraciones hasta agotar el presupuesto (las que no caben se saltan);
+    # las que no comparten nada con la consulta no entran aunque sobre presupuesto
+    selected, used = set(), 0
+    for i in np.argsort(-scores, kind="stable"):
+        if scores[i] <= 0:
+            break
+        tokens = count_tokens(texts[i])
+        if used + tokens > token_budget:
+            continue
+        selected.add(int(i))
+        used += tokens
+
+    paragraphs: List[List[str]] = []
+    last_doc: Optional[int] = None
+    for i, (doc_index, _, sentence) in enumerate(sentences):
+        if i not in selected:
+            continue
+        if doc_index != last_doc:
+            paragraphs.append([])
+            last_doc = doc_index
+        paragraphs[-1].append(sentence)
+    context = "\n\n".join(" ".join(p) for p in paragraphs)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        original = sum(count_tokens(doc.page_content) for doc in docs)
+        logger.debug("contexto comprimido: %d -> %d tokens (%d/%d oraciones)", original, used, len(selected), len(texts))
+    return context
@@ -0,0 +1,306 @@
+"""
+Embedding backends and index/model compatibility checks.
+
+``EMBEDDING_BACKEND`` selects how queries and chunks are embedded:
+
+- ``openai`` (default): ``OpenAIEmbeddings()``, one network round trip per
+  query. ``OPENAI_EMBEDDING_MODEL`` selects the model. With a
+  text-embedding-3 model, ``EMBEDDING_DIMENSIONS`` asks the API for
+  shorter vectors.
+- ``onnx``: local sentence encoder on CPU through onnxruntime
+  (``pip install onnxruntime tokenizers``). ``ONNX_MODEL_DIR`` must contain
+  ``model.onnx`` (or ``model_quantized.onnx``) and ``tokenizer.json``, e.g.
+  an export of all-MiniLM-L6-v2. The session and tokenizer are loaded once
+  per directory and reused. Concurrent queries are grouped by a
+  ``BatchedEmbeddings`` micro-batcher into a single inference call.
+- ``offline``: hashed bag-of-words stand-in (also selected by
+  ``AGENT_OFFLINE=1``).
+
+Every index records the id of the model that built it
+(``embedding_model.json`` next to the FAISS files, or collection metadata
+in Chroma). Opening an index with a different model raises an error instead
+of returning meaningless neighbours.
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+logger = logging.getLogger(__name__)
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+EMBEDDING_BACKENDS = ("openai", "onnx", "offline")
+MODEL_RECORD_FILE = "embedding_model.json"
+
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+# Dimensiones pedidas al proveedor (0 = las del modelo); solo modelos text-embedding-3
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+ONNX_MAX_LENGTH = int(os.getenv("ONNX_MAX_LENGTH", "256"))
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+# Ventana de micro-batching de consultas concurrentes (0 = deshabilitado)
+ONNX_QUERY_BATCH_WINDOW_MS = float(os.getenv("ONNX_QUERY_BATCH_WINDOW_MS", "2"))
+
+# Embeddings de consultas en cache (LRU por texto exacto; 0 = sin cache)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "0"))
+
+# Índices sin registro (p. ej. los creados por el notebook 05-rag.ipynb)
+LEGACY_MODEL_ID = "openai:text-embedding-ada-002"
+
+
+def default_backend() -> str:
+    from agents.offline import OFFLINE
+    return os.getenv("EMBEDDING_BACKEND", "offline" if OFFLINE else "openai")
+
+
+# ====================================================================================
+# ONNX Encoder
+# ====================================================================================
+
+# Sesión y tokenizer por directorio de modelo (se cargan una sola vez)
+_onnx_cache: Dict[str, tuple] = {}
+_onnx_lock = threading.Lock()
+
+
+def _load_onnx(model_dir: str, threads: int):
+    try:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+    except ImportError:
+        raise ImportError("❌ El backend onnx requiere onnxruntime y tokenizers: pip install onnxruntime tokenizers")
+
+    key = f"{os.path.abspath(model_dir)}:{threads}"
+    with _onnx_lock:
+        if key in _onnx_cache:
+            return _onnx_cache[key]
+
+        model_file = next(
+            (os.path.join(model_dir, name) for name in ("model_quantized.onnx", "model.onnx")
+             if os.path.exists(os.path.join(model_dir, name))),
+            None,
+        )
+        tokenizer_file = os.path.join(model_dir, "tokenizer.json")
+        if model_file is None or not os.path.exists(tokenizer_file):
+            raise FileNotFoundError(
+                f"❌ Modelo ONNX no encontrado en '{model_dir}'\n"
+                "Define ONNX_MODEL_DIR con un directorio que contenga model.onnx y tokenizer.json."
+            )
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(model_file, sess_options=options, providers=["CPUExecutionProvider"])
+
+        tokenizer = Tokenizer.from_file(tokenizer_file)
+        tokenizer.enable_truncation(max_length=ONNX_MAX_LENGTH)
+        tokenizer.enable_padding()
+
+        _onnx_cache[key] = (session, tokenizer, os.path.basename(model_file))
+        return _onnx_cache[key]
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence encoder local con onnxruntime (mean pooling + normalización L2).
+
+    Args:
+        model_dir: Directorio con model.onnx y tokenizer.json
+        threads: Hilos de inferencia (intra-op)
+        batch_size: Textos por llamada a la sesión
+    """
+
+    def __init__(self, model_dir: str = None, threads: int = ONNX_THREADS, batch_size: int = ONNX_BATCH_SIZE):
+        self.model_dir = model_dir or ONNX_MODEL_DIR
+        self.batch_size = batch_size
+        self.session, self.tokenizer, model_file = _load_onnx(self.model_dir, threads)
+        self.model_id = f"onnx:{os.path.basename(os.path.normpath(self.model_dir))}/{model_file}"
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._inputs:
+            feed["token_type_ids"] = np.zeros_like(ids)
+        hidden = self.session.run(None, feed)[0]
+
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Lotes de longitud parecida: menos padding por llamada
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            positions = order[start:start + self.batch_size]
+            encoded = self._encode([texts[i] for i in positions])
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+            vectors[positions] = encoded
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+# ====================================================================================
+# Query Cache
+# ====================================================================================
+
+class CachedEmbeddings(Embeddings):
+    """
+    Cache LRU de embeddings de consultas.
+
+    ``embed_query`` devuelve el vector guardado si el texto ya se vio;
+    ``embed_documents`` va siempre al modelo. Los vectores se guardan como
+    arrays float32 (~6 KB por consulta a 1536 dimensiones, frente a ~50 KB
+    como lista de floats de Python).
+
+    Args:
+        embeddings: Modelo de embeddings a envolver
+        max_size: Consultas guardadas
+    """
+
+    def __init__(self, embeddings: Embeddings, max_size: int = EMBEDDING_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return vector.tolist()
+            self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self._cache[text] = np.asarray(vector, dtype=np.float32)
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+# ====================================================================================
+# Factory
+# ====================================================================================
+
+def create_embeddings(backend: Optional[str] = None) -> Embeddings:
+    """
+    Crea el modelo de embeddings del backend configurado.
+
+    Args:
+        backend: "openai", "onnx" u "offline" (por defecto EMBEDDING_BACKEND)
+
+    Returns:
+        Modelo de embeddings de LangChain
+
+    Raises:
+        ValueError: Si el backend no es válido, o si se piden menos
+            dimensiones a un modelo de OpenAI que no lo admite
+    """
+    backend = backend or default_backend()
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        if not EMBEDDING_DIMENSIONS:
+            return OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL)
+        if not OPENAI_EMBEDDING_MODEL.startswith("text-embedding-3"):
+            raise ValueError(
+                f"❌ {OPENAI_EMBEDDING_MODEL} no admite EMBEDDING_DIMENSIONS\n"
+                "Usa un modelo text-embedding-3 o una reducción PCA (python -m retrieval.reduction)."
+            )
+        return OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS)
+    if backend == "offline":
+        from agents.offline import OfflineEmbeddings
+        return OfflineEmbeddings()
+    if backend == "onnx":
+        embeddings = OnnxEmbeddings()
+        if ONNX_QUERY_BATCH_WINDOW_MS > 0:
+            from agents.support.utils.batching import BatchedEmbeddings
+            return BatchedEmbeddings(embeddings, window_ms=ONNX_QUERY_BATCH_WINDOW_MS, max_batch=ONNX_BATCH_SIZE)
+        return embeddings
+    raise ValueError(f"Backend de embeddings desconocido: {backend!r} (usa uno de {EMBEDDING_BACKENDS})")
+
+
+def embedding_model_id(embeddings: Embeddings) -> str:
+    """Id estable del modelo de embeddings ("openai:text-embedding-3-small", "onnx:...")."""
+    inner = getattr(embeddings, "embeddings", None)
+    if isinstance(inner, Embeddings):
+        return embedding_model_id(inner)
+    if getattr(embeddings, "model_id", None):
+        return embeddings.model_id
+    if type(embeddings).__name__ == "OfflineEmbeddings":
+        return f"offline:hash-{embeddings.size}"
+    model = getattr(embeddings, "model", None)
+    if type(embeddings).__name__ == "OpenAIEmbeddings":
+        dimensions = getattr(embeddings, "dimensions", None)
+        return f"openai:{model}@{dimensions}" if dimensions else f"openai:{model}"
+    return f"{type(embeddings).__name__}:{model}" if model else type(embeddings).__name__
+
+
+# ====================================================================================
+# Index Records
+# ====================================================================================
+
+def record_embedding_model(directory: str, embeddings: Embeddings, dimension: int):
+    """Guarda en directory/embedding_model.json el modelo que construyó el índice."""
+    with open(os.path.join(directory, MODEL_RECORD_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model_id": embedding_model_id(embeddings), "dimension": int(dimension)}, f)
+
+
+def check_embedding_model(directory: str, embeddings: Embeddings, recorded: Optional[str] = None):
+    """
+    Rechaza consultar un índice con un modelo distinto del que lo construyó.
+
+    Args:
+        directory: Directorio del índice (lee embedding_model.json)
+        embeddings: Modelo con el que se van a hacer las consultas
+        recorded: Id registrado (si viene de otra fuente, p. ej. Chroma)
+
+    Raises:
+        ValueError: Si el modelo no coincide
+    """
+    if recorded is None:
+        path = os.path.join(directory, MODEL_RECORD_FILE)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                recorded = json.load(f)["model_id"]
+        else:
+            recorded = LEGACY_MODEL_ID
+            logger.warning("índice sin %s en %s: se asume %s", MODEL_RECORD_FILE, directory, LEGACY_MODEL_ID)
+
+    current = embedding_model_id(embeddings)
+    if recorded != current:
+        raise ValueError(
+            f"❌ El índice en {directory} fue construido con '{recorded}' pero se consulta con '{current}'\n"
+            "Reconstruye el índice con el mismo modelo o cambia EMBEDDING_BACKEND."
+        )
@@ -0,0 +1,335 @@
+"""
+Retrieval quality vs. latency evaluation over the bundled papers.
+
+A fixed set of labeled questions (``eval_questions.json``: question ->
+source PDF + relevant pages) is run against every combination of:
+
+- chunk size / overlap (the agent uses 1000/200)
+- index type: ``flat`` (exact), ``hnsw``, ``binary`` and ``int8``
+  (two-stage quantized search)
+- retrieval mode: ``dense``, ``hybrid`` (dense + BM25 fused with reciprocal
+  rank fusion) and ``rerank`` (dense candidates reordered by BM25)
+- k (the agent uses ``DEFAULT_RETRIEVER_K = 3``)
+
+Each row reports recall@k and MRR@k at the page level, index size (what a
+search keeps in memory, and the total on disk, which for the quantized
+indexes includes the float32 rescoring vectors), build time and per-query
+latency. Rows on the Pareto frontier (no other row has
+better or equal recall, latency and k at once) are marked with ``*``.
+
+It runs with the offline embeddings by default, so no API key is needed:
+    python -m retrieval.evaluation
+    python -m retrieval.evaluation --chunks 500:100 1000:200 --k 1 3 5 --json results.json
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import statistics
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(__file__), "eval_questions.json")
+
+DEFAULT_CHUNKS = [(500, 100), (1000, 200), (1500, 300)]
+DEFAULT_KS = [1, 3, 5, 10]
+INDEX_TYPES = ("flat", "hnsw", "binary", "int8")
+MODES = ("dense", "hybrid", "rerank")
+
+CANDIDATE_DEPTH = 20  # candidatos densos/léxicos para hybrid y rerank
+RRF_K = 60
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# ====================================================================================
+# Corpus
+# ====================================================================================
+
+def load_questions(path: str = QUESTIONS_FILE) -> List[dict]:
+    """Carga las preguntas etiquetadas {question, source, pages}."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def chunk_corpus(pdfs: Sequence[str], chunk_size: int, chunk_overlap: int) -> Tuple[List[str], List[Tuple[str, int]]]:
+    """
+    Divide los PDFs en chunks con el mismo splitter que la ingesta.
+
+    Returns:
+        Tupla (textos, (nombre de archivo, página) de cada chunk)
+    """
+    from ingestion.pipeline import _page_count, parse_and_chunk
+
+    texts, locations = [], []
+    for path in pdfs:
+        for text, metadata in parse_and_chunk(path, 0, _page_count(path), chunk_size, chunk_overlap):
+            texts.append(text)
+            locations.append((os.path.basename(metadata["source"]), metadata["page"]))
+    return texts, locations
+
+
+class BM25Index:
+    """Índice BM25 precomputado sobre los chunks (term -> frecuencias por chunk)."""
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        tokenized = [_WORD_RE.findall(t.lower()) for t in texts]
+        lengths = np.array([len(t) for t in tokenized], dtype=np.float32)
+        self.norm = k1 * (1 - b + b * lengths / max(1.0, lengths.mean()))
+        self.k1 = k1
+        self.tf: Dict[str, Dict[int, int]] = {}
+        for i, tokens in enumerate(tokenized):
+            for term, count in Counter(tokens).items():
+                self.tf.setdefault(term, {})[i] = count
+        n = len(texts)
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.tf.items()}
+        self.size = n
+
+    def scores(self, query: str, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """Puntuación BM25 de todos los chunks (o solo de ``ids``)."""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(_WORD_RE.findall(query.lower())):
+            postings = self.tf.get(term)
+            if not postings:
+                continue
+            docs = np.fromiter(postings.keys(), dtype=np.int64)
+            tf = np.fromiter(postings.values(), dtype=np.float32)
+            scores[docs] += self.idf[term] * tf * (self.k1 + 1) / (tf + self.norm[docs])
+        return scores if ids is None else scores[ids]
+
+
+# ====================================================================================
+# Indexes
+# ====================================================================================
+
+def build_searcher(kind: str, vectorstore, directory: str):
+    """
+    Construye el índice ``kind`` sobre los vectores del vectorstore.
+
+    Los índices cuantizados recorren en memoria solo los códigos, pero
+    guardan también los float32 de rescoring: por eso se devuelven los dos
+    tamaños.
+
+    Returns:
+        Tupla (search(vector, depth) -> ids, bytes residentes, bytes en disco)
+    """
+    import faiss
+
+    from .quantized import QUANTIZED_DIR, QuantizedIndex
+
+    index = vectorstore.index
+    if kind == "flat":
+        size = index.ntotal * index.d * 4
+        return (lambda vector, depth: index.search(vector.reshape(1, -1), depth)[1][0]), size, size
+    if kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(index.d, HNSW_M)
+        hnsw.add(index.reconstruct_n(0, index.ntotal))
+        hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+        size = len(faiss.serialize_index(hnsw))
+        return (lambda vector, depth: hnsw.search(vector.reshape(1, -1), depth)[1][0]), size, size
+    if kind in ("binary", "int8"):
+        quantized = QuantizedIndex.build(vectorstore, directory, kind)
+        out = os.path.join(directory, QUANTIZED_DIR)
+        disk = sum(os.path.getsize(os.path.join(out, name)) for name in os.listdir(out))
+        return (lambda vector, depth: quantized.search(vector, depth)[1]), quantized.resident_bytes(), disk
+    raise ValueError(f"Tipo de índice desconocido: {kind!r} (usa uno de {INDEX_TYPES})")
+
+
+def retrieve(mode: str, search, bm25: BM25Index, vector: np.ndarray, question: str, k: int) -> List[int]:
+    """Ids de los k mejores chunks según el modo de recuperación."""
+    if mode == "dense":
+        return [int(i) for i in search(vector, k) if i >= 0]
+
+    depth = max(CANDIDATE_DEPTH, k)
+    dense = [int(i) for i in search(vector, depth) if i >= 0]
+    if mode == "rerank":
+        lexical = bm25.scores(question, np.array(dense, dtype=np.int64))
+        order = np.argsort(-lexical, kind="stable")
+        return [dense[i] for i in order[:k]]
+    if mode == "hybrid":
+        lexical = np.argsort(-bm25.scores(question), kind="stable")[:depth]
+        fused: Dict[int, float] = {}
+        for ranking in (dense, lexical):
+            for rank, chunk in enumerate(ranking):
+                fused[int(chunk)] = fused.get(int(chunk), 0.0) + 1.0 / (RRF_K + rank + 1)
+        return sorted(fused, key=fused.get, reverse=True)[:k]
+    raise ValueError(f"Modo desconocido: {mode!r} (usa uno de {MODES})")
+
+
+# ====================================================================================
+# Evaluation
+# ====================================================================================
+
+def _page_metrics(ranked: List[int], locations, question: dict) -> Tuple[float, float]:
+    relevant = {(question["source"], page) for page in question["pages"]}
+    found, reciprocal = set(), 0.0
+    for rank, chunk in enumerate(ranked):
+        location = locations[chunk]
+        if location in relevant:
+            found.add(location)
+            if not reciprocal:
+                reciprocal = 1.0 / (rank + 1)
+    return len(found) / len(relevant), reciprocal
+
+
+def evaluate(
+    pdfs: Sequence[str],
+    questions: Sequence[dict],
+    embeddings,
+    chunks: Sequence[Tuple[int, int]] = DEFAULT_CHUNKS,
+    ks: Sequence[int] = DEFAULT_KS,
+    index_types: Sequence[str] = INDEX_TYPES,
+    modes: Sequence[str] = MODES,
+) -> List[dict]:
+    """
+    Ejecuta el barrido completo.
+
+    Args:
+        pdfs: PDFs del corpus
+        questions: Preguntas etiquetadas
+        embeddings: Modelo de embeddings (p. ej. OfflineEmbeddings)
+        chunks: Pares (chunk_size, chunk_overlap)
+        ks: Valores de k
+        index_types: Tipos de índice
+        modes: Modos de recuperación
+
+    Returns:
+        Una fila por combinación con sus métricas
+    """
+    from .stores import faiss_from_embeddings
+
+    rows = []
+    for chunk_size, chunk_overlap in chunks:
+        started = time.perf_counter()
+        texts, locations = chunk_corpus(pdfs, chunk_size, chunk_overlap)
+        vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+        vectorstore = faiss_from_embeddings(texts, vectors, [{} for _ in texts], embeddings)
+        bm25 = BM25Index(texts)
+        base_build = time.perf_counter() - started
+
+        for kind in index_types:
+            # Los índices cuantizados leen sus archivos en cada consulta: el
+            # directorio se borra al terminar las combinaciones de ese índice
+            with tempfile.TemporaryDirectory(prefix=f"eval-{kind}-") as directory:
+                started = time.perf_counter()
+                search, size, disk = build_searcher(kind, vectorstore, directory)
+                build = base_build + time.perf_counter() - started
+
+                for mode in modes:
+                    for k in ks:
+                        recalls, reciprocals, latencies = [], [], []
+                        for question in questions:
+                            query_started = time.perf_counter()
+                            vector = np.array(embeddings.embed_query(question["question"]), dtype=np.float32)
+                            ranked = retrieve(mode, search, bm25, vector, question["question"], k)
+                            latencies.append((time.perf_counter() - query_started) * 1000)
+                            recall, reciprocal = _page_metrics(ranked, locations, question)
+                            recalls.append(recall)
+                            reciprocals.append(reciprocal)
+
+                        latencies.sort()
+                        rows.append({
+                            "chunk_size": chunk_size,
+                            "overlap": chunk_overlap,
+                            "index": kind,
+                            "mode": mode,
+                            "k": k,
+                            "chunks": len(texts),
+                            "recall": statistics.mean(recalls),
+                            "mrr": statistics.mean(reciprocals),
+                            "latency_ms": statistics.mean(latencies),
+                            "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+                            "index_bytes": size,
+                            "disk_bytes": disk,
+                            "build_s": build,
+                        })
+    mark_pareto(rows)
+    return rows
+
+
+def mark_pareto(rows: List[dict]):
+    """Marca rows[i]["pareto"]: ninguna otra fila es mejor o igual en recall, latencia y k."""
+    for row in rows:
+        row["pareto"] = not any(
+            other["recall"] >= row["recall"]
+            and other["latency_ms"] <= row["latency_ms"]
+            and other["k"] <= row["k"]
+            and (other["recall"], -other["latency_ms"], -other["k"]) != (row["recall"], -row["latency_ms"], -row["k"])
+            for other in rows
+        )
+
+
+def format_table(rows: List[dict], only_pareto: bool = False) -> str:
+    """Tabla de texto ordenada por recall (desc) y latencia (asc)."""
+    header = f"{'':1} {'chunk':>5} {'ovl':>4} {'index':<6} {'mode':<6} {'k':>2} {'recall':>6} {'mrr':>5} {'ms':>7} {'p95':>7} {'KB':>8} {'disk KB':>8} {'build s':>7}"
+    lines = [header, "-" * len(header)]
+    for row in sorted(rows, key=lambda r: (-r["recall"], r["latency_ms"])):
+        if only_pareto and not row["pareto"]:
+            continue
+        lines.append(
+            f"{'*' if row['pareto'] else ' ':1} {row['chunk_size']:>5} {row['overlap']:>4} {row['index']:<6} {row['mode']:<6} "
+            f"{row['k']:>2} {row['recall']:>6.3f} {row['mrr']:>5.3f} {row['latency_ms']:>7.3f} {row['p95_ms']:>7.3f} "
+            f"{row['index_bytes'] / 1024:>8.1f} {row['disk_bytes'] / 1024:>8.1f} {row['build_s']:>7.2f}"
+        )
+    return "\n".join(lines)
+
+
+# ====================================================================================
+# CLI
+# ====================================================================================
+
+def _chunk_pair(value: str) -> Tuple[int, int]:
+    size, _, overlap = value.partition(":")
+    return int(size), int(overlap or 0)
+
+
+def main(argv: Optional[List[str]] = None):
+    from ingestion.pipeline import discover_pdfs
+
+    parser = argparse.ArgumentParser(description="Evaluación de calidad vs. latencia del retrieval")
+    parser.add_argument("--chunks", nargs="+", type=_chunk_pair, default=DEFAULT_CHUNKS, help="chunk_size:overlap")
+    parser.add_argument("--k", nargs="+", type=int, default=DEFAULT_KS)
+    parser.add_argument("--indexes", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--embeddings", choices=("offline", "openai"), default="offline")
+    parser.add_argument("--questions", default=QUESTIONS_FILE)
+    parser.add_argument("--pareto", action="store_true", help="Mostrar solo la frontera de Pareto")
+    parser.add_argument("--json", help="Guardar las filas en JSON")
+    args = parser.parse_args(argv)
+
+    if args.embeddings == "openai":
+        from dotenv import load_dotenv
+        from langchain_openai import OpenAIEmbeddings
+        load_dotenv()
+        embeddings = OpenAIEmbeddings()
+    else:
+        from agents.offline import OfflineEmbeddings
+        embeddings = OfflineEmbeddings(latency_ms=0)
+
+    pdfs = discover_pdfs()
+    if not pdfs:
+        raise FileNotFoundError("❌ No se encontraron los PDFs del corpus de evaluación")
+
+    rows = evaluate(pdfs, load_questions(args.questions), embeddings, args.chunks, args.k, args.indexes, args.modes)
+    print(format_table(rows, only_pareto=args.pareto))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"✅ Resultados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Metadata-filtered search for FAISS vector stores.
+
+``AttributeIndex`` precomputes, for every vector id in the FAISS index, the
+chunk's source, page and section, and keeps one bitmap per source and per
+section. A filter is turned into a bitmap of allowed ids and handed to FAISS
+as an ``IDSelectorBitmap``, so the restriction is applied inside the search
+instead of over-fetching and discarding results afterwards. Deleted vectors
+(tombstones, see ``retrieval.mutable``) are excluded the same way.
+
+The attribute index is stored next to the FAISS files as ``attributes.npz``.
+
+Indexes built outside ``ingestion.pipeline`` (the notebooks, the offline
+store) have no ``section`` metadata. For those, the sections are inferred
+from the numbered headings found in the chunk texts, in page order.
+"""
+
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+ATTRIBUTES_FILE = "attributes.npz"
+NO_PAGE = -1
+
+# Encabezados numerados de sección ("3.2.1 Scaled Dot-Product Attention")
+SECTION_RE = re.compile(r"(?m)^(\d+(?:\.\d+)*)\s+([A-Z][A-Za-z\- ]{2,60})\s*$")
+
+
+def match_values(values: Iterable[str], wanted: str) -> List[str]:
+    """Valores que contienen `wanted`, sin distinguir mayúsculas ("Paper.pdf", "attention")."""
+    wanted = wanted.lower()
+    return [value for value in values if wanted in value.lower()]
+
+
+def infer_sections(docs: List[Optional[Document]]) -> List[str]:
+    """
+    Deduce la sección de cada chunk a partir de los encabezados de su texto.
+
+    Recorre los chunks de cada source en orden de página (y de start_index si
+    lo tienen): un chunk que empieza con un encabezado pertenece a esa
+    sección; si no, a la del último encabezado visto antes.
+
+    Args:
+        docs: Documents en orden de id de FAISS (None si falta)
+
+    Returns:
+        Sección de cada posición ("" antes del primer encabezado)
+    """
+    def order(position: int) -> tuple:
+        metadata = docs[position].metadata
+        page = metadata.get("page")
+        return (
+            str(metadata.get("source", "")),
+            page if isinstance(page, int) else NO_PAGE,
+            metadata.get("start_index", 0),
+            position,
+        )
+
+    sections = [""] * len(docs)
+    current: Dict[str, str] = {}
+    for position in sorted((i for i, doc in enumerate(docs) if doc is not None), key=order):
+        doc = docs[position]
+        source = str(doc.metadata.get("source", ""))
+        headings = [(m.start(), " ".join(m.group(0).split())) for m in SECTION_RE.finditer(doc.page_content)]
+        if headings and not doc.page_content[:headings[0][0]].strip():
+            current[source] = headings[0][1]
+        sections[position] = current.get(source, "")
+        if headings:
+            current[source] = headings[-1][1]
+    return sections
+
+
+# ====================================================================================
+# Attribute Index
+# ====================================================================================
+
+class AttributeIndex:
+    """
+    Índice de atributos por id de vector de FAISS.
+
+    Args:
+        sources: Source de cada vector (mismo orden que el índice FAISS)
+        pages: Página de cada vector (NO_PAGE si no tiene)
+        sections: Sección de cada vector ("" si no tiene)
+    """
+
+    def __init__(self, sources: List[str], pages: np.ndarray, sections: List[str]):
+        self.size = len(sources)
+        self.pages = np.asarray(pages, dtype=np.int32)
+        self.source_bitmaps = self._bitmaps(sources)
+        self.section_bitmaps = self._bitmaps(sections)
+
+    @staticmethod
+    def _bitmaps(values: List[str]) -> Dict[str, np.ndarray]:
+        codes: Dict[str, int] = {}
+        encoded = np.fromiter((codes.setdefault(v, len(codes)) for v in values), dtype=np.int32, count=len(values))
+        return {value: encoded == code for value, code in codes.items() if value}
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "AttributeIndex":
+        """Construye el índice recorriendo el docstore en orden de id de FAISS."""
+        count = vectorstore.index.ntotal
+        sources, sections = [""] * count, [""] * count
+        pages = np.full(count, NO_PAGE, dtype=np.int32)
+        docs: List[Optional[Document]] = [None] * count
+        for position, doc_id in vectorstore.index_to_docstore_id.items():
+            doc = vectorstore.docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                continue
+            docs[position] = doc
+            sources[position] = str(doc.metadata.get("source", ""))
+            sections[position] = str(doc.metadata.get("section", ""))
+            page = doc.metadata.get("page")
+            if isinstance(page, int):
+                pages[position] = page
+        # Índice sin metadata de sección: se deduce del texto
+        if not any(doc is not None and "section" in doc.metadata for doc in docs):
+            sections = infer_sections(docs)
+        return cls(sources, pages, sections)
+
+    def save(self, directory: str):
+        """Guarda los bitmaps en directory/attributes.npz."""
+        arrays = {"pages": self.pages}
+        for prefix, bitmaps in (("source", self.source_bitmaps), ("section", self.section_bitmaps)):
+            names = list(bitmaps)
+            arrays[f"{prefix}_names"] = np.array(names, dtype=object)
+            arrays[f"{prefix}_bits"] = np.array([np.packbits(bitmaps[n]) for n in names]).reshape(len(names), (self.size + 7) // 8)
+        np.savez_compressed(os.path.join(directory, ATTRIBUTES_FILE), **arrays)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["AttributeIndex"]:
+        """Carga directory/attributes.npz, o None si no existe."""
+        path = os.path.join(directory, ATTRIBUTES_FILE)
+        if not os.path.exists(path):
+            return None
+        data = np.load(path, allow_pickle=True)
+        index = cls.__new__(cls)
+        index.pages = data["pages"]
+        index.size = len(index.pages)
+        for prefix in ("source", "section"):
+            names = list(data[f"{prefix}_names"])
+            bits = data[f"{prefix}_bits"]
+            bitmaps = {name: np.unpackbits(bits[i])[: index.size].astype(bool) for i, name in enumerate(names)}
+            setattr(index, f"{prefix}_bitmaps", bitmaps)
+        return index
+
+    def _match(self, bitmaps: Dict[str, np.ndarray], wanted: str) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        for value in match_values(bitmaps, wanted):
+            mask |= bitmaps[value]
+        return mask
+
+    def mask(
+        self,
+        source: Optional[str] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None,
+        section: Optional[str] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Calcula los ids permitidos por el filtro.
+
+        Returns:
+            Máscara booleana por id, o None si no hay filtro
+        """
+        if source is None and page_from is None and page_to is None and section is None:
+            return None
+        mask = np.ones(self.size, dtype=bool)
+        if source is not None:
+            mask &= self._match(self.source_bitmaps, source)
+        if section is not None:
+            mask &= self._match(self.section_bitmaps, section)
+        if page_from is not None:
+            mask &= self.pages >= page_from
+        if page_to is not None:
+            mask &= (self.pages <= page_to) & (self.pages != NO_PAGE)
+        return mask
+
+
+# ====================================================================================
+# Filtered Search
+# ====================================================================================
+
+def _search_params(index, mask: np.ndarray):
+    import faiss
+
+    bits = np.packbits(mask, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bits))
+    if faiss.try_extract_index_ivf(index) is not None:
+        params = faiss.SearchParametersIVF(sel=selector)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    # El selector apunta a `bits`: hay que mantenerlo vivo durante la búsqueda
+    return params, bits
+
+
+def filtered_search(
+    vectorstore,
+    attributes: AttributeIndex,
+    query: str,
+    k: int,
+    deleted: Optional[np.ndarray] = None,
+    **filters,
+) -> List[Tuple[Document, float]]:
+    """
+    Búsqueda por similitud restringida a los chunks que cumplen el filtro.
+
+    Args:
+        vectorstore: Vectorstore FAISS de LangChain
+        attributes: Índice de atributos del mismo vectorstore
+        query: Consulta
+        k: Número de resultados
+        deleted: Máscara de vectores borrados (tombstones), opcional
+        **filters: source, page_from, page_to, section
+
+    Returns:
+        Lista de (Document, distancia)
+    """
+    import faiss
+
+    mask = attributes.mask(**filters)
+    if deleted is not None:
+        mask = ~deleted if mask is None else mask & ~deleted
+    if mask is None:
+        return vectorstore.similarity_search_with_score(query, k=k)
+    if not mask.any():
+        return []
+
+    vector = np.array([vectorstore.embedding_function.embed_query(query)], dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(vector)
+    params, _bits = _search_params(vectorstore.index, mask)
+    distances, ids = vectorstore.index.search(vector, k, params=params)
+
+    results = []
+    for distance, position in zip(distances[0], ids[0]):
+        if position == -1:
+            continue
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(position)])
+        if isinstance(doc, Document):
+            results.append((doc, float(distance)))
+    return results
@@ -0,0 +1,414 @@
+"""
+Deletes, updates and compaction for FAISS indexes without full rebuilds.
+
+A document is identified by the ``source`` metadata of its chunks (the PDF
+path written by the ingestion pipeline, or just its file name if that is
+unique). ``MutableIndex`` works like this:
+
+- ``delete(document_id)`` marks the document's vector ids in a tombstone
+  bitmap (``tombstones.npz``). Searches pass the live ids to FAISS as an
+  ``IDSelectorBitmap``, the same way ``filtered_search`` applies filters.
+- ``update(document_id, documents)`` tombstones the old chunks and appends
+  the new ones. Only the new chunks are embedded.
+- When the share of tombstoned vectors reaches ``INDEX_COMPACTION_THRESHOLD``,
+  a background thread rebuilds the index from the live vectors. It reuses
+  the stored vectors, so nothing is embedded again. Writers wait while a
+  compaction runs.
+
+Updates and compactions never rewrite the files of the live index. The new
+version is written to a sibling staging directory, renamed to
+``<index>.v<n>`` and published by atomically replacing the ``<index>``
+symlink. The first such write turns a plain index directory into that
+symlink. Searches keep using the old snapshot until the swap, and the
+previous version stays on disk until the next one.
+
+Usage:
+    python -m retrieval.mutable stats ../faiss_cache/transformer_paper
+    python -m retrieval.mutable delete ../faiss_cache/transformer_paper paper1.pdf
+    python -m retrieval.mutable update ../faiss_cache/transformer_paper ../pdfs/paper1.pdf
+    python -m retrieval.mutable compact ../faiss_cache/transformer_paper
+"""
+
+import argparse
+import glob
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .embeddings import record_embedding_model
+from .filters import AttributeIndex
+from .reduction import record_reduction
+
+
+logger = logging.getLogger(__name__)
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+TOMBSTONES_FILE = "tombstones.npz"
+# Fracción de vectores borrados a partir de la cual se compacta en segundo plano
+COMPACTION_THRESHOLD = float(os.getenv("INDEX_COMPACTION_THRESHOLD", "0.2"))
+
+
+# ====================================================================================
+# Tombstones
+# ====================================================================================
+
+def load_tombstones(directory: Optional[str], size: int) -> np.ndarray:
+    """
+    Carga el bitmap de borrados de directory/tombstones.npz.
+
+    Returns:
+        Máscara booleana por id de vector (todo False si no hay archivo o si
+        corresponde a otra versión del índice)
+    """
+    path = os.path.join(directory, TOMBSTONES_FILE) if directory else None
+    if path is None or not os.path.exists(path):
+        return np.zeros(size, dtype=bool)
+    data = np.load(path)
+    if int(data["size"]) != size:
+        logger.warning("%s no corresponde al índice (%d != %d vectores): se ignora", path, int(data["size"]), size)
+        return np.zeros(size, dtype=bool)
+    return np.unpackbits(data["bits"])[:size].astype(bool)
+
+
+def save_tombstones(directory: str, deleted: np.ndarray):
+    """Guarda el bitmap de borrados (escritura atómica con os.replace)."""
+    path = os.path.join(directory, TOMBSTONES_FILE)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, bits=np.packbits(deleted), size=np.int64(len(deleted)))
+    os.replace(tmp_path, path)
+
+
+# ====================================================================================
+# Mutable Index
+# ====================================================================================
+
+class MutableIndex:
+    """
+    Índice FAISS con borrado lógico, actualización por documento y compactación.
+
+    Las búsquedas leen ``snapshot()`` sin bloquear: cada escritura publica una
+    tupla nueva (vectorstore, atributos, borrados) en una sola asignación.
+
+    Args:
+        vectorstore: Vectorstore FAISS de LangChain
+        directory: Directorio del índice (None = solo en memoria)
+        attributes: Índice de atributos del vectorstore (se construye si falta)
+        threshold: Fracción de borrados que dispara la compactación
+            (0 = sin compactación automática)
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        directory: Optional[str] = None,
+        attributes: Optional[AttributeIndex] = None,
+        threshold: float = COMPACTION_THRESHOLD,
+    ):
+        if attributes is None or attributes.size != vectorstore.index.ntotal:
+            attributes = AttributeIndex.from_vectorstore(vectorstore)
+        self.directory = directory
+        self.threshold = threshold
+        self.compactions = 0
+        # Aumenta con cada escritura publicada (invalida caches de resultados)
+        self.version = 0
+        self._snapshot = (vectorstore, attributes, load_tombstones(directory, vectorstore.index.ntotal))
+        self._write_lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+        self._listeners: List[Callable] = []
+
+    def snapshot(self) -> Tuple[object, AttributeIndex, np.ndarray]:
+        """Devuelve (vectorstore, atributos, borrados) consistentes entre sí."""
+        return self._snapshot
+
+    @property
+    def vectorstore(self):
+        return self._snapshot[0]
+
+    def deleted_mask(self) -> Optional[np.ndarray]:
+        """Máscara de vectores borrados, o None si no hay ninguno."""
+        deleted = self._snapshot[2]
+        return deleted if deleted.any() else None
+
+    def deleted_fraction(self) -> float:
+        deleted = self._snapshot[2]
+        return float(deleted.mean()) if deleted.size else 0.0
+
+    def on_swap(self, listener: Callable):
+        """Registra una función a llamar cada vez que cambia el vectorstore."""
+        self._listeners.append(listener)
+
+    def _publish(self, vectorstore, attributes: AttributeIndex, deleted: np.ndarray):
+        changed = vectorstore is not self._snapshot[0] or len(deleted) != len(self._snapshot[2])
+        self._snapshot = (vectorstore, attributes, deleted)
+        self.version += 1
+        if changed:
+            for listener in self._listeners:
+                listener(vectorstore)
+
+    # ------------------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------------------
+
+    def _document_mask(self, attributes: AttributeIndex, document_id: str) -> np.ndarray:
+        bitmap = attributes.source_bitmaps.get(document_id)
+        if bitmap is not None:
+            return bitmap
+        # Por nombre de archivo ("paper1.pdf"), solo si no es ambiguo
+        matches = [s for s in attributes.source_bitmaps if os.path.basename(s) == document_id]
+        if len(matches) > 1:
+            raise ValueError(f"❌ '{document_id}' es ambiguo: {matches}. Usa la ruta completa.")
+        if matches:
+            return attributes.source_bitmaps[matches[0]]
+        return np.zeros(attributes.size, dtype=bool)
+
+    def delete(self, document_id: str) -> int:
+        """
+        Borra lógicamente todos los chunks de un documento.
+
+        Args:
+            document_id: Source del documento (ruta o nombre de archivo)
+
+        Returns:
+            Número de vectores marcados como borrados
+        """
+        with self._write_lock:
+            vectorstore, attributes, deleted = self._snapshot
+            removed = self._document_mask(attributes, document_id) & ~deleted
+            count = int(removed.sum())
+            if count:
+                deleted = deleted | removed
+                if self.directory:
+                    save_tombstones(self.directory, deleted)
+                self._publish(vectorstore, attributes, deleted)
+                logger.info("%s: %d vectores borrados (%.1f%% del índice)", document_id, count, 100 * deleted.mean())
+        self.maybe_compact()
+        return count
+
+    def update(self, document_id: str, documents: List[Document]) -> int:
+        """
+        Reemplaza los chunks de un documento por los nuevos.
+
+        Los chunks anteriores quedan como tombstones; solo se calculan los
+        embeddings de los nuevos. La copia del índice con los chunks nuevos se
+        construye y se escribe fuera del lock; si mientras tanto otra
+        actualización o una compactación cambió el vectorstore, se rehace
+        sobre el nuevo.
+
+        Args:
+            document_id: Source del documento a reemplazar
+            documents: Chunks nuevos (su metadata source identifica al documento)
+
+        Returns:
+            Número de chunks añadidos
+        """
+        vectors = np.empty((0, 0), dtype=np.float32)
+        if documents:
+            vectors = np.asarray(
+                self.vectorstore.embedding_function.embed_documents([d.page_content for d in documents]),
+                dtype=np.float32,
+            )
+        while True:
+            base, attributes, _ = self._snapshot
+            vectorstore, staging = base, None
+            if documents:
+                # El índice nuevo es una copia (las búsquedas en curso no la ven)
+                vectorstore = _rebuild(base, np.arange(base.index.ntotal))
+                vectorstore.add_embeddings(
+                    list(zip([d.page_content for d in documents], vectors.tolist())),
+                    metadatas=[d.metadata for d in documents],
+                )
+                attributes = AttributeIndex.from_vectorstore(vectorstore)
+                if self.directory:
+                    staging = self._stage(vectorstore, attributes)
+            with self._write_lock:
+                current, current_attributes, deleted = self._snapshot
+                if current is not base:
+                    if staging:
+                        shutil.rmtree(staging, ignore_errors=True)
+                    continue
+                # Los borrados publicados mientras tanto se conservan
+                deleted = deleted | self._document_mask(current_attributes, document_id)
+                if documents:
+                    deleted = np.concatenate([deleted, np.zeros(len(documents), dtype=bool)])
+                if staging:
+                    save_tombstones(staging, deleted)
+                    self._swap_directory(staging)
+                elif self.directory:
+                    save_tombstones(self.directory, deleted)
+                self._publish(vectorstore, attributes, deleted)
+                break
+        self.maybe_compact()
+        return len(documents)
+
+    # ------------------------------------------------------------------------------
+    # Versions on Disk
+    # ------------------------------------------------------------------------------
+
+    def _stage(self, vectorstore, attributes: AttributeIndex) -> str:
+        """Escribe una versión nueva del índice en un directorio hermano y devuelve su ruta."""
+        directory = os.path.abspath(self.directory)
+        staging = tempfile.mkdtemp(prefix=f"{os.path.basename(directory)}.staging-", dir=os.path.dirname(directory))
+        vectorstore.save_local(staging)
+        attributes.save(staging)
+        # Sin reduction.npz un índice reducido (modelo "...+pca32") no se puede volver a abrir
+        record_reduction(staging, vectorstore.embedding_function)
+        record_embedding_model(staging, vectorstore.embedding_function, vectorstore.index.d)
+        return staging
+
+    def _swap_directory(self, staging: str):
+        # El directorio del índice es un symlink a la versión actual (<dir>.v<n>): se cambia de
+        # versión con un solo rename del symlink, así que la ruta siempre existe. Los archivos de
+        # la versión anterior no se reescriben (pueden estar mapeados en memoria); se borra en la
+        # siguiente escritura.
+        directory = os.path.abspath(self.directory)
+        name, parent = os.path.basename(directory), os.path.dirname(directory)
+        version = os.path.join(parent, f"{name}.v{time.time_ns()}")
+        os.rename(staging, version)
+
+        previous = os.path.join(parent, os.readlink(directory)) if os.path.islink(directory) else None
+        link = os.path.join(parent, f"{name}.link")
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.basename(version), link)
+        if not os.path.islink(directory):
+            # Índice sin versiones (la primera escritura lo convierte): único momento sin ruta
+            previous = os.path.join(parent, f"{name}.v0")
+            os.rename(directory, previous)
+        os.replace(link, directory)
+
+        for path in glob.glob(os.path.join(parent, glob.escape(name) + ".v*")):
+            if path not in (version, previous):
+                shutil.rmtree(path, ignore_errors=True)
+
+    # ------------------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------------------
+
+    def maybe_compact(self) -> bool:
+        """
+        Lanza la compactación en segundo plano si se superó el umbral.
+
+        Returns:
+            True si se lanzó una compactación
+        """
+        if self.threshold <= 0 or self.deleted_fraction() < self.threshold:
+            return False
+        if self._compactor is not None and self._compactor.is_alive():
+            return False
+        self._compactor = threading.Thread(target=self._compact_in_background, name="index-compactor", daemon=True)
+        self._compactor.start()
+        return True
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception("falló la compactación del índice en %s", self.directory)
+
+    def wait_for_compaction(self, timeout: Optional[float] = None):
+        """Espera a que termine la compactación en curso (si hay alguna)."""
+        if self._compactor is not None:
+            self._compactor.join(timeout)
+
+    def compact(self) -> dict:
+        """
+        Reconstruye el índice solo con los vectores vivos y lo intercambia.
+
+        Returns:
+            Diccionario con before, after y seconds
+        """
+        with self._write_lock:
+            started = time.perf_counter()
+            vectorstore, _, deleted = self._snapshot
+            compacted = _rebuild(vectorstore, np.flatnonzero(~deleted))
+            attributes = AttributeIndex.from_vectorstore(compacted)
+            remaining = np.zeros(compacted.index.ntotal, dtype=bool)
+
+            if self.directory:
+                # Los artefactos derivados (p. ej. quantized/) no se copian: se reconstruyen al cargar
+                staging = self._stage(compacted, attributes)
+                save_tombstones(staging, remaining)
+                self._swap_directory(staging)
+            self._publish(compacted, attributes, remaining)
+            self.compactions += 1
+
+        stats = {"before": len(deleted), "after": len(remaining), "seconds": time.perf_counter() - started}
+        logger.info("índice compactado: %(before)d -> %(after)d vectores en %(seconds).2fs", stats)
+        return stats
+
+
+def _rebuild(vectorstore, positions: np.ndarray):
+    """Copia del vectorstore con solo los vectores de ``positions`` (sin recalcular embeddings)."""
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    index = faiss.clone_index(vectorstore.index)
+    index.reset()
+    if positions.size:
+        index.add(vectorstore.index.reconstruct_batch(positions.astype(np.int64)))
+    ids = [vectorstore.index_to_docstore_id[int(i)] for i in positions]
+    docstore = InMemoryDocstore({doc_id: vectorstore.docstore.search(doc_id) for doc_id in ids})
+    return FAISS(
+        vectorstore.embedding_function, index, docstore, dict(enumerate(ids)),
+        normalize_L2=vectorstore._normalize_L2,
+        distance_strategy=vectorstore.distance_strategy,
+    )
+
+
+# ====================================================================================
+# CLI
+# ====================================================================================
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Borrado, actualización y compactación de un índice FAISS")
+    parser.add_argument("command", choices=("stats", "delete", "update", "compact"))
+    parser.add_argument("index", help="Directorio del índice FAISS")
+    parser.add_argument("document", nargs="?", help="Documento a borrar, o PDF con la nueva versión")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from .embeddings import create_embeddings
+    from .stores import load_faiss
+
+    load_dotenv()
+    mutable = MutableIndex(
+        load_faiss(args.index, create_embeddings()),
+        args.index,
+        AttributeIndex.load(args.index),
+        threshold=0,
+    )
+
+    if args.command in ("delete", "update") and not args.document:
+        parser.error(f"{args.command} requiere un documento")
+    if args.command == "delete":
+        print(f"🗑️  {mutable.delete(args.document)} chunks borrados de {args.document}")
+    elif args.command == "update":
+        from ingestion.pipeline import iter_chunks
+        path = os.path.abspath(args.document)
+        documents = list(iter_chunks([path], workers=1))
+        existing = path if path in mutable.snapshot()[1].source_bitmaps else os.path.basename(path)
+        print(f"🔄 {mutable.update(existing, documents)} chunks nuevos para {path}")
+    elif args.command == "compact":
+        stats = mutable.compact()
+        print(f"✅ Compactado: {stats['before']} -> {stats['after']} vectores en {stats['seconds']:.2f}s")
+
+    _, attributes, deleted = mutable.snapshot()
+    print(f"   vectores: {len(deleted)}  borrados: {int(deleted.sum())} ({mutable.deleted_fraction():.1%})")
+    for source, bitmap in sorted(attributes.source_bitmaps.items()):
+        print(f"   {source}: {int((bitmap & ~deleted).sum())} chunks vivos")
+
+
+if __name__ == "__main__":
+    main()
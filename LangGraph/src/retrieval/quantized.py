@@ -0,0 +1,349 @@
+"""
+Two-stage quantized search for FAISS vector stores.
+
+Stage one scans a compact copy of the embeddings and keeps the best
+``k * rescore`` candidates:
+
+- ``binary``: 1 bit per dimension (sign after mean-centering), Hamming
+  distance with popcount (``faiss.IndexBinaryFlat``), 32x smaller.
+- ``int8``: 8-bit scalar quantization (``faiss.IndexScalarQuantizer``),
+  4x smaller.
+
+Stage two rescores the candidates against the full float32 vectors, read
+from an ``np.memmap`` file so only the touched rows are paged in.
+
+Files live in ``<index_dir>/quantized/``.
+
+Usage:
+    python -m retrieval.quantized build ../faiss_cache/transformer_paper --mode binary
+    python -m retrieval.quantized report ../faiss_cache/transformer_paper --k 3
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+QUANTIZED_DIR = "quantized"
+MODES = ("binary", "int8")
+DEFAULT_RESCORE = 10
+
+
+# ====================================================================================
+# Quantized Index
+# ====================================================================================
+
+class QuantizedIndex:
+    """
+    Índice cuantizado (etapa 1) + vectores float32 en memmap (etapa 2).
+
+    Usa ``build()`` o ``load()`` para crearlo.
+    """
+
+    def __init__(self, mode: str, codes, vectors: np.ndarray, metric: str, center: Optional[np.ndarray] = None):
+        self.mode = mode
+        self.codes = codes
+        self.vectors = vectors
+        self.metric = metric
+        self.center = center
+
+    @property
+    def ntotal(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    @classmethod
+    def build(cls, vectorstore, directory: str, mode: str = "binary") -> "QuantizedIndex":
+        """
+        Cuantiza los vectores de un vectorstore FAISS plano y los guarda.
+
+        Args:
+            vectorstore: Vectorstore FAISS de LangChain (índice plano)
+            directory: Directorio del índice (se escribe en directory/quantized)
+            mode: "binary" o "int8"
+
+        Returns:
+            QuantizedIndex listo para buscar
+        """
+        import faiss
+
+        if mode not in MODES:
+            raise ValueError(f"Modo desconocido: {mode!r} (usa uno de {MODES})")
+        # Se escribe en un directorio nuevo y se mueve a su sitio: los archivos de la versión
+        # anterior pueden estar mapeados en memoria por búsquedas en curso
+        os.makedirs(directory, exist_ok=True)
+        out = tempfile.mkdtemp(prefix=f"{QUANTIZED_DIR}.building-", dir=directory)
+
+        index = vectorstore.index
+        floats = index.reconstruct_n(0, index.ntotal).astype(np.float32)
+        metric = "ip" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+        vectors = np.memmap(os.path.join(out, "vectors.f32"), dtype=np.float32, mode="w+", shape=floats.shape)
+        vectors[:] = floats
+        vectors.flush()
+
+        center = None
+        if mode == "binary":
+            center = floats.mean(axis=0)
+            codes = faiss.IndexBinaryFlat(_padded_bits(floats.shape[1]))
+            codes.add(_binarize(floats, center))
+            faiss.write_index_binary(codes, os.path.join(out, "codes.faissb"))
+            np.save(os.path.join(out, "center.npy"), center)
+        else:
+            faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+            codes = faiss.IndexScalarQuantizer(floats.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss_metric)
+            codes.train(floats)
+            codes.add(floats)
+            faiss.write_index(codes, os.path.join(out, "codes.faiss"))
+
+        with open(os.path.join(out, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"mode": mode, "metric": metric, "ntotal": int(floats.shape[0]), "dim": int(floats.shape[1])}, f)
+
+        del vectors
+        target = os.path.join(directory, QUANTIZED_DIR)
+        retired = None
+        if os.path.exists(target):
+            retired = tempfile.mkdtemp(prefix=f"{QUANTIZED_DIR}.retired-", dir=directory)
+            os.rename(target, os.path.join(retired, QUANTIZED_DIR))
+        os.rename(out, target)
+        if retired:
+            shutil.rmtree(retired, ignore_errors=True)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["QuantizedIndex"]:
+        """Carga directory/quantized, o None si no existe."""
+        import faiss
+
+        out = os.path.join(directory, QUANTIZED_DIR)
+        meta_path = os.path.join(out, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+
+        # Los float32 quedan en disco; el SO carga solo las filas que se leen
+        vectors = np.memmap(
+            os.path.join(out, "vectors.f32"), dtype=np.float32, mode="r",
+            shape=(meta["ntotal"], meta["dim"]),
+        )
+        if meta["mode"] == "binary":
+            codes = faiss.read_index_binary(os.path.join(out, "codes.faissb"))
+            center = np.load(os.path.join(out, "center.npy"))
+        else:
+            codes = faiss.read_index(os.path.join(out, "codes.faiss"))
+            center = None
+        return cls(meta["mode"], codes, vectors, meta["metric"], center)
+
+    def resident_bytes(self) -> int:
+        """Bytes de la etapa 1 (lo que se recorre en cada búsqueda)."""
+        if self.mode == "binary":
+            return self.ntotal * self.codes.code_size
+        return self.ntotal * self.codes.sa_code_size()
+
+    def float_bytes(self) -> int:
+        return self.ntotal * self.dim * 4
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        rescore: int = DEFAULT_RESCORE,
+        deleted: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Búsqueda en dos etapas.
+
+        Args:
+            query: Vector de consulta (d,) float32, ya normalizado si aplica
+            k: Resultados finales
+            rescore: Candidatos de la etapa 1 por cada resultado final
+            deleted: Máscara de vectores borrados (tombstones), opcional
+
+        Returns:
+            Tupla (distancias o scores, ids) ordenada de mejor a peor
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        candidates = max(k, k * rescore)
+        if deleted is not None:
+            # Se piden de más para que queden k * rescore candidatos vivos
+            candidates += int(deleted.sum())
+        candidates = min(self.ntotal, candidates)
+
+        if self.mode == "binary":
+            _, ids = self.codes.search(_binarize(query, self.center), candidates)
+        else:
+            _, ids = self.codes.search(query, candidates)
+        ids = ids[0][ids[0] >= 0]
+        if deleted is not None:
+            ids = ids[~deleted[ids]]
+        if ids.size == 0:
+            return np.empty(0, dtype=np.float32), ids
+
+        # Etapa 2: solo se leen del memmap las filas candidatas (ordenadas para leer secuencial)
+        ids = np.sort(ids)
+        rows = np.asarray(self.vectors[ids])
+        if self.metric == "ip":
+            scores = rows @ query[0]
+            order = np.argsort(-scores)[:k]
+        else:
+            scores = ((rows - query[0]) ** 2).sum(axis=1)
+            order = np.argsort(scores)[:k]
+        return scores[order], ids[order]
+
+
+def _padded_bits(dim: int) -> int:
+    return (dim + 7) // 8 * 8
+
+
+def _binarize(vectors: np.ndarray, center: np.ndarray) -> np.ndarray:
+    bits = (vectors - center) > 0
+    pad = _padded_bits(vectors.shape[1]) - vectors.shape[1]
+    if pad:
+        bits = np.pad(bits, ((0, 0), (0, pad)))
+    return np.packbits(bits, axis=1)
+
+
+# ====================================================================================
+# Search on a Vector Store
+# ====================================================================================
+
+def _query_vector(vectorstore, query: str) -> np.ndarray:
+    import faiss
+
+    vector = np.array([vectorstore.embedding_function.embed_query(query)], dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(vector)
+    return vector[0]
+
+
+def quantized_search(
+    vectorstore,
+    qindex: QuantizedIndex,
+    query: str,
+    k: int,
+    rescore: int = DEFAULT_RESCORE,
+    deleted: Optional[np.ndarray] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Búsqueda en dos etapas devolviendo Documents del docstore del vectorstore.
+
+    Returns:
+        Lista de (Document, distancia o score)
+    """
+    scores, ids = qindex.search(_query_vector(vectorstore, query), k, rescore, deleted)
+    results = []
+    for score, position in zip(scores, ids):
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(position)])
+        if isinstance(doc, Document):
+            results.append((doc, float(score)))
+    return results
+
+
+# ====================================================================================
+# Recall Report
+# ====================================================================================
+
+def recall_report(vectorstore, qindex: QuantizedIndex, queries: Sequence[str], k: int = 3, rescore: int = DEFAULT_RESCORE) -> dict:
+    """
+    Compara la búsqueda en dos etapas con el índice plano original.
+
+    Args:
+        vectorstore: Vectorstore FAISS (índice plano de referencia)
+        qindex: Índice cuantizado del mismo vectorstore
+        queries: Consultas de prueba
+        k: Resultados por consulta
+        rescore: Candidatos de la etapa 1 por resultado
+
+    Returns:
+        Diccionario con recall@k, latencias medias y memoria
+    """
+    vectors = [_query_vector(vectorstore, q) for q in queries]
+    hits, flat_ms, quantized_ms = 0, 0.0, 0.0
+    for vector in vectors:
+        started = time.perf_counter()
+        _, expected = vectorstore.index.search(vector.reshape(1, -1), k)
+        flat_ms += (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        _, found = qindex.search(vector, k, rescore)
+        quantized_ms += (time.perf_counter() - started) * 1000
+
+        expected = set(int(i) for i in expected[0] if i >= 0)
+        hits += len(expected & set(int(i) for i in found))
+
+    n = max(1, len(vectors))
+    return {
+        "mode": qindex.mode,
+        "queries": len(vectors),
+        "k": k,
+        "rescore": rescore,
+        f"recall@{k}": hits / (n * k),
+        "flat_ms": flat_ms / n,
+        "two_stage_ms": quantized_ms / n,
+        "float_bytes": qindex.float_bytes(),
+        "stage1_bytes": qindex.resident_bytes(),
+        "compression": qindex.float_bytes() / max(1, qindex.resident_bytes()),
+    }
+
+
+# ====================================================================================
+# CLI
+# ====================================================================================
+
+DEFAULT_QUERIES = [
+    "What is multi-head attention?",
+    "How does positional encoding work?",
+    "BLEU score on WMT 2014 English-to-German",
+    "scaled dot-product attention",
+    "encoder and decoder stacks",
+    "training schedule and optimizer",
+    "label smoothing and dropout",
+    "complexity of self-attention layers",
+]
+
+
+def main(argv: Optional[List[str]] = None):
+    from dotenv import load_dotenv
+    from .embeddings import create_embeddings
+    from .stores import load_faiss
+
+    parser = argparse.ArgumentParser(description="Índice cuantizado en dos etapas")
+    parser.add_argument("command", choices=("build", "report"))
+    parser.add_argument("directory", help="Directorio del índice FAISS")
+    parser.add_argument("--mode", choices=MODES, default="binary")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rescore", type=int, default=DEFAULT_RESCORE)
+    args = parser.parse_args(argv)
+
+    # La misma ruta (relativa al directorio actual) para leer el índice y escribir quantized/
+    load_dotenv()
+    directory = os.path.abspath(args.directory)
+    vectorstore = load_faiss(directory, create_embeddings())
+    if args.command == "build":
+        qindex = QuantizedIndex.build(vectorstore, directory, args.mode)
+        print(f"✅ Índice {args.mode} guardado en {os.path.join(directory, QUANTIZED_DIR)}")
+    else:
+        qindex = QuantizedIndex.load(directory) or QuantizedIndex.build(vectorstore, directory, args.mode)
+
+    report = recall_report(vectorstore, qindex, DEFAULT_QUERIES, k=args.k, rescore=args.rescore)
+    for key, value in report.items():
+        print(f"   {key}: {value:.3f}" if isinstance(value, float) else f"   {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
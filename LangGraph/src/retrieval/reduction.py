@@ -0,0 +1,395 @@
+"""
+Embedding dimensionality reduction for FAISS indexes.
+
+A flat index stores ``dim`` float32 values per chunk, and brute-force
+search reads all of them for every query. Three ways to store fewer:
+
+- Provider-side: text-embedding-3 models return shorter vectors directly
+  (``EMBEDDING_DIMENSIONS``, see ``retrieval.embeddings``). Nothing else
+  is stored.
+- ``truncate``: keep the first ``dim`` components and re-normalize. This
+  is client-side Matryoshka truncation, for models trained to support it
+  (text-embedding-3, nomic, ...). Other models lose more recall.
+- ``pca``: a projection fitted on the index vectors. Its mean and
+  components are saved in ``<index>/reduction.npz`` and applied to every
+  query.
+
+``reduce_vectorstore`` rewrites an existing index at the target dimension
+from the vectors already in the FAISS index, without calling the
+embedding model again. ``load_faiss`` applies the saved reduction to
+queries automatically. The recorded model id gains a suffix (e.g.
+``+pca256``), so opening the index without the reduction is refused.
+
+Usage:
+    python -m retrieval.reduction report ../faiss_cache/transformer_paper --dims 768 384 192 --k 3
+    python -m retrieval.reduction apply ../faiss_cache/transformer_paper --method pca --dim 384 \\
+        --out ../faiss_cache/transformer_paper_pca384
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .embeddings import embedding_model_id, record_embedding_model
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+METHODS = ("pca", "truncate")
+REDUCTION_FILE = "reduction.npz"
+# Registros que siguen siendo válidos tras reducir (mismas posiciones y documentos)
+CARRIED_FILES = ("attributes.npz", "tombstones.npz")
+
+
+# ====================================================================================
+# Reducer
+# ====================================================================================
+
+class DimensionReducer:
+    """
+    Proyección de embeddings a menos dimensiones.
+
+    Args:
+        method: "pca" o "truncate"
+        dim: Dimensiones de salida
+        source_dim: Dimensiones de entrada
+        mean: Media de los vectores (solo pca)
+        components: Matriz (dim, source_dim) de componentes principales (solo pca)
+        explained_variance: Fracción de la varianza conservada (solo pca)
+    """
+
+    def __init__(
+        self,
+        method: str,
+        dim: int,
+        source_dim: int,
+        mean: Optional[np.ndarray] = None,
+        components: Optional[np.ndarray] = None,
+        explained_variance: Optional[float] = None,
+    ):
+        if method not in METHODS:
+            raise ValueError(f"Método de reducción desconocido: {method!r} (usa uno de {METHODS})")
+        self.method = method
+        self.dim = dim
+        self.source_dim = source_dim
+        self.mean = mean
+        self.components = components
+        self.explained_variance = explained_variance
+
+    @property
+    def suffix(self) -> str:
+        return f"+{self.method}{self.dim}"
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, method: str, dim: int) -> "DimensionReducer":
+        """
+        Ajusta la reducción a los vectores del índice.
+
+        Args:
+            vectors: Matriz (n, source_dim)
+            method: "pca" o "truncate"
+            dim: Dimensiones de salida
+
+        Returns:
+            DimensionReducer
+
+        Raises:
+            ValueError: Si dim no es menor que las dimensiones de entrada (o, con
+                pca, mayor que el número de vectores)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n, source_dim = vectors.shape
+        if not 0 < dim < source_dim:
+            raise ValueError(f"❌ La dimensión reducida debe estar entre 1 y {source_dim - 1} (se pidió {dim})")
+        if method == "truncate":
+            return cls(method, dim, source_dim)
+        if dim > n:
+            raise ValueError(f"❌ PCA a {dim} dimensiones necesita al menos {dim} vectores (hay {n})")
+
+        mean = vectors.mean(axis=0)
+        centered = (vectors - mean).astype(np.float64)
+        # Covarianza (source_dim x source_dim): no depende del número de chunks
+        eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered)
+        order = np.argsort(eigenvalues)[::-1][:dim]
+        total = float(eigenvalues.sum())
+        explained = float(eigenvalues[order].sum() / total) if total > 0 else 1.0
+        components = eigenvectors[:, order].T.astype(np.float32)
+        return cls(method, dim, source_dim, mean.astype(np.float32), components, explained)
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """Proyecta una matriz (n, source_dim) a (n, dim) float32."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[-1] != self.source_dim:
+            raise ValueError(f"❌ Se esperaban vectores de {self.source_dim} dimensiones (llegaron {vectors.shape[-1]})")
+        if self.method == "pca":
+            # Sin renormalizar: la proyección conserva las distancias L2 en el subespacio
+            return np.ascontiguousarray((vectors - self.mean) @ self.components.T, dtype=np.float32)
+        # Matryoshka: el prefijo se renormaliza, como hace el proveedor
+        truncated = np.ascontiguousarray(vectors[..., :self.dim], dtype=np.float32)
+        norms = np.linalg.norm(truncated, axis=-1, keepdims=True)
+        return truncated / np.where(norms > 0, norms, 1.0)
+
+    def save(self, directory: str):
+        """Guarda la reducción en directory/reduction.npz."""
+        arrays = {"method": np.array(self.method), "dim": np.array(self.dim), "source_dim": np.array(self.source_dim)}
+        if self.method == "pca":
+            arrays.update(mean=self.mean, components=self.components, explained_variance=np.array(self.explained_variance))
+        np.savez(os.path.join(directory, REDUCTION_FILE), **arrays)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["DimensionReducer"]:
+        """Carga directory/reduction.npz, o None si el índice no está reducido."""
+        path = os.path.join(directory, REDUCTION_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            method = str(data["method"])
+            if method == "pca":
+                return cls(
+                    method, int(data["dim"]), int(data["source_dim"]),
+                    data["mean"], data["components"], float(data["explained_variance"]),
+                )
+            return cls(method, int(data["dim"]), int(data["source_dim"]))
+
+
+class ReducedEmbeddings(Embeddings):
+    """
+    Modelo de embeddings seguido de una reducción de dimensiones.
+
+    Args:
+        base: Modelo de embeddings de dimensión completa
+        reducer: Reducción a aplicar a documentos y consultas
+    """
+
+    def __init__(self, base: Embeddings, reducer: DimensionReducer):
+        self.base = base
+        self.reducer = reducer
+
+    @property
+    def model_id(self) -> str:
+        return embedding_model_id(self.base) + self.reducer.suffix
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.reducer.transform(np.array(self.base.embed_documents(texts), dtype=np.float32)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.reducer.transform(np.array(self.base.embed_query(text), dtype=np.float32)).tolist()
+
+
+def parse_reduction(spec: str) -> tuple:
+    """
+    Interpreta una opción "método:dim" de la línea de comandos ("pca:256", "truncate:512").
+
+    Raises:
+        ValueError: Si el formato o el método no son válidos
+    """
+    method, _, dim = spec.partition(":")
+    if method not in METHODS or not dim.isdigit():
+        raise ValueError(f"❌ Reducción inválida {spec!r}: usa pca:DIM o truncate:DIM")
+    return method, int(dim)
+
+
+def with_reduction(directory: str, embeddings: Embeddings) -> Embeddings:
+    """Envuelve las embeddings con la reducción guardada en el índice (si la hay)."""
+    reducer = DimensionReducer.load(directory)
+    if reducer is None or isinstance(embeddings, ReducedEmbeddings):
+        return embeddings
+    return ReducedEmbeddings(embeddings, reducer)
+
+
+def record_reduction(directory: str, embeddings: Embeddings):
+    """Guarda la reducción de un vectorstore reducido junto a sus archivos (no hace nada si no lo está)."""
+    # La reducción puede estar debajo de la cache o del batching de consultas
+    while not isinstance(embeddings, ReducedEmbeddings):
+        embeddings = getattr(embeddings, "embeddings", None)
+        if not isinstance(embeddings, Embeddings):
+            return
+    embeddings.reducer.save(directory)
+
+
+# ====================================================================================
+# Reduce a Vector Store
+# ====================================================================================
+
+def _flat_index(vectors: np.ndarray, metric: int):
+    import faiss
+
+    index = faiss.IndexFlatIP(vectors.shape[1]) if metric == faiss.METRIC_INNER_PRODUCT else faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+
+def reduce_vectorstore(vectorstore, method: str, dim: int):
+    """
+    Copia del vectorstore FAISS con los vectores reducidos a `dim` dimensiones.
+
+    Los vectores se reconstruyen del índice (no se vuelve a llamar al modelo)
+    y las posiciones y documentos no cambian.
+
+    Args:
+        vectorstore: Vectorstore FAISS de dimensión completa
+        method: "pca" o "truncate"
+        dim: Dimensiones de salida
+
+    Returns:
+        Vectorstore FAISS reducido (su embedding_function es ReducedEmbeddings)
+
+    Raises:
+        ValueError: Si el vectorstore ya está reducido o dim no es válida
+    """
+    from langchain_community.vectorstores import FAISS
+
+    if isinstance(vectorstore.embedding_function, ReducedEmbeddings):
+        raise ValueError("❌ El índice ya está reducido: reduce desde el índice de dimensión completa")
+    index = vectorstore.index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    reducer = DimensionReducer.fit(vectors, method, dim)
+    return FAISS(
+        ReducedEmbeddings(vectorstore.embedding_function, reducer),
+        _flat_index(reducer.transform(vectors), index.metric_type),
+        vectorstore.docstore,
+        dict(vectorstore.index_to_docstore_id),
+        normalize_L2=vectorstore._normalize_L2,
+        distance_strategy=vectorstore.distance_strategy,
+    )
+
+
+def save_reduced(vectorstore, source: str, out: str):
+    """Guarda un vectorstore reducido con los registros del índice de origen que siguen valiendo."""
+    vectorstore.save_local(out)
+    record_reduction(out, vectorstore.embedding_function)
+    record_embedding_model(out, vectorstore.embedding_function, vectorstore.index.d)
+    for name in CARRIED_FILES:
+        if os.path.exists(os.path.join(source, name)):
+            shutil.copy2(os.path.join(source, name), os.path.join(out, name))
+
+
+# ====================================================================================
+# Report
+# ====================================================================================
+
+def reduction_report(
+    vectorstore,
+    queries: Sequence[str],
+    dims: Sequence[int],
+    methods: Sequence[str] = METHODS,
+    k: int = 3,
+    rounds: int = 20,
+) -> List[dict]:
+    """
+    Recall@k (frente a la búsqueda exacta en dimensión completa), latencia y memoria por dimensión.
+
+    Args:
+        vectorstore: Vectorstore FAISS de dimensión completa
+        queries: Consultas de prueba
+        dims: Dimensiones a evaluar
+        methods: Métodos a evaluar
+        k: Resultados por consulta
+        rounds: Repeticiones de cada búsqueda para medir la latencia
+
+    Returns:
+        Filas con method, dim, recall, latency_ms, index_bytes y explained_variance
+    """
+    index = vectorstore.index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    full_queries = np.array(vectorstore.embedding_function.embed_documents(list(queries)), dtype=np.float32)
+    _, expected = index.search(full_queries, k)
+
+    def measure(search_index, query_vectors) -> tuple:
+        latencies = []
+        for vector in query_vectors:
+            started = time.perf_counter()
+            for _ in range(rounds):
+                search_index.search(vector.reshape(1, -1), k)
+            latencies.append((time.perf_counter() - started) * 1000 / rounds)
+        _, found = search_index.search(query_vectors, k)
+        hits = sum(len(set(e[e >= 0]) & set(f[f >= 0])) for e, f in zip(expected, found))
+        return hits / (len(query_vectors) * k), statistics.mean(latencies)
+
+    recall, latency = measure(index, full_queries)
+    rows = [{
+        "method": "full", "dim": index.d, "recall": recall, "latency_ms": latency,
+        "index_bytes": index.ntotal * index.d * 4, "explained_variance": 1.0,
+    }]
+    for method in methods:
+        for dim in dims:
+            try:
+                reducer = DimensionReducer.fit(vectors, method, dim)
+            except ValueError as exc:
+                rows.append({"method": method, "dim": dim, "skipped": str(exc)})
+                continue
+            reduced = _flat_index(reducer.transform(vectors), index.metric_type)
+            recall, latency = measure(reduced, reducer.transform(full_queries))
+            rows.append({
+                "method": method, "dim": dim, "recall": recall, "latency_ms": latency,
+                "index_bytes": index.ntotal * dim * 4, "explained_variance": reducer.explained_variance,
+            })
+    return rows
+
+
+def format_report(rows: List[dict], k: int) -> str:
+    """Tabla de texto del reporte."""
+    full_bytes = rows[0]["index_bytes"]
+    header = f"{'method':<8} {'dim':>5} {f'recall@{k}':>9} {'ms':>8} {'MB':>8} {'memory':>7} {'variance':>8}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        if "skipped" in row:
+            lines.append(f"{row['method']:<8} {row['dim']:>5}  omitido: {row['skipped']}")
+            continue
+        variance = "" if row["explained_variance"] is None else f"{row['explained_variance']:.3f}"
+        lines.append(
+            f"{row['method']:<8} {row['dim']:>5} {row['recall']:>9.3f} {row['latency_ms']:>8.4f} "
+            f"{row['index_bytes'] / 1e6:>8.2f} {row['index_bytes'] / full_bytes:>7.1%} {variance:>8}"
+        )
+    return "\n".join(lines)
+
+
+# ====================================================================================
+# CLI
+# ====================================================================================
+
+def main(argv: Optional[List[str]] = None):
+    from .embeddings import create_embeddings
+    from .evaluation import load_questions
+    from .quantized import DEFAULT_QUERIES
+    from .stores import load_faiss
+
+    parser = argparse.ArgumentParser(description="Reducción de dimensiones de un índice FAISS")
+    parser.add_argument("command", choices=("report", "apply"))
+    parser.add_argument("directory", help="Directorio del índice FAISS de dimensión completa")
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS))
+    parser.add_argument("--dims", nargs="+", type=int, default=[768, 512, 384, 256, 128])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--method", choices=METHODS, default="pca", help="Método para apply")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensión para apply")
+    parser.add_argument("--out", help="Directorio de salida para apply")
+    args = parser.parse_args(argv)
+
+    vectorstore = load_faiss(args.directory, create_embeddings())
+    if args.command == "report":
+        queries = DEFAULT_QUERIES + [q["question"] for q in load_questions()]
+        rows = reduction_report(vectorstore, queries, args.dims, args.methods, k=args.k)
+        print(f"{vectorstore.index.ntotal} vectores, {len(queries)} consultas")
+        print(format_report(rows, args.k))
+        return
+
+    if not args.out:
+        parser.error("apply necesita --out")
+    reduced = reduce_vectorstore(vectorstore, args.method, args.dim)
+    save_reduced(reduced, args.directory, args.out)
+    print(f"✅ Índice {args.method} de {args.dim} dimensiones guardado en {args.out} "
+          f"({vectorstore.index.d} -> {args.dim}, {args.dim / vectorstore.index.d:.0%} de la memoria)")
+
+
+if __name__ == "__main__":
+    main()
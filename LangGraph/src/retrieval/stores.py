@@ -0,0 +1,450 @@
+"""
+Vector-store backends for the agents.
+
+``VECTOR_STORE_BACKEND`` selects where the chunks are stored:
+
+- ``faiss`` (default): ``index.faiss`` + ``index.pkl`` loaded with
+  ``FAISS.load_local``, or with the float index memory-mapped. Indexes
+  with a ``reduction.npz`` project the queries the same way.
+- ``chroma``: local persistent Chroma store (``pip install chromadb
+  langchain-chroma``). One ``PersistentClient`` is reused per path. The
+  sqlite file runs in WAL mode with tuned pragmas, and collections are
+  written with bulk, batched upserts of precomputed embeddings.
+
+Both backends return a LangChain vector store, so ``as_retriever()`` and
+``similarity_search_with_score()`` work the same way.
+
+Benchmark (same corpus and embeddings for both backends):
+    python -m retrieval.stores bench --offline
+"""
+
+import argparse
+import logging
+import os
+import pickle
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .embeddings import check_embedding_model, embedding_model_id
+from .filters import match_values
+from .reduction import with_reduction
+
+
+logger = logging.getLogger(__name__)
+
+
+# ====================================================================================
+# Configuration
+# ====================================================================================
+
+BACKENDS = ("faiss", "chroma")
+DEFAULT_COLLECTION = "transformer_paper"
+CHROMA_SQLITE_FILE = "chroma.sqlite3"
+CHROMA_UPSERT_BATCH = int(os.getenv("CHROMA_UPSERT_BATCH", "1000"))
+
+# Persistentes en el archivo (WAL) o aplicadas a cada conexión de Chroma que se pueda alcanzar
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",  # 64 MB
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+)
+
+# HNSW de Chroma: misma métrica que el índice FAISS (L2) y lotes grandes en la ingesta
+CHROMA_COLLECTION_METADATA = {
+    "hnsw:space": "l2",
+    "hnsw:batch_size": 1000,
+    "hnsw:sync_threshold": 10000,
+}
+
+
+# ====================================================================================
+# FAISS
+# ====================================================================================
+
+def load_faiss(path: str, embeddings, mmap: bool = False):
+    """
+    Carga un índice FAISS guardado con save_local.
+
+    Args:
+        path: Directorio con index.faiss e index.pkl
+        embeddings: Modelo de embeddings de las consultas
+        mmap: Abrir el índice con IO_FLAG_MMAP (no queda residente)
+
+    Returns:
+        Vectorstore FAISS
+
+    Raises:
+        ValueError: Si el índice se construyó con otro modelo de embeddings
+    """
+    from langchain_community.vectorstores import FAISS
+
+    # Índices reducidos: las consultas pasan por la misma proyección que los documentos
+    embeddings = with_reduction(path, embeddings)
+    check_embedding_model(path, embeddings)
+    if not mmap:
+        return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+
+    import faiss
+
+    index = faiss.read_index(
+        os.path.join(path, "index.faiss"),
+        faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+    )
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def faiss_from_embeddings(texts: List[str], vectors: np.ndarray, metadatas: List[dict], embeddings):
+    """Crea un vectorstore FAISS a partir de embeddings ya calculados."""
+    from langchain_community.vectorstores import FAISS
+
+    return FAISS.from_embeddings(list(zip(texts, vectors.tolist())), embeddings, metadatas=metadatas)
+
+
+# ====================================================================================
+# Chroma
+# ====================================================================================
+
+_chroma_clients: Dict[str, object] = {}
+_chroma_lock = threading.Lock()
+
+
+def _import_chroma():
+    try:
+        import chromadb
+    except ImportError:
+        raise ImportError("❌ El backend chroma requiere chromadb: pip install chromadb langchain-chroma")
+    try:
+        from langchain_chroma import Chroma
+    except ImportError:
+        from langchain_community.vectorstores import Chroma
+    return chromadb, Chroma
+
+
+def tune_sqlite(path: str):
+    """
+    Pasa el sqlite de Chroma a WAL (queda guardado en el archivo).
+
+    Con WAL las lecturas no se bloquean durante una ingesta y cada commit
+    escribe secuencialmente en el log en vez de reescribir páginas.
+    """
+    db_file = os.path.join(path, CHROMA_SQLITE_FILE)
+    if not os.path.exists(db_file):
+        return
+    connection = sqlite3.connect(db_file)
+    try:
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA optimize")
+    finally:
+        connection.close()
+
+
+def _apply_connection_pragmas(client):
+    """
+    Aplica SQLITE_PRAGMAS a la conexión de Chroma del hilo actual.
+
+    Las pragmas por conexión no se pueden pasar a Chroma por configuración;
+    se usa su pool interno si está disponible (si no, se omite).
+    """
+    try:
+        from chromadb.db.impl.sqlite import SqliteDB
+
+        connection = client._system.instance(SqliteDB)._conn_pool.connect()
+        for pragma in SQLITE_PRAGMAS:
+            connection.execute(pragma)
+    except Exception:
+        logger.debug("no se pudieron aplicar las pragmas de sqlite a Chroma", exc_info=True)
+
+
+def get_chroma_client(path: str):
+    """
+    Obtiene el PersistentClient de ``path`` (uno por ruta, reutilizado).
+
+    Args:
+        path: Directorio del store de Chroma
+
+    Returns:
+        chromadb.PersistentClient
+    """
+    chromadb, _ = _import_chroma()
+    path = os.path.abspath(path)
+    with _chroma_lock:
+        client = _chroma_clients.get(path)
+        if client is None:
+            os.makedirs(path, exist_ok=True)
+            client = chromadb.PersistentClient(path=path, settings=chromadb.Settings(anonymized_telemetry=False))
+            tune_sqlite(path)
+            _chroma_clients[path] = client
+    _apply_connection_pragmas(client)
+    return client
+
+
+def load_chroma(path: str, embeddings, collection: str = DEFAULT_COLLECTION):
+    """
+    Abre una colección de Chroma como vectorstore de LangChain.
+
+    Raises:
+        FileNotFoundError: Si la colección no existe o está vacía
+        ValueError: Si la colección se construyó con otro modelo de embeddings
+    """
+    _, Chroma = _import_chroma()
+    client = get_chroma_client(path)
+    names = {getattr(c, "name", c) for c in client.list_collections()}
+    if collection not in names or client.get_collection(collection).count() == 0:
+        raise FileNotFoundError(
+            f"❌ Colección '{collection}' de Chroma no encontrada en {path}\n"
+            "Por favor, ejecuta primero: python -m ingestion.pipeline --backend chroma --out <ruta>"
+        )
+    metadata = client.get_collection(collection).metadata or {}
+    check_embedding_model(path, embeddings, recorded=metadata.get("embedding_model"))
+    return Chroma(client=client, collection_name=collection, embedding_function=embeddings)
+
+
+def bulk_upsert(
+    path: str,
+    texts: List[str],
+    vectors: np.ndarray,
+    metadatas: List[dict],
+    embeddings,
+    collection: str = DEFAULT_COLLECTION,
+    batch_size: int = CHROMA_UPSERT_BATCH,
+    ids: Optional[List[str]] = None,
+):
+    """
+    Escribe chunks con embeddings ya calculados en una colección de Chroma.
+
+    Args:
+        path: Directorio del store
+        texts: Contenido de los chunks
+        vectors: Embeddings (n, d)
+        metadatas: Metadata de cada chunk
+        embeddings: Modelo de embeddings de las consultas
+        collection: Nombre de la colección
+        batch_size: Chunks por upsert (acotado por el máximo del cliente)
+        ids: Ids estables (por defecto la posición)
+
+    Returns:
+        Vectorstore Chroma de LangChain
+    """
+    _, Chroma = _import_chroma()
+    client = get_chroma_client(path)
+    target = client.get_or_create_collection(
+        collection,
+        metadata={**CHROMA_COLLECTION_METADATA, "embedding_model": embedding_model_id(embeddings)},
+    )
+    if ids is None:
+        ids = [str(i) for i in range(len(texts))]
+    max_batch = getattr(client, "get_max_batch_size", lambda: batch_size)()
+    step = max(1, min(batch_size, max_batch))
+    for start in range(0, len(texts), step):
+        end = start + step
+        target.upsert(
+            ids=ids[start:end],
+            embeddings=np.asarray(vectors[start:end], dtype=np.float32).tolist(),
+            documents=texts[start:end],
+            metadatas=[_chroma_metadata(m) for m in metadatas[start:end]],
+        )
+    return Chroma(client=client, collection_name=collection, embedding_function=embeddings)
+
+
+def _chroma_metadata(metadata: dict) -> dict:
+    # Chroma solo acepta valores escalares
+    return {k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))}
+
+
+def chroma_from_faiss(vectorstore, path: str, collection: str = DEFAULT_COLLECTION):
+    """Copia los vectores y documentos de un vectorstore FAISS a Chroma."""
+    texts, metadatas, ids = _faiss_documents(vectorstore)
+    vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+    return bulk_upsert(path, texts, vectors, metadatas, vectorstore.embedding_function, collection, ids=ids)
+
+
+def _faiss_documents(vectorstore):
+    texts, metadatas, ids = [], [], []
+    for position in range(vectorstore.index.ntotal):
+        doc_id = vectorstore.index_to_docstore_id[position]
+        doc = vectorstore.docstore.search(doc_id)
+        texts.append(doc.page_content if isinstance(doc, Document) else "")
+        metadatas.append(doc.metadata if isinstance(doc, Document) else {})
+        ids.append(str(doc_id))
+    return texts, metadatas, ids
+
+
+def chroma_metadata_values(vectorstore, keys: Sequence[str] = ("source", "section")) -> Dict[str, List[str]]:
+    """Valores distintos de source y section guardados en la colección de Chroma."""
+    values: Dict[str, set] = {key: set() for key in keys}
+    offset = 0
+    while True:
+        metadatas = vectorstore.get(include=["metadatas"], limit=CHROMA_UPSERT_BATCH, offset=offset)["metadatas"]
+        for metadata in metadatas:
+            for key in keys:
+                if (metadata or {}).get(key):
+                    values[key].add(str(metadata[key]))
+        if len(metadatas) < CHROMA_UPSERT_BATCH:
+            return {key: sorted(found) for key, found in values.items()}
+        offset += len(metadatas)
+
+
+def chroma_filter(
+    source: Optional[str] = None,
+    page_from: Optional[int] = None,
+    page_to: Optional[int] = None,
+    section: Optional[str] = None,
+    values: Optional[Dict[str, List[str]]] = None,
+) -> Optional[dict]:
+    """
+    Traduce los filtros de la tool a un ``where`` de Chroma.
+
+    Chroma solo compara por igualdad: con `values` (ver chroma_metadata_values),
+    source y section se resuelven por subcadena a los valores guardados, igual
+    que con FAISS + AttributeIndex ("Paper.pdf" encuentra la ruta absoluta).
+    Sin `values`, la comparación es exacta.
+    """
+    def clause(key: str, wanted: str) -> dict:
+        if values is None:
+            return {key: wanted}
+        # Sin coincidencias se mantiene el valor pedido: la búsqueda no devuelve nada
+        matches = match_values(values.get(key, ()), wanted) or [wanted]
+        return {key: matches[0]} if len(matches) == 1 else {key: {"$in": matches}}
+
+    clauses = []
+    if source is not None:
+        clauses.append(clause("source", source))
+    if section is not None:
+        clauses.append(clause("section", section))
+    if page_from is not None:
+        clauses.append({"page": {"$gte": page_from}})
+    if page_to is not None:
+        clauses.append({"page": {"$lte": page_to}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+# ====================================================================================
+# Backend Selection
+# ====================================================================================
+
+def open_vector_store(backend: str, path: str, embeddings, mmap: bool = False, collection: str = DEFAULT_COLLECTION):
+    """
+    Abre el vectorstore del backend indicado.
+
+    Args:
+        backend: "faiss" o "chroma"
+        path: Directorio del índice FAISS o del store de Chroma
+        embeddings: Modelo de embeddings de las consultas
+        mmap: Solo FAISS, abrir el índice mapeado en memoria
+        collection: Solo Chroma, nombre de la colección
+
+    Returns:
+        Vectorstore de LangChain
+
+    Raises:
+        ValueError: Si el backend no es válido
+    """
+    if backend == "faiss":
+        return load_faiss(path, embeddings, mmap=mmap)
+    if backend == "chroma":
+        return load_chroma(path, embeddings, collection)
+    raise ValueError(f"Backend de vectorstore desconocido: {backend!r} (usa uno de {BACKENDS})")
+
+
+# ====================================================================================
+# Benchmark
+# ====================================================================================
+
+def _latencies(store, queries: List[str], k: int, rounds: int) -> List[float]:
+    store.similarity_search_with_score(queries[0], k=k)  # warm-up
+    latencies = []
+    for _ in range(rounds):
+        for query in queries:
+            started = time.perf_counter()
+            store.similarity_search_with_score(query, k=k)
+            latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def benchmark(source_store, queries: List[str], k: int = 3, rounds: int = 5, backends=BACKENDS, directory: Optional[str] = None) -> Dict[str, dict]:
+    """
+    Compara ingesta y latencia de consulta de los backends sobre el mismo corpus.
+
+    Los embeddings se toman del vectorstore de origen, así que la ingesta
+    mide solo la escritura en el store.
+
+    Args:
+        source_store: Vectorstore FAISS con el corpus
+        queries: Consultas de prueba
+        k: Resultados por consulta
+        rounds: Repeticiones de las consultas
+        backends: Backends a medir
+        directory: Directorio de trabajo (temporal por defecto)
+
+    Returns:
+        Diccionario backend -> {chunks, ingest_s, ingest_rate, query_p50_ms, query_p95_ms}
+    """
+    directory = directory or tempfile.mkdtemp(prefix="stores-bench-")
+    texts, metadatas, ids = _faiss_documents(source_store)
+    vectors = source_store.index.reconstruct_n(0, source_store.index.ntotal)
+    embeddings = source_store.embedding_function
+
+    results = {}
+    for backend in backends:
+        started = time.perf_counter()
+        if backend == "faiss":
+            store = faiss_from_embeddings(texts, vectors, metadatas, embeddings)
+            store.save_local(os.path.join(directory, "faiss"))
+        else:
+            store = bulk_upsert(os.path.join(directory, "chroma"), texts, vectors, metadatas, embeddings, ids=ids)
+        ingest = time.perf_counter() - started
+
+        latencies = sorted(_latencies(store, queries, k, rounds))
+        results[backend] = {
+            "chunks": len(texts),
+            "ingest_s": ingest,
+            "ingest_rate": len(texts) / ingest if ingest else 0.0,
+            "query_p50_ms": statistics.median(latencies),
+            "query_p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        }
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    from retrieval.quantized import DEFAULT_QUERIES
+
+    parser = argparse.ArgumentParser(description="Benchmark de backends de vectorstore")
+    parser.add_argument("command", choices=("bench",))
+    parser.add_argument("--index", help="Índice FAISS con el corpus (por defecto el del agente)")
+    parser.add_argument("--offline", action="store_true", help="Usar el corpus y embeddings offline")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.offline:
+        from agents.offline import build_offline_vectorstore
+        source = build_offline_vectorstore()
+    else:
+        from dotenv import load_dotenv
+        from agents.support.utils.tools import resolve_cache_path
+        from .embeddings import create_embeddings
+        load_dotenv()
+        source = load_faiss(args.index or resolve_cache_path(), create_embeddings())
+
+    results = benchmark(source, DEFAULT_QUERIES, k=args.k, rounds=args.rounds, backends=args.backends)
+    for backend, stats in results.items():
+        print(f"{backend}:")
+        for key, value in stats.items():
+            print(f"   {key}: {value:.3f}" if isinstance(value, float) else f"   {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()